@@ -24,8 +24,9 @@ class CustomUserAdmin(UserAdmin):
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
-    list_display = ('name', 'description')
+    list_display = ('name', 'slug', 'course_count', 'description')
     search_fields = ('name',)
+    prepopulated_fields = {'slug': ('name',)}
 
 @admin.register(Course)
 class CourseAdmin(admin.ModelAdmin):
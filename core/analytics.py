@@ -0,0 +1,376 @@
+"""
+Daily analytics rollups.
+
+Every logged Analytics event is also counted in AnalyticsDailyRollup: one
+row per (course, type, day) with the number of events and the sum of their
+values. Dashboards aggregate those rows instead of scanning raw events, so a
+year of activity is at most courses x types x 365 rows however many events
+were logged.
+
+analytics_summary() answers the dashboard with one grouped (type x day)
+aggregate over the recent window. Totals for the closed days before it
+cannot change any more, so they are kept as a running total per scope in
+the cache under the ``analytics`` namespace (see core.caching), which
+rebuild_rollups() bumps; each day only the day that left the window is
+added.
+
+Events are not inserted one by one. log_event() adds them to a per-process
+EventBuffer, which writes them with a single bulk_create (plus their
+rollups) once ANALYTICS_BUFFER_SIZE events are waiting or the oldest is
+ANALYTICS_BUFFER_MAX_DELAY_MS old, and in any case when the request
+finishes (see core.signals), after the response has been sent. With
+ANALYTICS_SPILL_DIR set, buffered events are also appended to a spill file
+until they are written, so the replay_analytics_events command can recover
+them after a crash. Every spill file gets a new unique name and stays locked
+(flock) by its process while the process may still write it; the lock goes
+away with the process, which is how replay tells abandoned files apart from
+live ones (PIDs are reused, so they cannot). Replayed events are written at
+least once: a crash between the write and removing the file replays them
+again.
+"""
+import atexit
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .caching import bump_namespace, versioned_key
+from .models import Analytics, AnalyticsDailyRollup
+from .upsert import upsert
+
+logger = logging.getLogger(__name__)
+
+# How long the running totals of closed days are kept between dashboard views
+CLOSED_DAYS_TIMEOUT = 7 * 24 * 60 * 60
+
+# Consecutive failed flushes after which a batch is no longer requeued
+MAX_FLUSH_ATTEMPTS = 3
+
+# Fields of a buffered event kept in spill files
+SPILL_FIELDS = ('analytics_type', 'course_id', 'user_id', 'value', 'metadata', 'date_recorded')
+
+
+def record_rollups(events):
+    """
+    Count saved Analytics ``events`` in their daily rollups, with one upsert
+    per (course, type, day) however many events share it.
+    """
+    totals = defaultdict(lambda: [0, 0.0])
+    for event in events:
+        key = (event.course_id, event.analytics_type, timezone.localdate(event.date_recorded))
+        totals[key][0] += 1
+        totals[key][1] += event.value
+
+    for (course_id, analytics_type, day), (count, value_sum) in totals.items():
+        rollup = AnalyticsDailyRollup(
+            course_id=course_id, analytics_type=analytics_type, day=day, count=count, value_sum=value_sum
+        )
+        # Each row is covered by one of two partial unique indexes
+        if course_id is None:
+            upsert(rollup, unique_fields=['analytics_type', 'day'], unique_condition='"course_id" IS NULL',
+                   increment_fields=['count', 'value_sum'])
+        else:
+            upsert(rollup, unique_fields=['course', 'analytics_type', 'day'], unique_condition='"course_id" IS NOT NULL',
+                   increment_fields=['count', 'value_sum'])
+
+
+def rebuild_rollups():
+    """Recompute every rollup from the raw events. Returns the number of rows written."""
+    rows = (
+        Analytics.objects.annotate(day=TruncDate('date_recorded'))
+        .values('course_id', 'analytics_type', 'day')
+        .annotate(count=Count('id'), value_sum=Sum('value'))
+        .order_by()
+    )
+    with transaction.atomic():
+        AnalyticsDailyRollup.objects.all().delete()
+        written = len(AnalyticsDailyRollup.objects.bulk_create(
+            (AnalyticsDailyRollup(**row) for row in rows.iterator()),
+            batch_size=5_000
+        ))
+    bump_namespace('analytics')
+    return written
+
+
+def analytics_summary(course_ids=None, days=7):
+    """
+    Event counts for the given courses (None for the whole site) as
+    ``(totals, daily)``: ``totals`` maps each type to its all-time count and
+    ``daily`` maps each type to ``{day: count}`` for the last ``days`` days.
+    """
+    since = timezone.localdate() - timedelta(days=days - 1)
+    rollups = AnalyticsDailyRollup.objects.all()
+    if course_ids is not None:
+        rollups = rollups.filter(course_id__in=course_ids)
+
+    # Closed days never change: keep their totals and only add the day(s)
+    # that left the window since the cached entry was computed
+    key = versioned_key('analytics', 'closed-days', days, sorted(course_ids) if course_ids is not None else None)
+    cached = cache.get(key)
+    if cached is not None and cached[0] == since:
+        closed = cached[1]
+    else:
+        closed_rollups = rollups.filter(day__lt=since)
+        closed = Counter()
+        if cached is not None and cached[0] < since:
+            closed_rollups = closed_rollups.filter(day__gte=cached[0])
+            closed.update(cached[1])
+        closed.update(dict(
+            closed_rollups.values('analytics_type')
+            .annotate(total=Sum('count'))
+            .values_list('analytics_type', 'total')
+            .order_by()
+        ))
+        cache.set(key, (since, dict(closed)), CLOSED_DAYS_TIMEOUT)
+
+    totals = Counter(closed)
+    daily = defaultdict(dict)
+    recent = (
+        rollups.filter(day__gte=since)
+        .values('analytics_type', 'day')
+        .annotate(total=Sum('count'))
+        .values_list('analytics_type', 'day', 'total')
+        .order_by()
+    )
+    for analytics_type, day, total in recent:
+        totals[analytics_type] += total
+        daily[analytics_type][day] = total
+    return totals, daily
+
+
+def write_events(events):
+    """Insert unsaved Analytics ``events`` and count them in their rollups, in one transaction."""
+    with transaction.atomic():
+        Analytics.objects.bulk_create(events, batch_size=500)
+        record_rollups(events)
+
+
+def write_events_each(events):
+    """
+    Write ``events`` one at a time, logging and skipping those that fail (e.g.
+    because their course or user was deleted meanwhile). Returns the number
+    written.
+    """
+    written = 0
+    for event in events:
+        try:
+            write_events([event])
+        except Exception:
+            logger.exception(
+                "Dropping analytics event %s",
+                {name: getattr(event, name) for name in SPILL_FIELDS}
+            )
+        else:
+            written += 1
+    return written
+
+
+class EventBuffer:
+    """
+    Per-process queue of unsaved Analytics events, written in batches.
+    Safe to share between threads.
+
+    A batch that fails is retried event by event, and events that still
+    fail are logged and dropped. When none can be written (the database is
+    unavailable) the batch is requeued, at most MAX_FLUSH_ATTEMPTS times in a
+    row and while the queue holds fewer than ``max_queued`` events. After
+    that it is given up: left in its spill file for replay_analytics_events,
+    or dropped with an error when spilling is off.
+    """
+
+    def __init__(self, max_events=100, max_delay_ms=1000, spill_dir=None, max_queued=None):
+        self.max_events = max_events
+        self.max_delay = max_delay_ms / 1000
+        self.spill_dir = spill_dir
+        self.max_queued = max_queued or max_events * 100
+        self._lock = threading.Lock()
+        self._events = []
+        self._oldest = None
+        self._spill = None
+        self._failed_flushes = 0
+
+    def __len__(self):
+        return len(self._events)
+
+    def add(self, event):
+        """Queue ``event``, and write the queue if it is full or old enough."""
+        with self._lock:
+            if not self._events:
+                self._oldest = time.monotonic()
+            self._events.append(event)
+            if self.spill_dir:
+                self._spill_events([event])
+            due = self._is_due()
+        # Inside a transaction the batch would share its fate; wait for the request end
+        if due and not connection.in_atomic_block:
+            self.flush()
+
+    def flush(self):
+        """Write every queued event. Returns the number written."""
+        with self._lock:
+            events, self._events = self._events, []
+            # The spill file of these events stays locked until they are written
+            spilled, self._spill = self._spill, None
+        if not events:
+            return 0
+        try:
+            write_events(events)
+            written = len(events)
+        except Exception:
+            logger.exception("Writing %d analytics events failed; retrying them one by one", len(events))
+            written = write_events_each(events) if len(events) > 1 else 0
+        if written:
+            self._failed_flushes = 0
+        else:
+            self._failed_flushes += 1
+            if self._requeue(events):
+                if spilled:
+                    _remove_spill_file(*spilled)
+                return 0
+            if spilled:
+                # Unlocking hands the file over to replay_analytics_events
+                spilled[0].close()
+                logger.error("Gave up writing %d analytics events; they are kept in %s", len(events), spilled[1])
+            else:
+                logger.error("Gave up writing %d analytics events; they are lost", len(events))
+            return 0
+        if spilled:
+            _remove_spill_file(*spilled)
+        return written
+
+    def _requeue(self, events):
+        """Put a failed batch back in front of the queue (and its spill file), unless it is over a limit."""
+        with self._lock:
+            if self._failed_flushes >= MAX_FLUSH_ATTEMPTS or len(self._events) + len(events) > self.max_queued:
+                return False
+            self._events[:0] = events
+            self._oldest = time.monotonic()
+            if self.spill_dir:
+                self._spill_events(events)
+        return True
+
+    def flush_if_due(self):
+        with self._lock:
+            due = self._is_due()
+        return self.flush() if due else 0
+
+    def _is_due(self):
+        return bool(self._events) and (
+            len(self._events) >= self.max_events or time.monotonic() - self._oldest >= self.max_delay
+        )
+
+    def _spill_events(self, events):
+        # Line buffered: a line reaches the OS (and survives the process) as soon as it is written
+        if self._spill is None:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            path = os.path.join(self.spill_dir, f'analytics-{os.getpid()}-{uuid.uuid4().hex}.jsonl')
+            spill_file = open(path, 'x', buffering=1, encoding='utf-8')
+            fcntl.flock(spill_file, fcntl.LOCK_EX)
+            self._spill = (spill_file, path)
+        spill_file = self._spill[0]
+        for event in events:
+            spill_file.write(json.dumps(
+                {name: getattr(event, name) for name in SPILL_FIELDS}, cls=DjangoJSONEncoder
+            ) + '\n')
+
+
+def _remove_spill_file(spill_file, path):
+    # Removed before unlocking, so a replay waiting for the lock finds it gone
+    os.remove(path)
+    spill_file.close()
+
+
+event_buffer = EventBuffer(
+    max_events=getattr(settings, 'ANALYTICS_BUFFER_SIZE', 100),
+    max_delay_ms=getattr(settings, 'ANALYTICS_BUFFER_MAX_DELAY_MS', 1000),
+    spill_dir=getattr(settings, 'ANALYTICS_SPILL_DIR', None),
+)
+# Management commands and shells have no request end
+atexit.register(event_buffer.flush)
+
+
+def log_event(analytics_type, course=None, user=None, value=1.0, metadata=None):
+    """Queue an analytics event; it is written in a batch (see EventBuffer)."""
+    event_buffer.add(Analytics(
+        analytics_type=analytics_type,
+        course=course,
+        user=user,
+        value=value,
+        metadata=metadata or {},
+    ))
+
+
+def log_event_on_commit(analytics_type, course_id=None, user_id=None, value=1.0, metadata=None):
+    """
+    Queue an analytics event once the current transaction commits (right
+    away outside one), so writes that are rolled back log nothing. ``value``
+    may be a callable, called at commit time.
+    """
+    recorded = timezone.now()
+    transaction.on_commit(lambda: event_buffer.add(Analytics(
+        analytics_type=analytics_type,
+        course_id=course_id,
+        user_id=user_id,
+        value=value() if callable(value) else value,
+        metadata=metadata or {},
+        date_recorded=recorded,
+    )))
+
+
+def replay_spilled_events(spill_dir):
+    """
+    Write the events left in spill files that no process holds any more
+    (see EventBuffer). Returns ``(files, events)`` replayed.
+    """
+    files = events = 0
+    if not os.path.isdir(spill_dir):
+        return files, events
+    for name in sorted(os.listdir(spill_dir)):
+        if not name.startswith('analytics-') or not name.endswith('.jsonl'):
+            continue
+        path = os.path.join(spill_dir, name)
+        batch = []
+        try:
+            spill_file = open(path, encoding='utf-8')
+        except FileNotFoundError:
+            continue
+        with spill_file:
+            try:
+                fcntl.flock(spill_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # Its process is alive and may still write it
+                continue
+            if not os.path.exists(path):
+                # Written and removed while we waited for the file
+                continue
+            for line in spill_file:
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    # The process died halfway through this line
+                    continue
+                row['date_recorded'] = parse_datetime(row['date_recorded'])
+                batch.append(Analytics(**row))
+            if batch:
+                try:
+                    write_events(batch)
+                except Exception:
+                    write_events_each(batch)
+            os.remove(path)
+        files += 1
+        events += len(batch)
+    return files, events
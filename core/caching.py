@@ -0,0 +1,113 @@
+"""
+Versioned cache namespaces and anonymous full-page caching.
+
+Cache keys built with versioned_key() embed the current version number of
+every namespace they depend on. bump_namespace() increments those numbers,
+which orphans every dependent key in one step: stale entries are never read
+again and simply expire, so writers never need to track individual keys.
+
+Namespaces used by the catalog (bumped from core.signals):
+
+- ``courses``         any course was added, changed or removed
+- ``course:<id>``     that course, or one of its modules or lessons, changed
+- ``category:<id>``   that category, or a course in it, changed
+- ``categories``      any category changed
+- ``search``          the catalog search index may have changed
+
+``analytics`` is bumped when the daily analytics rollups are rebuilt
+(see core.analytics).
+"""
+import hashlib
+from functools import wraps
+
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.http import HttpResponse
+
+# How long an anonymous page may be served from cache. Writes to the models
+# a page depends on invalidate it sooner; this bounds everything else (e.g.
+# enrollment counts or instructor names).
+ANONYMOUS_PAGE_TIMEOUT = 10 * 60
+
+
+def _version_key(namespace):
+    return f'ns-version:{namespace}'
+
+
+def namespace_versions(*namespaces):
+    """Current version of each namespace, fetched in one cache round trip."""
+    keys = [_version_key(namespace) for namespace in namespaces]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            cache.add(key, 1, timeout=None)
+            found[key] = cache.get(key, 1)
+    return tuple(found[key] for key in keys)
+
+
+def bump_namespace(*namespaces):
+    for namespace in namespaces:
+        try:
+            cache.incr(_version_key(namespace))
+        except ValueError:
+            # Evicted or never set; any fresh number invalidates the old keys
+            cache.set(_version_key(namespace), 2, timeout=None)
+
+
+def versioned_key(namespaces, *parts):
+    """Cache key for ``parts`` that changes whenever one of ``namespaces`` is bumped."""
+    if isinstance(namespaces, str):
+        namespaces = (namespaces,)
+    versions = namespace_versions(*namespaces)
+    digest = hashlib.md5(repr((namespaces, versions, parts)).encode()).hexdigest()
+    return f'{namespaces[0]}:{digest}'
+
+
+def catalog_namespaces(category_id=None):
+    """Namespaces a course listing depends on, optionally narrowed to one category."""
+    if category_id is None:
+        return ('courses', 'categories')
+    return (f'category:{category_id}', 'categories')
+
+
+def catalog_page_namespaces(request):
+    # Only a plain ?category=<id> listing can be narrowed; searches and name
+    # lookups may match courses anywhere in the catalog
+    if request.GET.get('q'):
+        return ('search', 'categories')
+    category = request.GET.get('category', '')
+    if category.isdigit():
+        return catalog_namespaces(int(category))
+    return catalog_namespaces()
+
+
+def cache_anonymous_page(namespaces, timeout=ANONYMOUS_PAGE_TIMEOUT):
+    """
+    Serve a view's HTML from cache for logged-out visitors.
+
+    ``namespaces`` is called with the view's arguments and returns the
+    namespaces the page depends on; the full path (with query string) is part
+    of the key. Authenticated users, non-GET requests and requests carrying
+    flash messages always reach the view. Responses that are not a plain 200
+    or that used the visitor's CSRF token are never stored.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if (request.method not in ('GET', 'HEAD') or request.user.is_authenticated
+                    or len(get_messages(request))):
+                return view(request, *args, **kwargs)
+
+            key = versioned_key(namespaces(request, *args, **kwargs), 'page', request.get_full_path())
+            cached = cache.get(key)
+            if cached is not None:
+                content, content_type = cached
+                return HttpResponse(content, content_type=content_type)
+
+            response = view(request, *args, **kwargs)
+            if (response.status_code == 200 and not response.streaming and not response.cookies
+                    and not request.META.get('CSRF_COOKIE_NEEDS_UPDATE')):
+                cache.set(key, (response.content, response['Content-Type']), timeout)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,143 @@
+"""
+Full-text search for the public course catalog.
+
+The search engine is pluggable: CATALOG_SEARCH_BACKEND in settings names a
+CatalogSearchBackend subclass. When it is not set, SQLite databases use the
+FTS5 backend below and every other database uses DatabaseCatalogBackend,
+which keeps the old unranked icontains behaviour.
+
+The FTS5 index holds one row per active course (rowid = course.id) with the
+course title, description, category name, instructor name and all lesson
+titles. Signals in core.signals re-index a course whenever it, one of its
+lessons or its category is saved or deleted.
+"""
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils.module_loading import import_string
+
+from .search import fts_terms
+
+CATALOG_SEARCH_TABLE = 'core_catalogsearch'
+
+CATALOG_SEARCH_DDL = f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {CATALOG_SEARCH_TABLE} USING fts5(
+        scope, title, description, category, instructor, lessons,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+"""
+
+CATALOG_SEARCH_DROP = f'DROP TABLE IF EXISTS {CATALOG_SEARCH_TABLE}'
+
+# Builds index rows straight from the catalog tables, so indexing one course
+# and rebuilding everything share a single statement
+CATALOG_SEARCH_SOURCE = f"""
+    INSERT INTO {CATALOG_SEARCH_TABLE} (rowid, scope, title, description, category, instructor, lessons)
+    SELECT c.id,
+           'c' || COALESCE(c.category_id, 0),
+           c.title,
+           c.description,
+           COALESCE(cat.name, ''),
+           u.first_name || ' ' || u.last_name || ' ' || u.username,
+           COALESCE((
+               SELECT group_concat(l.title, ' ')
+               FROM core_lesson l JOIN core_module m ON m.id = l.module_id
+               WHERE m.course_id = c.id
+           ), '')
+    FROM core_course c
+    JOIN core_customuser u ON u.id = c.instructor_id
+    LEFT JOIN core_category cat ON cat.id = c.category_id
+    WHERE c.is_active
+"""
+
+# Title matches count most, then category and instructor, then the rest
+CATALOG_SEARCH_QUERY = f"""
+    SELECT rowid FROM {CATALOG_SEARCH_TABLE}
+    WHERE {CATALOG_SEARCH_TABLE} MATCH %s
+    ORDER BY bm25({CATALOG_SEARCH_TABLE}, 0.0, 10.0, 1.0, 4.0, 4.0, 2.0)
+    LIMIT %s
+"""
+
+
+class CatalogSearchBackend:
+    """Interface for catalog search engines."""
+
+    def index_course(self, course_id):
+        """Add, refresh or (for inactive courses) drop one course."""
+
+    def remove_course(self, course_id):
+        """Drop one course from the index."""
+
+    def rebuild(self):
+        """Re-index the whole catalog."""
+
+    def search(self, query, category_id=None, limit=500):
+        """Return the ids of matching active courses, best match first."""
+        raise NotImplementedError
+
+
+class DatabaseCatalogBackend(CatalogSearchBackend):
+    """Unranked icontains search; needs no index."""
+
+    def search(self, query, category_id=None, limit=500):
+        from .models import Course
+
+        courses = Course.objects.filter(
+            Q(title__icontains=query) |
+            Q(description__icontains=query) |
+            Q(category__name__icontains=query) |
+            Q(instructor__username__icontains=query) |
+            Q(modules__lessons__title__icontains=query),
+            is_active=True
+        )
+        if category_id is not None:
+            courses = courses.filter(category_id=category_id)
+        return list(courses.order_by('-created_at').values_list('pk', flat=True).distinct()[:limit])
+
+
+class SQLiteFTSCatalogBackend(CatalogSearchBackend):
+    """BM25-ranked search over an FTS5 table in the main SQLite database."""
+
+    def index_course(self, course_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {CATALOG_SEARCH_TABLE} WHERE rowid = %s', [course_id])
+            cursor.execute(CATALOG_SEARCH_SOURCE + ' AND c.id = %s', [course_id])
+
+    def remove_course(self, course_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {CATALOG_SEARCH_TABLE} WHERE rowid = %s', [course_id])
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(CATALOG_SEARCH_DDL)
+            cursor.execute(f'DELETE FROM {CATALOG_SEARCH_TABLE}')
+            cursor.execute(CATALOG_SEARCH_SOURCE)
+            cursor.execute(f"INSERT INTO {CATALOG_SEARCH_TABLE} ({CATALOG_SEARCH_TABLE}) VALUES ('optimize')")
+
+    def search(self, query, category_id=None, limit=500):
+        words = fts_terms(query)
+        if words is None:
+            return []
+        expression = f'{{title description category instructor lessons}} : ({words})'
+        if category_id is not None:
+            # The category is an indexed token, so filtering happens inside the index
+            expression = f'scope : "c{int(category_id)}" AND {expression}'
+        with connection.cursor() as cursor:
+            cursor.execute(CATALOG_SEARCH_QUERY, [expression, limit])
+            return [row[0] for row in cursor.fetchall()]
+
+
+_backend = None
+
+
+def get_catalog_backend():
+    global _backend
+    if _backend is None:
+        path = getattr(settings, 'CATALOG_SEARCH_BACKEND', None)
+        if path:
+            _backend = import_string(path)()
+        elif connection.vendor == 'sqlite':
+            _backend = SQLiteFTSCatalogBackend()
+        else:
+            _backend = DatabaseCatalogBackend()
+    return _backend
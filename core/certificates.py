@@ -0,0 +1,638 @@
+"""
+Certificate PDF rendering and storage.
+
+Drawing a certificate (background, logo, signature, QR code and text) is
+expensive, while the result only changes when one of its inputs does. Each
+rendered PDF is therefore kept in media storage next to a fingerprint of
+those inputs (certificate_render_hash), and get_certificate_pdf() renders
+again only when the fingerprint no longer matches: after the course's
+CertificateTemplate, the name on the certificate or the drawing code changed.
+
+The template's images are composed once into cached print-resolution JPEG
+layers (compile_template_layer), so a render only draws text and the QR
+code over them. The layers are embedded as binary streams (_draw_jpeg_layer).
+
+Certificates are issued automatically when an enrollment reaches 100%
+(issue_certificate), and their PDFs pre-rendered after commit
+(enqueue_certificate_render) so the downloads after a cohort's deadline come
+straight from storage.
+
+Bulk downloads (stream_certificates_zip) render whatever is stale in a
+process pool and stream the archive while the workers are still drawing.
+"""
+import hashlib
+import logging
+import os
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from multiprocessing import get_context
+from io import BytesIO
+
+import django
+import qrcode
+from PIL import Image, ImageOps
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from django.utils.text import slugify
+from reportlab.lib.colors import HexColor
+from reportlab.lib.pagesizes import letter, landscape
+from reportlab.lib.units import inch
+from reportlab.lib.utils import _digester
+from reportlab.pdfbase import pdfdoc, pdfutils
+from reportlab.pdfgen import canvas
+
+from .models import Certificate, CertificateTemplate
+from .upsert import upsert
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the drawing code changes so stored PDFs are re-rendered
+RENDERER_VERSION = 4
+
+# Below this many stale certificates a bulk download renders in-process;
+# starting worker processes would cost more than it saves
+POOL_MIN_CERTIFICATES = 4
+
+# Render processes a web process starts at most, shared by all its downloads
+SHARED_POOL_MAX_WORKERS = 2
+
+# Quiet zone around certificate QR codes, in modules (the QR spec asks for 4)
+QR_QUIET_ZONE = 4
+
+# How long a QR code's module layout is kept in the cache
+QR_CACHE_TIMEOUT = 24 * 60 * 60
+
+# Resolution and quality of the pre-composed template image layers, and of
+# template images as they are stored after upload
+LAYER_DPI = 300
+LAYER_JPEG_QUALITY = 88
+
+# Page size and where the template's logo and signature are drawn, in points
+# as (x, y, width, height)
+PAGE_SIZE = landscape(letter)
+LOGO_BOX = (50, PAGE_SIZE[1] - 120, 120, 80)
+SIGNATURE_BOX = (100, 115, 150, 60)
+
+
+def get_certificate_template(course):
+    try:
+        return course.certificate_template
+    except CertificateTemplate.DoesNotExist:
+        return CertificateTemplate.objects.create(course=course)
+
+
+def certificate_verify_url(certificate):
+    """Absolute URL of the public verification page the QR code points to."""
+    return settings.SITE_URL.rstrip('/') + reverse('verify_certificate', args=[certificate.certificate_id])
+
+
+def verification_cache_key(certificate_id, fmt):
+    return f'certificate-verify:{certificate_id}:{fmt}'
+
+
+def invalidate_certificate_verification(certificate_id):
+    cache.delete_many([verification_cache_key(certificate_id, fmt) for fmt in ('html', 'json')])
+
+
+def certificate_render_hash(certificate, template):
+    """Fingerprint of every input the certificate PDF is drawn from."""
+    parts = [
+        RENDERER_VERSION,
+        certificate.certificate_id,
+        certificate.full_name,
+        certificate.issued_at.isoformat(),
+        certificate.enrollment.course.title,
+        template.title,
+        template.description,
+        template.background_image.name or '',
+        template.logo.name or '',
+        template.signature.name or '',
+        template.font_size,
+        template.text_color,
+        certificate_verify_url(certificate),
+    ]
+    return hashlib.sha256(repr(parts).encode()).hexdigest()[:32]
+
+
+def qr_cache_key(payload):
+    return f'certificate-qr:{hashlib.sha256(payload.encode()).hexdigest()[:32]}'
+
+
+def qr_module_runs(payload):
+    """
+    The QR code for ``payload`` as ``(modules, runs)``: the number of modules
+    per side and the dark modules merged into ``(row, column, length)``
+    horizontal runs. Cached by payload, since encoding (and choosing the best
+    mask) is the expensive part.
+    """
+    key = qr_cache_key(payload)
+    cached = cache.get(key)
+    if cached is None:
+        qr = qrcode.QRCode(border=0)
+        qr.add_data(payload)
+        qr.make(fit=True)
+        matrix = qr.get_matrix()
+        runs = []
+        for row, dark in enumerate(matrix):
+            column = 0
+            while column < len(dark):
+                if dark[column]:
+                    start = column
+                    while column < len(dark) and dark[column]:
+                        column += 1
+                    runs.append((row, start, column - start))
+                else:
+                    column += 1
+        cached = (len(matrix), runs)
+        cache.set(key, cached, QR_CACHE_TIMEOUT)
+    return cached
+
+
+def draw_qr_code(p, payload, x, y, size):
+    """Draw the QR code for ``payload`` as vector modules in the ``size`` square at ``(x, y)``."""
+    modules, runs = qr_module_runs(payload)
+    module = size / (modules + 2 * QR_QUIET_ZONE)
+    top = y + size - QR_QUIET_ZONE * module
+
+    p.saveState()
+    # The quiet zone must stay white even over a background image
+    p.setFillColor(HexColor('#ffffff'))
+    p.rect(x, y, size, size, stroke=0, fill=1)
+    path = p.beginPath()
+    for row, column, length in runs:
+        path.rect(x + (QR_QUIET_ZONE + column) * module, top - (row + 1) * module, length * module, module)
+    p.setFillColor(HexColor('#000000'))
+    p.drawPath(path, stroke=0, fill=1)
+    p.restoreState()
+
+
+def normalize_template_images(template):
+    """
+    Shrink freshly uploaded background, logo and signature images to
+    LAYER_DPI at the size they are drawn, apply their EXIF rotation and
+    re-encode them: JPEG, or PNG for a logo or signature with transparency.
+    A 20 MB phone photo ends up a few hundred KB. Files that are already
+    stored are left alone.
+    """
+    targets = (
+        ('background_image', PAGE_SIZE, False),
+        ('logo', LOGO_BOX[2:], True),
+        ('signature', SIGNATURE_BOX[2:], True),
+    )
+    for name, (box_width, box_height), keep_alpha in targets:
+        field = getattr(template, name)
+        if not field or field._committed:
+            continue
+        max_size = (round(box_width / 72 * LAYER_DPI), round(box_height / 72 * LAYER_DPI))
+        try:
+            field.seek(0)
+            with Image.open(field) as image:
+                # Let JPEG decoding skip straight to a reduced scale (either orientation)
+                image.draft('RGB', (max(max_size), max(max_size)))
+                image = ImageOps.exif_transpose(image)
+                image.thumbnail(max_size, Image.LANCZOS)
+        except Exception:
+            # The form already checked it is an image; store it untouched
+            continue
+
+        if image.mode == 'P' or image.mode.endswith('A'):
+            image = image.convert('RGBA')
+        transparent = image.mode == 'RGBA' and image.getextrema()[3][0] < 255
+        output = BytesIO()
+        if keep_alpha and transparent:
+            image.save(output, 'PNG', optimize=True)
+            extension = 'png'
+        else:
+            if image.mode == 'RGBA':
+                flattened = Image.new('RGB', image.size, 'white')
+                flattened.paste(image, mask=image.getchannel('A'))
+                image = flattened
+            image.convert('RGB').save(output, 'JPEG', quality=LAYER_JPEG_QUALITY, optimize=True)
+            extension = 'jpg'
+        stem = os.path.splitext(os.path.basename(field.name))[0]
+        field.save(f'{stem}.{extension}', ContentFile(output.getvalue()), save=False)
+
+
+def _paste_fitted(page, field, box, page_box, fit):
+    """Paste ``field``'s image into ``box`` (PDF points) of ``page``, which covers ``page_box``."""
+    scale = LAYER_DPI / 72
+    x, y, box_width, box_height = box
+    try:
+        with field.open('rb'), Image.open(field) as image:
+            if fit:
+                ratio = min(box_width / image.width, box_height / image.height)
+                x += (box_width - image.width * ratio) / 2
+                y += (box_height - image.height * ratio) / 2
+                box_width, box_height = image.width * ratio, image.height * ratio
+            size = (max(1, round(box_width * scale)), max(1, round(box_height * scale)))
+            # Lets JPEG decoding skip straight to a reduced scale
+            image.draft('RGB', size)
+            image = image.convert('RGBA').resize(size, Image.LANCZOS)
+    except Exception:
+        # Unreadable uploads are skipped, as they always have been
+        return
+    page_x, page_y, _, page_height = page_box
+    top_left = (round((x - page_x) * scale), round((page_y + page_height - y - box_height) * scale))
+    page.paste(image, top_left, image)
+
+
+def _compose_layer(page_box, parts):
+    """Flatten ``parts`` onto white over ``page_box`` and store the result as a JPEG; returns its name."""
+    key = repr([RENDERER_VERSION, LAYER_DPI, LAYER_JPEG_QUALITY, page_box]
+               + [(field.name, box, fit) for field, box, fit in parts])
+    name = f'certificates/layers/{hashlib.sha256(key.encode()).hexdigest()[:24]}.jpg'
+    if default_storage.exists(name):
+        return name
+
+    scale = LAYER_DPI / 72
+    page = Image.new('RGB', (round(page_box[2] * scale), round(page_box[3] * scale)), 'white')
+    for field, box, fit in parts:
+        _paste_fitted(page, field, box, page_box, fit)
+
+    output = BytesIO()
+    page.save(output, 'JPEG', quality=LAYER_JPEG_QUALITY, optimize=True)
+    saved = default_storage.save(name, ContentFile(output.getvalue()))
+    if saved != name:
+        # A concurrent render stored the same layer first
+        default_storage.delete(saved)
+    return name
+
+
+def compile_template_layer(template):
+    """
+    The static images of ``template`` as ``[(jpeg_name, x, y, width, height)]``
+    placements. Each layer is composed once at LAYER_DPI, flattened onto
+    white and kept in media storage by the images it was built from, so
+    renders no longer decode or resample the uploads. With a background, everything is
+    one page-sized layer; without one, the logo and signature get their own
+    small layers, as the page behind them is white anyway.
+    """
+    parts = []
+    if template.logo:
+        parts.append((template.logo, LOGO_BOX, True))
+    if template.signature:
+        parts.append((template.signature, SIGNATURE_BOX, True))
+
+    if template.background_image:
+        page_box = (0, 0, *PAGE_SIZE)
+        return [(_compose_layer(page_box, [(template.background_image, page_box, False)] + parts), *page_box)]
+    return [(_compose_layer(box, [(field, box, fit)]), *box) for field, box, fit in parts]
+
+
+def _draw_jpeg_layer(p, name, x, y, width, height):
+    """
+    Draw the stored JPEG layer ``name`` into a box of canvas ``p``, embedded
+    as a binary stream. Canvas.drawImage() would ASCII85-wrap it under
+    ReportLab's default rl_config.useA85: 25% larger files and, without the
+    optional C accelerator, more time than the whole render. That setting
+    is process-wide, so instead of flipping it the image object is
+    registered with this canvas's document here, under the key drawImage()
+    looks it up by, and drawImage() only places it.
+    """
+    key = _digester(f'{name}None'.encode())
+    reg_name = p._doc.getXObjectName(key)
+    if reg_name not in p._doc.idToObject:
+        with default_storage.open(name, 'rb') as layer:
+            data = layer.read()
+        image = pdfdoc.PDFImageXObject(key)
+        image.width, image.height = pdfutils.readJPEGInfo(BytesIO(data))[:2]
+        # Layers are always composed in RGB
+        image.colorSpace = 'DeviceRGB'
+        image.bitsPerComponent = 8
+        image.streamContent = data
+        image._filters = ('DCTDecode',)
+        image.mask = None
+        p._doc.Reference(image, reg_name)
+    p.drawImage(name, x, y, width=width, height=height)
+
+
+def render_certificate_pdf(certificate, template):
+    """Draw ``certificate`` with ``template`` and return the PDF bytes."""
+    enrollment = certificate.enrollment
+
+    # --- PDF GENERATION SETUP ---
+    buffer = BytesIO()
+    # Use Landscape
+    p = canvas.Canvas(buffer, pagesize=landscape(letter))
+    width, height = landscape(letter)
+    
+    # 2. Template images (background, logo, signature), pre-composed at
+    # print resolution; the stored JPEGs are embedded without decoding them
+    for name, x, y, box_width, box_height in compile_template_layer(template):
+        _draw_jpeg_layer(p, name, x, y, box_width, box_height)
+    
+    # --- IF NO BACKGROUND, DRAW FALLBACK BORDER ---
+    if not template.background_image:
+        # Outer Border (Blue)
+        p.setStrokeColor(HexColor('#0d6efd'))
+        p.setLineWidth(12)
+        p.rect(20, 20, width-40, height-40)
+        # Inner Border (Black)
+        p.setStrokeColor(HexColor('#000000'))
+        p.setLineWidth(2)
+        p.rect(35, 35, width-70, height-70)
+        # Fallback Title
+        p.setFillColor(HexColor('#000000'))
+        p.setFont("Helvetica-Bold", 24)
+        p.drawCentredString(width/2.0, height - 1.5*inch, "AUA TECHNOLOGIES LIMITED")
+
+    # --- TEXT OVERLAYS ---
+    
+    # Certificate Title
+    p.setFillColor(HexColor('#0d6efd')) # Blue
+    p.setFont("Helvetica-Bold", 36)
+    p.drawCentredString(width/2.0, height - 2.5*inch, template.title)
+    
+    # Intro
+    p.setFillColor(HexColor('#555555')) # Dark Gray
+    p.setFont("Helvetica", 16)
+    p.drawCentredString(width/2.0, height - 3.2*inch, template.description)
+    
+    # STUDENT NAME (Centered & Bold)
+    p.setFillColor(HexColor('#000000')) # Black
+    p.setFont("Helvetica-Bold", 32)
+    p.drawCentredString(width/2.0, height - 4.2*inch, certificate.full_name) 
+    
+    # Underline Name
+    p.setLineWidth(1)
+    p.setStrokeColor(HexColor('#000000'))
+    p.line(width/2.0 - 200, height - 4.3*inch, width/2.0 + 200, height - 4.3*inch)
+
+    # Body Text
+    p.setFillColor(HexColor('#555555')) # Dark Gray
+    p.setFont("Helvetica", 14)
+    
+    date_str = certificate.issued_at.strftime('%d/%m/%Y')
+    
+    line1 = "\"In recognition of successfully completing the prescribed"
+    line2 = f"training module in {enrollment.course.title} and having met all"
+    line3 = f"requirements for the award, issued on {date_str}.\""
+    
+    text_start_y = height - 5.0*inch
+    p.drawCentredString(width/2.0, text_start_y, line1)
+    p.drawCentredString(width/2.0, text_start_y - 25, line2)
+    p.drawCentredString(width/2.0, text_start_y - 50, line3)
+    
+    # CEO Name and Title
+    p.setFillColor(HexColor('#000000'))
+    p.setFont("Helvetica-Bold", 14)
+    
+    # Signature Line
+    p.setLineWidth(1)
+    p.line(100, 115, 250, 115) 
+    
+    # Name & Title
+    p.drawString(100, 100, "MUSAB ABBAS SANI")
+    p.setFont("Helvetica", 12)
+    p.drawString(100, 85, "CEO")
+
+    # QR Code (Bottom Right), linking to the public verification page
+    draw_qr_code(p, certificate_verify_url(certificate), width - 180, 50, 100)
+    
+    p.setFont("Helvetica", 8)
+    p.drawRightString(width - 80, 40, f"ID: {certificate.certificate_id}")
+
+    p.showPage()
+    p.save()
+    
+    pdf = buffer.getvalue()
+    buffer.close()
+    return pdf
+
+
+def certificate_pdf_is_current(certificate, render_hash):
+    return (certificate.pdf_hash == render_hash and bool(certificate.pdf_file)
+            and certificate.pdf_file.storage.exists(certificate.pdf_file.name))
+
+
+def store_certificate_pdf(certificate, render_hash, pdf):
+    """Save a fresh rendering for ``certificate`` and drop the one it replaces."""
+    old_name = certificate.pdf_file.name
+    certificate.pdf_file.save(f'{certificate.certificate_id}-{render_hash[:12]}.pdf', ContentFile(pdf), save=False)
+    certificate.pdf_hash = render_hash
+    certificate.pdf_rendered_at = timezone.now()
+    # A targeted UPDATE, so Certificate.save() side effects do not run
+    Certificate.objects.filter(pk=certificate.pk).update(
+        pdf_file=certificate.pdf_file.name,
+        pdf_hash=render_hash,
+        pdf_rendered_at=certificate.pdf_rendered_at
+    )
+    if old_name and old_name != certificate.pdf_file.name:
+        certificate.pdf_file.storage.delete(old_name)
+
+
+def get_certificate_pdf(certificate, template):
+    """
+    Make sure ``certificate.pdf_file`` holds an up-to-date rendering, drawing
+    and storing it if it is missing or stale. Returns the certificate.
+    """
+    render_hash = certificate_render_hash(certificate, template)
+    if not certificate_pdf_is_current(certificate, render_hash):
+        store_certificate_pdf(certificate, render_hash, render_certificate_pdf(certificate, template))
+    return certificate
+
+
+def issue_certificate(enrollment):
+    """
+    Issue ``enrollment``'s certificate under the student's registered name
+    unless it already has one, and queue its PDF for pre-rendering. Returns
+    the new certificate's primary key, or None if one already existed.
+    """
+    student = enrollment.student
+    issued = upsert(
+        Certificate(
+            enrollment=enrollment,
+            certificate_id=Certificate.generate_certificate_id(),
+            full_name=student.get_full_name() or student.username
+        ),
+        unique_fields=['enrollment'],
+        returning=['id']
+    )
+    if issued is None:
+        return None
+    enqueue_certificate_render(issued[0])
+    return issued[0]
+
+
+def enqueue_certificate_render(certificate_pk):
+    """
+    Pre-render a certificate's PDF once the current transaction commits, so
+    the first download is served from storage. CERTIFICATE_PRERENDER names
+    the callable that is handed the certificate's pk. When unset, SQLite
+    pre-renders nothing, as it takes one writer at a time and a background
+    render would compete with requests for the lock; other databases render
+    on a worker thread. Anything this misses (e.g. on a restart) is picked
+    up by the prerender_certificates command or rendered on first download.
+    """
+    path = getattr(settings, 'CERTIFICATE_PRERENDER', None)
+    if path:
+        prerender = import_string(path)
+    elif connection.vendor == 'sqlite':
+        return
+    else:
+        prerender = prerender_in_background
+    transaction.on_commit(lambda: prerender(certificate_pk))
+
+
+def prerender_certificate(certificate_pk):
+    """Render and store the PDF of an issued certificate now, logging rather than raising failures."""
+    try:
+        certificate = (
+            Certificate.objects.select_related('enrollment__course', 'enrollment__student')
+            .get(pk=certificate_pk, is_active=True)
+        )
+        get_certificate_pdf(certificate, get_certificate_template(certificate.enrollment.course))
+    except Certificate.DoesNotExist:
+        pass
+    except Exception:
+        logger.exception("Pre-rendering certificate %s failed", certificate_pk)
+
+
+_prerender_executor = None
+_prerender_lock = threading.Lock()
+
+
+def prerender_in_background(certificate_pk):
+    """Queue prerender_certificate() on the process's certificate render thread."""
+    global _prerender_executor
+    with _prerender_lock:
+        if _prerender_executor is None:
+            # One thread: renders queue up behind each other instead of
+            # competing with requests for the CPU
+            _prerender_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='certificate-render')
+    _prerender_executor.submit(_prerender_on_thread, certificate_pk)
+
+
+def _prerender_on_thread(certificate_pk):
+    try:
+        prerender_certificate(certificate_pk)
+    finally:
+        connection.close()
+
+
+def _render_in_worker(job):
+    index, certificate, template = job
+    return index, render_certificate_pdf(certificate, template)
+
+
+def render_pool(workers=None):
+    """
+    Process pool for certificate rendering; ReportLab and qrcode are CPU
+    bound. Workers are spawned: forking a web process would copy its threads
+    (e.g. the pre-render executor) and open database connections.
+    """
+    return ProcessPoolExecutor(
+        max_workers=workers or os.cpu_count(),
+        mp_context=get_context('spawn'),
+        # Spawned workers start without Django configured. The initializer must
+        # not live in this module: importing it would load the models first.
+        initializer=django.setup
+    )
+
+
+_shared_pool = None
+_shared_pool_lock = threading.Lock()
+
+
+def shared_render_pool():
+    """The process's render pool for requests, started on first use and kept for its lifetime."""
+    global _shared_pool
+    with _shared_pool_lock:
+        if _shared_pool is None:
+            _shared_pool = render_pool(min(SHARED_POOL_MAX_WORKERS, os.cpu_count() or 1))
+        return _shared_pool
+
+
+def iter_certificate_pdfs(certificates, template, workers=None, include_current=True):
+    """
+    Yield ``(certificate, pdf_bytes)`` for every certificate. Current
+    renderings are read from storage (or skipped, without
+    ``include_current``); the rest are drawn in a process pool, stored, and
+    yielded as soon as each worker finishes. The pool is the shared,
+    bounded one unless ``workers`` asks for a dedicated pool (commands).
+    """
+    stale = []
+    for certificate in certificates:
+        render_hash = certificate_render_hash(certificate, template)
+        if certificate_pdf_is_current(certificate, render_hash):
+            if include_current:
+                with certificate.pdf_file.open('rb') as pdf_file:
+                    yield certificate, pdf_file.read()
+        else:
+            stale.append((certificate, render_hash))
+
+    if len(stale) < POOL_MIN_CERTIFICATES:
+        for certificate, render_hash in stale:
+            pdf = render_certificate_pdf(certificate, template)
+            store_certificate_pdf(certificate, render_hash, pdf)
+            yield certificate, pdf
+        return
+
+    pool = render_pool(workers) if workers else shared_render_pool()
+    futures = [
+        pool.submit(_render_in_worker, (index, certificate, template))
+        for index, (certificate, _) in enumerate(stale)
+    ]
+    try:
+        for future in as_completed(futures):
+            index, pdf = future.result()
+            certificate, render_hash = stale[index]
+            store_certificate_pdf(certificate, render_hash, pdf)
+            yield certificate, pdf
+    finally:
+        # An abandoned download must not keep the shared workers busy
+        for future in futures:
+            future.cancel()
+        if workers:
+            pool.shutdown()
+
+
+class _ZipStream:
+    """Write-only file object whose contents are handed out chunk by chunk."""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def certificate_zip_name(certificate):
+    name = slugify(certificate.full_name or certificate.enrollment.student.get_full_name()
+                   or certificate.enrollment.student.username)
+    return f'{certificate.certificate_id}-{name}.pdf' if name else f'{certificate.certificate_id}.pdf'
+
+
+def stream_certificates_zip(certificates, template, workers=None):
+    """
+    Generate a ZIP archive of the given certificates, yielding bytes as each
+    entry is written so the download starts before rendering has finished.
+    """
+    stream = _ZipStream()
+    # PDF streams are already compressed; storing them keeps the archive cheap
+    with zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for certificate, pdf in iter_certificate_pdfs(certificates, template, workers):
+            archive.writestr(certificate_zip_name(certificate), pdf)
+            yield stream.drain()
+    yield stream.drain()
@@ -0,0 +1,58 @@
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+
+from .models import Enrollment, Topic
+
+
+def topic_group_name(topic_id):
+    return f"topic_{topic_id}"
+
+
+class TopicConsumer(AsyncJsonWebsocketConsumer):
+    """
+    Pushes replies to everyone viewing a topic. create_post broadcasts the
+    rendered post after its transaction commits; this consumer just relays it.
+    """
+
+    async def connect(self):
+        self.topic_id = self.scope['url_route']['kwargs']['topic_pk']
+        self.group_name = topic_group_name(self.topic_id)
+
+        if not await self.can_view_topic():
+            await self.close()
+            return
+
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, code):
+        if hasattr(self, 'group_name'):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def receive_json(self, content, **kwargs):
+        # Read-only stream: replies are still posted through create_post
+        pass
+
+    async def post_created(self, event):
+        await self.send_json({
+            'position': event['position'],
+            'page': event['page'],
+            'reply_count': event['reply_count'],
+            'html': event['html'],
+        })
+
+    @database_sync_to_async
+    def can_view_topic(self):
+        """Same rule as topic_detail: enrolled students and the course instructor."""
+        user = self.scope.get('user')
+        if user is None or not user.is_authenticated:
+            return False
+        topic = Topic.objects.select_related('forum__course').filter(pk=self.topic_id).first()
+        if topic is None:
+            return False
+        course = topic.forum.course
+        if user.role == 'instructor':
+            return course.instructor_id == user.pk
+        if user.role == 'student':
+            return Enrollment.objects.filter(student=user, course=course).exists()
+        return False
@@ -0,0 +1,100 @@
+import os
+import time
+from io import BytesIO
+
+import qrcode
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas
+
+from core.certificates import (
+    _render_in_worker, certificate_verify_url, draw_qr_code, qr_cache_key, render_certificate_pdf, render_pool,
+)
+from core.models import Certificate, CertificateTemplate, Course, Enrollment
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark certificate QR drawing and PDF rendering in-process and across a process pool, "
+        "using unsaved synthetic certificates (nothing is written to the database)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--certificates', type=int, default=200)
+        parser.add_argument('--workers', type=int, default=os.cpu_count())
+        parser.add_argument('--course', type=int, help="Render with this course's template instead of the defaults")
+        parser.add_argument('--skip-pool', action='store_true', help="Only benchmark in-process rendering")
+
+    def handle(self, *args, **options):
+        if options['course']:
+            course = Course.objects.get(pk=options['course'])
+            template = CertificateTemplate.objects.get(course=course)
+        else:
+            course = Course(title="Introduction to Benchmarking")
+            template = CertificateTemplate()
+
+        now = timezone.now()
+        certificates = [
+            Certificate(
+                enrollment=Enrollment(course=course),
+                certificate_id=f"BENCH{i:06d}",
+                full_name=f"Student Number {i}",
+                issued_at=now,
+            )
+            for i in range(options['certificates'])
+        ]
+
+        self.benchmark_qr_codes(certificates)
+
+        started = time.perf_counter()
+        total_bytes = sum(len(render_certificate_pdf(certificate, template)) for certificate in certificates)
+        serial = len(certificates) / (time.perf_counter() - started)
+        self.stdout.write(
+            f"In-process:              {serial:8.1f} certificates/s   "
+            f"({total_bytes / len(certificates) / 1024:.1f} KiB per PDF)"
+        )
+
+        if options['skip_pool']:
+            return
+        workers = max(1, options['workers'])
+        with render_pool(workers) as pool:
+            # Warm the workers up so process start-up is not measured
+            list(pool.map(_render_in_worker, [(0, certificates[0], template)] * workers))
+            started = time.perf_counter()
+            list(pool.map(
+                _render_in_worker,
+                ((index, certificate, template) for index, certificate in enumerate(certificates)),
+                chunksize=max(1, len(certificates) // (workers * 4))
+            ))
+            pooled = len(certificates) / (time.perf_counter() - started)
+        self.stdout.write(
+            f"Pool of {workers:<3} processes:   {pooled:8.1f} certificates/s   "
+            f"{pooled / workers:8.1f} per core   (x{pooled / serial:.2f})"
+        )
+
+    def benchmark_qr_codes(self, certificates):
+        """The former PNG round trip against vector modules, each on a page holding only the QR code."""
+        def raster(p, payload, x, y, size):
+            png = BytesIO()
+            qrcode.make(payload).save(png, format="PNG")
+            png.seek(0)
+            p.drawImage(ImageReader(png), x, y, width=size, height=size)
+
+        payloads = [certificate_verify_url(certificate) for certificate in certificates]
+        cache.delete_many([qr_cache_key(payload) for payload in payloads])
+        for label, draw in (("raster PNG", raster), ("vector", draw_qr_code), ("vector, cached", draw_qr_code)):
+            total_bytes = 0
+            started = time.perf_counter()
+            for payload in payloads:
+                buffer = BytesIO()
+                p = canvas.Canvas(buffer)
+                draw(p, payload, 50, 50, 100)
+                p.showPage()
+                p.save()
+                total_bytes += len(buffer.getvalue())
+            elapsed = (time.perf_counter() - started) / len(payloads) * 1000
+            self.stdout.write(
+                f"QR code, {label:<15} {elapsed:8.2f} ms   {total_bytes / len(payloads) / 1024:6.1f} KiB per page"
+            )
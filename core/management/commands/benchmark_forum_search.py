@@ -0,0 +1,111 @@
+import itertools
+import random
+import sqlite3
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.search import (
+    FORUM_SEARCH_DDL, FORUM_SEARCH_QUERY, FORUM_SEARCH_REBUILD,
+    HIGHLIGHT_END, HIGHLIGHT_START, build_match_expression,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the forum FTS5 index against an icontains-style LIKE scan on a "
+        "synthetic corpus in a throwaway in-memory SQLite database"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=1_000_000)
+        parser.add_argument('--topics', type=int, default=20_000)
+        parser.add_argument('--forums', type=int, default=100)
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        # Zipf-like vocabulary so some terms are common and most are rare
+        vocabulary = [f"w{i}" for i in range(20_000)]
+        cum_weights = list(itertools.accumulate(1.0 / (rank + 1) for rank in range(len(vocabulary))))
+
+        def text(words):
+            return ' '.join(rng.choices(vocabulary, cum_weights=cum_weights, k=words))
+
+        db = sqlite3.connect(':memory:')
+        db.execute("CREATE TABLE core_topic (id INTEGER PRIMARY KEY, forum_id INTEGER, title TEXT, content TEXT)")
+        db.execute("CREATE TABLE core_post (id INTEGER PRIMARY KEY, topic_id INTEGER, content TEXT, position INTEGER)")
+        db.execute("CREATE INDEX core_post_topic ON core_post (topic_id)")
+
+        self.stdout.write(f"Generating {options['topics']:,} topics and {options['posts']:,} posts...")
+        db.executemany(
+            "INSERT INTO core_topic VALUES (?, ?, ?, ?)",
+            ((i, rng.randrange(options['forums']), text(6), text(40)) for i in range(1, options['topics'] + 1))
+        )
+        positions = {}
+
+        def posts():
+            for i in range(1, options['posts'] + 1):
+                topic_id = rng.randrange(1, options['topics'] + 1)
+                positions[topic_id] = positions.get(topic_id, 0) + 1
+                yield (i, topic_id, text(rng.randint(10, 80)), positions[topic_id])
+
+        db.executemany("INSERT INTO core_post VALUES (?, ?, ?, ?)", posts())
+        db.commit()
+
+        # Full rebuild, then the per-row trigger path for new posts
+        for statement in FORUM_SEARCH_DDL:
+            db.execute(statement)
+        started = time.perf_counter()
+        for statement in FORUM_SEARCH_REBUILD:
+            db.execute(statement)
+        db.commit()
+        self.stdout.write(f"Index rebuild:          {time.perf_counter() - started:8.2f} s")
+
+        inserts = 1000
+        new_posts = [
+            (rng.randrange(1, options['topics'] + 1), text(40), 10_000_000 + i)
+            for i in range(inserts)
+        ]
+        started = time.perf_counter()
+        for row in new_posts:
+            db.execute("INSERT INTO core_post (topic_id, content, position) VALUES (?, ?, ?)", row)
+        db.commit()
+        per_insert = (time.perf_counter() - started) / inserts * 1000
+        self.stdout.write(f"Insert with trigger:    {per_insert:8.3f} ms/post")
+
+        # Mid-frequency two-word queries, one forum at a time
+        queries = [
+            (rng.randrange(options['forums']), f"{rng.choice(vocabulary[50:2000])} {rng.choice(vocabulary[50:2000])}")
+            for _ in range(options['queries'])
+        ]
+        fts_times = []
+        for forum_id, query in queries:
+            sql = FORUM_SEARCH_QUERY.replace('%s', '?')
+            started = time.perf_counter()
+            db.execute(sql, [
+                HIGHLIGHT_START, HIGHLIGHT_END, HIGHLIGHT_START, HIGHLIGHT_END,
+                build_match_expression(forum_id, query), 50,
+            ]).fetchall()
+            fts_times.append((time.perf_counter() - started) * 1000)
+
+        like_times = []
+        for forum_id, query in queries[:max(1, options['queries'] // 20)]:
+            term = f"%{query.split()[0]}%"
+            started = time.perf_counter()
+            db.execute(
+                """SELECT p.id FROM core_post p JOIN core_topic t ON t.id = p.topic_id
+                   WHERE t.forum_id = ? AND p.content LIKE ? LIMIT 50""",
+                (forum_id, term)
+            ).fetchall()
+            like_times.append((time.perf_counter() - started) * 1000)
+
+        def summary(times):
+            times = sorted(times)
+            p95 = times[min(len(times) - 1, int(len(times) * 0.95))]
+            return f"p50 {statistics.median(times):8.2f} ms   p95 {p95:8.2f} ms"
+
+        self.stdout.write(f"FTS5 search ({len(fts_times)} q):  {summary(fts_times)}")
+        self.stdout.write(f"LIKE scan   ({len(like_times)} q):  {summary(like_times)}")
@@ -0,0 +1,39 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.snapshots import APPEND_ONLY_TABLES, TABLES, export_table, load_manifest
+
+
+class Command(BaseCommand):
+    help = (
+        "Export analytics events (and optionally quiz attempts and grades) to columnar .npy files "
+        "for offline analysis. Events continue from the last exported id; quiz attempts and grades "
+        "change in place and are exported in full (see core.snapshots)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('output_dir')
+        parser.add_argument(
+            '--table', action='append', choices=sorted(TABLES),
+            help="Table to export (repeatable, default: analytics)"
+        )
+        parser.add_argument('--chunk-size', type=int, default=100_000, help="Rows per part")
+
+    def handle(self, *args, **options):
+        output_dir = options['output_dir']
+        os.makedirs(output_dir, exist_ok=True)
+        manifest = load_manifest(output_dir)
+
+        for table in options['table'] or ['analytics']:
+            started = time.perf_counter()
+            exported = 0
+            for part, rows in export_table(output_dir, table, manifest, options['chunk_size']):
+                exported += rows
+                self.stdout.write(f"  {part}: {rows:,} rows")
+            state = manifest['tables'][table]
+            self.stdout.write(self.style.SUCCESS(
+                f"{table}: exported {exported:,} {'new ' if table in APPEND_ONLY_TABLES else ''}rows in {time.perf_counter() - started:.1f} s "
+                f"({state['rows']:,} in total, up to id {state['last_id']})."
+            ))
@@ -0,0 +1,39 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.certificates import get_certificate_template, iter_certificate_pdfs
+from core.models import Certificate, Course
+
+
+class Command(BaseCommand):
+    help = (
+        "Render and store the PDFs of active certificates that have none or an outdated one "
+        "(e.g. after a template change, or ahead of a course deadline)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--course', type=int, action='append', help="Only this course (repeatable)")
+        parser.add_argument('--workers', type=int, help="Render processes (default: one per CPU)")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        courses = Course.objects.filter(enrollments__certificate__is_active=True).distinct()
+        if options['course']:
+            courses = courses.filter(pk__in=options['course'])
+
+        rendered = 0
+        for course in courses:
+            certificates = list(
+                Certificate.objects.filter(enrollment__course=course, is_active=True)
+                .select_related('enrollment__course', 'enrollment__student')
+            )
+            template = get_certificate_template(course)
+            workers = options['workers'] or os.cpu_count()
+            for _ in iter_certificate_pdfs(certificates, template, workers, include_current=False):
+                rendered += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Rendered {rendered:,} certificate PDFs in {time.perf_counter() - started:.1f} s."
+        ))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.catalog_search import get_catalog_backend
+
+
+class Command(BaseCommand):
+    help = "Rebuild the course catalog search index with the configured backend"
+
+    def handle(self, *args, **options):
+        backend = get_catalog_backend()
+        with transaction.atomic():
+            backend.rebuild()
+
+        self.stdout.write(self.style.SUCCESS(f"Catalog search index rebuilt ({type(backend).__name__})."))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from core.search import has_fts5, install_forum_search, rebuild_forum_search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the forum full-text search index from core_topic and core_post"
+
+    def handle(self, *args, **options):
+        if not has_fts5():
+            raise CommandError("The forum search index is only used on SQLite (FTS5).")
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            install_forum_search(cursor)
+            rebuild_forum_search(cursor)
+
+        self.stdout.write(self.style.SUCCESS("Forum search index rebuilt."))
@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.analytics import replay_spilled_events
+
+
+class Command(BaseCommand):
+    help = (
+        "Write the buffered analytics events that processes which are no longer running "
+        "left in ANALYTICS_SPILL_DIR (e.g. after a crash)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--spill-dir', help="Directory to replay (default: ANALYTICS_SPILL_DIR)")
+
+    def handle(self, *args, **options):
+        spill_dir = options['spill_dir'] or settings.ANALYTICS_SPILL_DIR
+        if not spill_dir:
+            raise CommandError("ANALYTICS_SPILL_DIR is not set; pass --spill-dir.")
+        files, events = replay_spilled_events(spill_dir)
+        self.stdout.write(self.style.SUCCESS(f"Replayed {events:,} analytics events from {files} spill files."))
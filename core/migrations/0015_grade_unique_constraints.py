@@ -0,0 +1,36 @@
+# Generated by Django 5.2.8 on 2026-10-19 01:48
+
+from django.db import migrations, models
+
+
+def remove_duplicate_grades(apps, schema_editor):
+    """Keep only the most recent grade per (enrollment, assignment) and (enrollment, quiz)."""
+    Grade = apps.get_model('core', 'Grade')
+    for item_field in ('assignment', 'quiz'):
+        seen = set()
+        grades = Grade.objects.filter(**{f'{item_field}__isnull': False}).order_by('-date_recorded', '-pk')
+        for grade in grades.iterator():
+            key = (grade.enrollment_id, getattr(grade, f'{item_field}_id'))
+            if key in seen:
+                grade.delete()
+            else:
+                seen.add(key)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_certificatetemplate_logo_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_grades, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='grade',
+            constraint=models.UniqueConstraint(fields=('enrollment', 'assignment'), name='unique_assignment_grade'),
+        ),
+        migrations.AddConstraint(
+            model_name='grade',
+            constraint=models.UniqueConstraint(fields=('enrollment', 'quiz'), name='unique_quiz_grade'),
+        ),
+    ]
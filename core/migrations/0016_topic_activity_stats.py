@@ -0,0 +1,52 @@
+# Generated by Django 5.2.8 on 2026-10-19 01:49
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_topic_stats(apps, schema_editor):
+    Topic = apps.get_model('core', 'Topic')
+    Post = apps.get_model('core', 'Post')
+    for topic in Topic.objects.all().iterator():
+        posts = Post.objects.filter(topic=topic)
+        last_post = posts.order_by('-created_at', '-pk').first()
+        topic.reply_count = posts.count()
+        topic.last_post_at = last_post.created_at if last_post else topic.created_at
+        topic.last_post_author_id = last_post.author_id if last_post else None
+        topic.save(update_fields=['reply_count', 'last_post_at', 'last_post_author'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_grade_unique_constraints'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='topic',
+            options={'ordering': ['-is_pinned', '-last_post_at', '-id']},
+        ),
+        migrations.AddField(
+            model_name='topic',
+            name='last_post_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='topic',
+            name='last_post_author',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='topic',
+            name='reply_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_topic_stats, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='topic',
+            index=models.Index(fields=['forum', '-is_pinned', '-last_post_at', '-id'], name='topic_forum_activity_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.8 on 2026-10-19 01:50
+
+from django.db import migrations, models
+
+
+def number_existing_posts(apps, schema_editor):
+    Topic = apps.get_model('core', 'Topic')
+    Post = apps.get_model('core', 'Post')
+    for topic_id in Topic.objects.values_list('pk', flat=True).iterator():
+        posts = Post.objects.filter(topic_id=topic_id).order_by('created_at', 'pk')
+        for position, post in enumerate(posts, start=1):
+            post.position = position
+            post.save(update_fields=['position'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_topic_activity_stats'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='post',
+            options={'ordering': ['position']},
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='position',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(number_existing_posts, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='post',
+            constraint=models.UniqueConstraint(fields=('topic', 'position'), name='unique_post_position'),
+        ),
+    ]
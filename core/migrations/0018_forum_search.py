@@ -0,0 +1,88 @@
+from django.db import migrations
+
+# The SQL is copied from core.search as it stood when this migration was
+# written, so later changes to that module cannot change this migration.
+FORUM_SEARCH_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS core_forumsearch USING fts5(
+        scope, title, body, topic_id UNINDEXED, position UNINDEXED,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS core_topic_search_insert AFTER INSERT ON core_topic BEGIN
+        INSERT INTO core_forumsearch (rowid, scope, title, body, topic_id, position)
+        VALUES (-new.id, 'f' || new.forum_id, new.title, new.content, new.id, 0);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS core_topic_search_update AFTER UPDATE OF title, content, forum_id ON core_topic BEGIN
+        DELETE FROM core_forumsearch WHERE rowid = -old.id;
+        INSERT INTO core_forumsearch (rowid, scope, title, body, topic_id, position)
+        VALUES (-new.id, 'f' || new.forum_id, new.title, new.content, new.id, 0);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS core_topic_search_delete AFTER DELETE ON core_topic BEGIN
+        DELETE FROM core_forumsearch WHERE rowid = -old.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS core_post_search_insert AFTER INSERT ON core_post BEGIN
+        INSERT INTO core_forumsearch (rowid, scope, title, body, topic_id, position)
+        SELECT new.id, 'f' || forum_id, '', new.content, new.topic_id, new.position
+        FROM core_topic WHERE id = new.topic_id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS core_post_search_update AFTER UPDATE OF content, position ON core_post BEGIN
+        DELETE FROM core_forumsearch WHERE rowid = old.id;
+        INSERT INTO core_forumsearch (rowid, scope, title, body, topic_id, position)
+        SELECT new.id, 'f' || forum_id, '', new.content, new.topic_id, new.position
+        FROM core_topic WHERE id = new.topic_id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS core_post_search_delete AFTER DELETE ON core_post BEGIN
+        DELETE FROM core_forumsearch WHERE rowid = old.id;
+    END""",
+]
+
+FORUM_SEARCH_TRIGGERS = [
+    'core_topic_search_insert',
+    'core_topic_search_update',
+    'core_topic_search_delete',
+    'core_post_search_insert',
+    'core_post_search_update',
+    'core_post_search_delete',
+]
+
+FORUM_SEARCH_DROP = [
+    *(f'DROP TRIGGER IF EXISTS {name}' for name in FORUM_SEARCH_TRIGGERS),
+    'DROP TABLE IF EXISTS core_forumsearch',
+]
+
+FORUM_SEARCH_REBUILD = [
+    'DELETE FROM core_forumsearch',
+    """INSERT INTO core_forumsearch (rowid, scope, title, body, topic_id, position)
+        SELECT -id, 'f' || forum_id, title, content, id, 0 FROM core_topic""",
+    """INSERT INTO core_forumsearch (rowid, scope, title, body, topic_id, position)
+        SELECT p.id, 'f' || t.forum_id, '', p.content, p.topic_id, p.position
+        FROM core_post p JOIN core_topic t ON t.id = p.topic_id""",
+    "INSERT INTO core_forumsearch (core_forumsearch) VALUES ('optimize')",
+]
+
+
+def create_forum_search(apps, schema_editor):
+    # FTS5 is SQLite-only; other databases use the icontains fallback
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for statement in FORUM_SEARCH_DDL + FORUM_SEARCH_REBUILD:
+            cursor.execute(statement)
+
+
+def drop_forum_search(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for statement in FORUM_SEARCH_DROP:
+            cursor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_post_position'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_forum_search, drop_forum_search),
+    ]
@@ -0,0 +1,103 @@
+# Generated by Django 5.2.8 on 2026-10-19 01:57
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Max
+
+# The forum search triggers as created by 0018_forum_search (copied, so later
+# changes to core.search cannot change this migration)
+FORUM_SEARCH_TRIGGERS = [
+    'core_topic_search_insert',
+    'core_topic_search_update',
+    'core_topic_search_delete',
+    'core_post_search_insert',
+    'core_post_search_update',
+    'core_post_search_delete',
+]
+
+FORUM_SEARCH_TRIGGERS_DDL = [
+    """CREATE TRIGGER IF NOT EXISTS core_topic_search_insert AFTER INSERT ON core_topic BEGIN
+        INSERT INTO core_forumsearch (rowid, scope, title, body, topic_id, position)
+        VALUES (-new.id, 'f' || new.forum_id, new.title, new.content, new.id, 0);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS core_topic_search_update AFTER UPDATE OF title, content, forum_id ON core_topic BEGIN
+        DELETE FROM core_forumsearch WHERE rowid = -old.id;
+        INSERT INTO core_forumsearch (rowid, scope, title, body, topic_id, position)
+        VALUES (-new.id, 'f' || new.forum_id, new.title, new.content, new.id, 0);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS core_topic_search_delete AFTER DELETE ON core_topic BEGIN
+        DELETE FROM core_forumsearch WHERE rowid = -old.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS core_post_search_insert AFTER INSERT ON core_post BEGIN
+        INSERT INTO core_forumsearch (rowid, scope, title, body, topic_id, position)
+        SELECT new.id, 'f' || forum_id, '', new.content, new.topic_id, new.position
+        FROM core_topic WHERE id = new.topic_id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS core_post_search_update AFTER UPDATE OF content, position ON core_post BEGIN
+        DELETE FROM core_forumsearch WHERE rowid = old.id;
+        INSERT INTO core_forumsearch (rowid, scope, title, body, topic_id, position)
+        SELECT new.id, 'f' || forum_id, '', new.content, new.topic_id, new.position
+        FROM core_topic WHERE id = new.topic_id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS core_post_search_delete AFTER DELETE ON core_post BEGIN
+        DELETE FROM core_forumsearch WHERE rowid = old.id;
+    END""",
+]
+
+
+def suspend_search_triggers(apps, schema_editor):
+    # SQLite rebuilds core_topic to add the column, and the post triggers
+    # reference core_topic, so they are dropped around the rebuild
+    if schema_editor.connection.vendor == 'sqlite':
+        with schema_editor.connection.cursor() as cursor:
+            for name in FORUM_SEARCH_TRIGGERS:
+                cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+
+
+def resume_search_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        with schema_editor.connection.cursor() as cursor:
+            for statement in FORUM_SEARCH_TRIGGERS_DDL:
+                cursor.execute(statement)
+
+
+def backfill_last_post_position(apps, schema_editor):
+    Topic = apps.get_model('core', 'Topic')
+    Post = apps.get_model('core', 'Post')
+    positions = Post.objects.values('topic_id').annotate(last=Max('position'))
+    for row in positions.iterator():
+        Topic.objects.filter(pk=row['topic_id']).update(last_post_position=row['last'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_forum_search'),
+    ]
+
+    operations = [
+        migrations.RunPython(suspend_search_triggers, resume_search_triggers),
+        migrations.AddField(
+            model_name='topic',
+            name='last_post_position',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_last_post_position, migrations.RunPython.noop),
+        migrations.RunPython(resume_search_triggers, suspend_search_triggers),
+        migrations.CreateModel(
+            name='ForumReadState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('read_all_before', models.DateTimeField(default=django.utils.timezone.now)),
+                ('topic_marks', models.JSONField(blank=True, default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('forum', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='read_states', to='core.forum')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='forum_read_states', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'forum')},
+            },
+        ),
+    ]
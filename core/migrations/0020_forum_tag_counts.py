@@ -0,0 +1,54 @@
+# Generated by Django 5.2.8 on 2026-10-19 02:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_tag_counts(apps, schema_editor):
+    TopicTagging = apps.get_model('core', 'TopicTagging')
+    ForumTagCount = apps.get_model('core', 'ForumTagCount')
+    counts = TopicTagging.objects.values('topic__forum_id', 'tag_id').annotate(n=Count('id'))
+    ForumTagCount.objects.bulk_create(
+        ForumTagCount(forum_id=row['topic__forum_id'], tag_id=row['tag_id'], topic_count=row['n'])
+        for row in counts
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_forum_read_state'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ForumTagCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('topic_count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-topic_count', 'tag__name'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='topictagging',
+            index=models.Index(fields=['tag', 'topic'], name='topictagging_tag_topic_idx'),
+        ),
+        migrations.AddField(
+            model_name='forumtagcount',
+            name='forum',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tag_counts', to='core.forum'),
+        ),
+        migrations.AddField(
+            model_name='forumtagcount',
+            name='tag',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='forum_counts', to='core.topictag'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='forumtagcount',
+            unique_together={('forum', 'tag')},
+        ),
+        migrations.RunPython(backfill_tag_counts, migrations.RunPython.noop),
+    ]
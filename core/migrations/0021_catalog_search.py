@@ -0,0 +1,60 @@
+from django.db import migrations
+
+# The SQL is copied from core.catalog_search as it stood when this migration
+# was written, so later changes to that module cannot change this migration.
+CATALOG_SEARCH_DDL = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS core_catalogsearch USING fts5(
+        scope, title, description, category, instructor, lessons,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+"""
+
+CATALOG_SEARCH_DROP = 'DROP TABLE IF EXISTS core_catalogsearch'
+
+CATALOG_SEARCH_SOURCE = """
+    INSERT INTO core_catalogsearch (rowid, scope, title, description, category, instructor, lessons)
+    SELECT c.id,
+           'c' || COALESCE(c.category_id, 0),
+           c.title,
+           c.description,
+           COALESCE(cat.name, ''),
+           u.first_name || ' ' || u.last_name || ' ' || u.username,
+           COALESCE((
+               SELECT group_concat(l.title, ' ')
+               FROM core_lesson l JOIN core_module m ON m.id = l.module_id
+               WHERE m.course_id = c.id
+           ), '')
+    FROM core_course c
+    JOIN core_customuser u ON u.id = c.instructor_id
+    LEFT JOIN core_category cat ON cat.id = c.category_id
+    WHERE c.is_active
+"""
+
+
+def create_catalog_search(apps, schema_editor):
+    # FTS5 is SQLite-only; other databases use DatabaseCatalogBackend
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(CATALOG_SEARCH_DDL)
+        cursor.execute('DELETE FROM core_catalogsearch')
+        cursor.execute(CATALOG_SEARCH_SOURCE)
+        cursor.execute("INSERT INTO core_catalogsearch (core_catalogsearch) VALUES ('optimize')")
+
+
+def drop_catalog_search(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(CATALOG_SEARCH_DROP)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_forum_tag_counts'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_catalog_search, drop_catalog_search),
+    ]
@@ -0,0 +1,46 @@
+from django.db import migrations, models
+from django.db.models import Count, Q
+from django.utils.text import slugify
+
+
+def backfill_categories(apps, schema_editor):
+    Category = apps.get_model('core', 'Category')
+    taken = set()
+    counts = Category.objects.annotate(active=Count('course', filter=Q(course__is_active=True)))
+    for category in counts:
+        base = slugify(category.name) or 'category'
+        slug, suffix = base, 2
+        while slug in taken:
+            slug, suffix = f'{base}-{suffix}', suffix + 1
+        taken.add(slug)
+        Category.objects.filter(pk=category.pk).update(slug=slug, course_count=category.active)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0022_course_catalog_index'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='category',
+            options={'ordering': ['name'], 'verbose_name_plural': 'Categories'},
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='slug',
+            field=models.SlugField(max_length=100, null=True, blank=True),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='course_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_categories, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='category',
+            name='slug',
+            field=models.SlugField(max_length=100, unique=True, blank=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.8 on 2026-10-19 02:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0024_course_recommendations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='certificate',
+            name='pdf_file',
+            field=models.FileField(blank=True, editable=False, upload_to='certificates/pdf/'),
+        ),
+        migrations.AddField(
+            model_name='certificate',
+            name='pdf_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='certificate',
+            name='pdf_rendered_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
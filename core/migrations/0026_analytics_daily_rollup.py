@@ -0,0 +1,63 @@
+# Generated by Django 5.2.8 on 2026-10-19 02:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill_rollups(apps, schema_editor):
+    Analytics = apps.get_model('core', 'Analytics')
+    AnalyticsDailyRollup = apps.get_model('core', 'AnalyticsDailyRollup')
+    rows = (
+        Analytics.objects.annotate(day=TruncDate('date_recorded'))
+        .values('course_id', 'analytics_type', 'day')
+        .annotate(count=Count('id'), value_sum=Sum('value'))
+        .order_by()
+    )
+    AnalyticsDailyRollup.objects.bulk_create(
+        (AnalyticsDailyRollup(**row) for row in rows.iterator()),
+        batch_size=5_000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0025_certificate_pdf_cache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalyticsDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('analytics_type', models.CharField(choices=[('course_enrollment', 'Course Enrollment'), ('course_completion', 'Course Completion'), ('lesson_completion', 'Lesson Completion'), ('quiz_attempt', 'Quiz Attempt'), ('assignment_submission', 'Assignment Submission'), ('forum_activity', 'Forum Activity'), ('user_engagement', 'User Engagement')], max_length=25)),
+                ('day', models.DateField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('value_sum', models.FloatField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='analytics',
+            index=models.Index(fields=['analytics_type', 'date_recorded'], name='analytics_type_date_idx'),
+        ),
+        migrations.AddField(
+            model_name='analyticsdailyrollup',
+            name='course',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='analytics_rollups', to='core.course'),
+        ),
+        migrations.AddIndex(
+            model_name='analyticsdailyrollup',
+            index=models.Index(fields=['day', 'analytics_type', 'count'], name='analytics_rollup_day_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='analyticsdailyrollup',
+            constraint=models.UniqueConstraint(condition=models.Q(('course__isnull', False)), fields=('course', 'analytics_type', 'day'), name='analytics_rollup_course_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='analyticsdailyrollup',
+            constraint=models.UniqueConstraint(condition=models.Q(('course__isnull', True)), fields=('analytics_type', 'day'), name='analytics_rollup_sitewide_uniq'),
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
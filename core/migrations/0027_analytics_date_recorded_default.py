@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-19 02:38
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0026_analytics_daily_rollup'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='analytics',
+            name='date_recorded',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
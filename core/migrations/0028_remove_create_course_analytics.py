@@ -0,0 +1,40 @@
+from django.core.cache import cache
+from django.db import migrations
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def remove_create_course_events(apps, schema_editor):
+    """create_course used to log a course_enrollment event; drop those and recount the rollups."""
+    Analytics = apps.get_model('core', 'Analytics')
+    AnalyticsDailyRollup = apps.get_model('core', 'AnalyticsDailyRollup')
+    if not Analytics.objects.filter(metadata__action='create_course').delete()[0]:
+        return
+    rows = (
+        Analytics.objects.annotate(day=TruncDate('date_recorded'))
+        .values('course_id', 'analytics_type', 'day')
+        .annotate(count=Count('id'), value_sum=Sum('value'))
+        .order_by()
+    )
+    AnalyticsDailyRollup.objects.all().delete()
+    AnalyticsDailyRollup.objects.bulk_create(
+        (AnalyticsDailyRollup(**row) for row in rows.iterator()),
+        batch_size=5_000
+    )
+    # Bump the ``analytics`` cache namespace so cached closed-day totals that
+    # still count the deleted events are dropped (key copied from core.caching)
+    try:
+        cache.incr('ns-version:analytics')
+    except ValueError:
+        cache.set('ns-version:analytics', 2, timeout=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0027_analytics_date_recorded_default'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_create_course_events, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,7 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 from django.urls import reverse
+from django.utils.text import slugify
 from django.utils.timezone import now
 
 class CustomUser(AbstractUser):
@@ -28,13 +29,27 @@ class CustomUser(AbstractUser):
 
 class Category(models.Model):
     name = models.CharField(max_length=100, unique=True)
+    slug = models.SlugField(max_length=100, unique=True, blank=True)
     description = models.TextField(blank=True)
     
+    # Active courses in this category, kept current by signals so the
+    # catalog can show facet counts without a GROUP BY per request
+    course_count = models.PositiveIntegerField(default=0, editable=False)
+    
     class Meta:
         verbose_name_plural = "Categories"
+        ordering = ['name']
     
     def __str__(self):
         return self.name
+    
+    def save(self, *args, **kwargs):
+        if not self.slug:
+            base = slugify(self.name) or 'category'
+            self.slug, suffix = base, 2
+            while Category.objects.filter(slug=self.slug).exclude(pk=self.pk).exists():
+                self.slug, suffix = f'{base}-{suffix}', suffix + 1
+        super().save(*args, **kwargs)
 
 class Course(models.Model):
     title = models.CharField(max_length=200)
@@ -46,6 +61,12 @@ class Course(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
     
+    class Meta:
+        indexes = [
+            # Catalog listing order, also used by course_list's keyset pages
+            models.Index(fields=['is_active', '-created_at', '-id'], name='course_catalog_idx'),
+        ]
+    
     def __str__(self):
         return self.title
     
@@ -188,6 +209,26 @@ class Enrollment(models.Model):
             return 0
         return int((completed / total_lessons) * 100)
 
+class CourseRecommendation(models.Model):
+    """
+    "Students who took this also took": the nearest neighbours of a course by
+    cosine similarity of enrollments, rebuilt offline by the
+    build_recommendations command.
+    """
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='recommendations')
+    recommended = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+    
+    class Meta:
+        ordering = ['course', 'rank']
+        constraints = [
+            models.UniqueConstraint(fields=['course', 'rank'], name='unique_recommendation_rank'),
+        ]
+    
+    def __str__(self):
+        return f"{self.course} -> {self.recommended} ({self.score:.3f})"
+
 class Assignment(models.Model):
     lesson = models.OneToOneField(Lesson, on_delete=models.CASCADE, related_name='assignment')
     title = models.CharField(max_length=200)
@@ -226,6 +267,14 @@ class Grade(models.Model):
         ('exam', 'Exam'),
     ])
     
+    class Meta:
+        constraints = [
+            # One grade per enrollment and graded item. NULLs are distinct in
+            # unique indexes, so exam grades (no assignment/quiz) are unaffected.
+            models.UniqueConstraint(fields=['enrollment', 'assignment'], name='unique_assignment_grade'),
+            models.UniqueConstraint(fields=['enrollment', 'quiz'], name='unique_quiz_grade'),
+        ]
+    
     def percentage(self):
         if self.max_points > 0:
             return (self.score / self.max_points) * 100
@@ -282,11 +331,29 @@ class Topic(models.Model):
     is_pinned = models.BooleanField(default=False)
     is_closed = models.BooleanField(default=False)
     
+    # Denormalized activity stats, maintained by create_post so topic lists
+    # never have to touch the posts table
+    reply_count = models.PositiveIntegerField(default=0)
+    last_post_position = models.PositiveIntegerField(default=0)
+    last_post_at = models.DateTimeField(default=now)
+    last_post_author = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    
     class Meta:
-        ordering = ['-is_pinned', '-created_at']
+        ordering = ['-is_pinned', '-last_post_at', '-id']
+        indexes = [
+            models.Index(fields=['forum', '-is_pinned', '-last_post_at', '-id'], name='topic_forum_activity_idx'),
+        ]
     
     def __str__(self):
         return self.title
+    
+    # Replies shown per page of topic_detail. Pages are fixed ranges of
+    # Post.position, so a page only changes when one of its own posts does.
+    POSTS_PER_PAGE = 20
+    
+    @classmethod
+    def page_for_position(cls, position):
+        return max(1, (position + cls.POSTS_PER_PAGE - 1) // cls.POSTS_PER_PAGE)
 
 class Post(models.Model):
     topic = models.ForeignKey(Topic, on_delete=models.CASCADE, related_name='posts')
@@ -295,9 +362,26 @@ class Post(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     is_edited = models.BooleanField(default=False)
+    # 1-based reply number within the topic (never reused after a delete)
+    position = models.PositiveIntegerField(default=0)
     
     class Meta:
-        ordering = ['created_at']
+        ordering = ['position']
+        constraints = [
+            models.UniqueConstraint(fields=['topic', 'position'], name='unique_post_position'),
+        ]
+    
+    def save(self, *args, **kwargs):
+        # create_post numbers replies itself; this covers posts made elsewhere (e.g. admin)
+        if not self.position:
+            last_position = Post.objects.filter(topic=self.topic_id).order_by('-position').values_list('position', flat=True).first()
+            self.position = (last_position or 0) + 1
+            Topic.objects.filter(pk=self.topic_id, last_post_position__lt=self.position).update(last_post_position=self.position)
+        super().save(*args, **kwargs)
+    
+    @property
+    def page_number(self):
+        return Topic.page_for_position(self.position)
 
 class TopicTag(models.Model):
     name = models.CharField(max_length=50, unique=True)
@@ -312,6 +396,47 @@ class TopicTagging(models.Model):
     
     class Meta:
         unique_together = ('topic', 'tag')
+        indexes = [
+            # Tag filters walk tag -> topics; the unique constraint covers topic -> tags
+            models.Index(fields=['tag', 'topic'], name='topictagging_tag_topic_idx'),
+        ]
+
+class ForumTagCount(models.Model):
+    """Number of topics carrying each tag in a forum, kept current by signals."""
+    forum = models.ForeignKey(Forum, on_delete=models.CASCADE, related_name='tag_counts')
+    tag = models.ForeignKey(TopicTag, on_delete=models.CASCADE, related_name='forum_counts')
+    topic_count = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        unique_together = ('forum', 'tag')
+        ordering = ['-topic_count', 'tag__name']
+    
+    def __str__(self):
+        return f"{self.tag.name} in {self.forum} ({self.topic_count})"
+
+class ForumReadState(models.Model):
+    """
+    What a user has read in one forum: every topic whose last activity is at or
+    before ``read_all_before`` counts as read, and ``topic_marks`` sparsely
+    records the last-read reply position ({topic_id: position}) of newer topics.
+    """
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='forum_read_states')
+    forum = models.ForeignKey(Forum, on_delete=models.CASCADE, related_name='read_states')
+    read_all_before = models.DateTimeField(default=now)
+    topic_marks = models.JSONField(default=dict, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        unique_together = ('user', 'forum')
+    
+    def unread_count(self, topic):
+        """Replies in ``topic`` newer than the user's mark, or None if never opened."""
+        if topic.last_post_at <= self.read_all_before:
+            return 0
+        mark = self.topic_marks.get(str(topic.pk))
+        if mark is None:
+            return None
+        return max(topic.last_post_position - mark, 0)
 
 class Certificate(models.Model):
     enrollment = models.OneToOneField(Enrollment, on_delete=models.CASCADE, related_name='certificate')
@@ -322,10 +447,20 @@ class Certificate(models.Model):
     issued_at = models.DateTimeField(auto_now_add=True)
     is_active = models.BooleanField(default=True)
     
+    # Stored rendering and the fingerprint of the inputs it was drawn from
+    # (see core.certificates)
+    pdf_file = models.FileField(upload_to='certificates/pdf/', blank=True, editable=False)
+    pdf_hash = models.CharField(max_length=64, blank=True, editable=False)
+    pdf_rendered_at = models.DateTimeField(null=True, blank=True, editable=False)
+    
+    @staticmethod
+    def generate_certificate_id():
+        import random, string
+        return ''.join(random.choices(string.ascii_uppercase + string.digits, k=10))
+    
     def save(self, *args, **kwargs):
         if not self.certificate_id:
-            import random, string
-            self.certificate_id = ''.join(random.choices(string.ascii_uppercase + string.digits, k=10))
+            self.certificate_id = self.generate_certificate_id()
         
         # Default to user's registered name if full_name isn't provided yet
         if not self.full_name and self.enrollment:
@@ -348,6 +483,12 @@ class CertificateTemplate(models.Model):
     text_color = models.CharField(max_length=7, default='#000000')
     is_active = models.BooleanField(default=True)
 
+    def save(self, *args, **kwargs):
+        # Store new uploads downsized to print resolution (see core.certificates)
+        from .certificates import normalize_template_images
+        normalize_template_images(self)
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"Template for {self.course.title}"
 
@@ -402,12 +543,49 @@ class Analytics(models.Model):
     analytics_type = models.CharField(max_length=25, choices=ANALYTICS_TYPES)
     course = models.ForeignKey(Course, on_delete=models.CASCADE, null=True, blank=True)
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, null=True, blank=True)
-    date_recorded = models.DateTimeField(auto_now_add=True)
+    # Set when the event happens, not when the buffered row is written (see core.analytics)
+    date_recorded = models.DateTimeField(default=now)
     value = models.FloatField(default=1.0)
     metadata = models.JSONField(default=dict, blank=True)
     
     class Meta:
         ordering = ['-date_recorded']
+        indexes = [
+            models.Index(fields=['analytics_type', 'date_recorded'], name='analytics_type_date_idx'),
+        ]
+
+class AnalyticsDailyRollup(models.Model):
+    """
+    Analytics events per course, type and day, updated as events are logged
+    (see core.analytics) so dashboards never scan the raw Analytics table.
+    Events without a course are counted in rows with no course.
+    """
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, null=True, blank=True, related_name='analytics_rollups')
+    analytics_type = models.CharField(max_length=25, choices=Analytics.ANALYTICS_TYPES)
+    day = models.DateField()
+    count = models.PositiveIntegerField(default=0)
+    value_sum = models.FloatField(default=0)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['course', 'analytics_type', 'day'],
+                condition=models.Q(course__isnull=False),
+                name='analytics_rollup_course_uniq'
+            ),
+            models.UniqueConstraint(
+                fields=['analytics_type', 'day'],
+                condition=models.Q(course__isnull=True),
+                name='analytics_rollup_sitewide_uniq'
+            ),
+        ]
+        indexes = [
+            # Covers the dashboard's per-day aggregates without touching the table
+            models.Index(fields=['day', 'analytics_type', 'count'], name='analytics_rollup_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.analytics_type} on {self.day}: {self.count}"
 
 class Report(models.Model):
     REPORT_TYPES = [
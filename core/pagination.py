@@ -0,0 +1,26 @@
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.utils.functional import cached_property
+
+
+class CachedCountPaginator(Paginator):
+    """
+    Paginator that caches the total row count under ``cache_key``.
+
+    Counting the whole filtered set is the one part of offset pagination
+    whose cost grows with the table; every page fetch itself is a LIMIT
+    query. Use a versioned_key() so writes can invalidate the count.
+    """
+
+    def __init__(self, object_list, per_page, cache_key, timeout=300, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.cache_key = cache_key
+        self.timeout = timeout
+
+    @cached_property
+    def count(self):
+        count = cache.get(self.cache_key)
+        if count is None:
+            count = Paginator.count.func(self)
+            cache.set(self.cache_key, count, self.timeout)
+        return count
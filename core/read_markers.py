@@ -0,0 +1,113 @@
+"""
+Per-user forum read markers ("N new" badges).
+
+The durable state is one ForumReadState row per (user, forum). Opening a
+topic does not write it directly: marks are collected in the cache and
+flushed to the row at most once every READ_MARK_FLUSH_SECONDS. Reads always
+merge the pending marks, so badges are never stale, while a user paging
+through a thread costs at most one database write per flush interval.
+"""
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import ForumReadState, Topic
+from .upsert import upsert
+
+READ_MARK_FLUSH_SECONDS = 60
+
+# Keep the sparse per-topic map bounded; older entries fall back to the high-water mark
+MAX_TOPIC_MARKS = 500
+
+
+def _pending_key(user_id, forum_id):
+    return f'forum_read:{user_id}:{forum_id}'
+
+
+def _merge_marks(stored, pending):
+    marks = dict(stored)
+    for topic_id, position in pending.items():
+        if position > marks.get(topic_id, -1):
+            marks[topic_id] = position
+    return marks
+
+
+def flush_read_marks(user_id, forum_id, pending):
+    """Write cached marks into the user's ForumReadState with one upsert."""
+    state = ForumReadState.objects.filter(user_id=user_id, forum_id=forum_id).first()
+    if state is not None:
+        read_all_before = state.read_all_before
+        marks = _merge_marks(state.topic_marks, pending['marks'])
+    else:
+        read_all_before = datetime.fromtimestamp(pending['since'], tz=dt_timezone.utc)
+        marks = dict(pending['marks'])
+
+    if len(marks) > MAX_TOPIC_MARKS:
+        # Topics that went quiet before the high-water mark no longer need an entry
+        active = Topic.objects.filter(pk__in=[int(pk) for pk in marks], last_post_at__gt=read_all_before)
+        keep = {str(pk) for pk in active.values_list('pk', flat=True)}
+        marks = {pk: position for pk, position in marks.items() if pk in keep}
+        if len(marks) > MAX_TOPIC_MARKS:
+            newest = sorted(marks, key=int)[-MAX_TOPIC_MARKS:]
+            marks = {pk: marks[pk] for pk in newest}
+
+    upsert(
+        ForumReadState(user_id=user_id, forum_id=forum_id, read_all_before=read_all_before, topic_marks=marks),
+        unique_fields=['user', 'forum'],
+        update_fields=['topic_marks']
+    )
+    cache.delete(_pending_key(user_id, forum_id))
+
+
+def mark_topic_read(user, topic, position):
+    """Record that ``user`` has read ``topic`` up to reply ``position``."""
+    key = _pending_key(user.pk, topic.forum_id)
+    pending = cache.get(key) or {'marks': {}, 'since': time.time()}
+    topic_key = str(topic.pk)
+    if pending['marks'].get(topic_key, -1) >= position:
+        return
+
+    pending['marks'][topic_key] = position
+    if time.time() - pending['since'] >= READ_MARK_FLUSH_SECONDS:
+        flush_read_marks(user.pk, topic.forum_id, pending)
+    else:
+        cache.set(key, pending, timeout=24 * 60 * 60)
+
+
+def mark_forum_read(user, forum):
+    """Mark every topic in ``forum`` as read by moving the high-water mark to now."""
+    upsert(
+        ForumReadState(user=user, forum=forum, read_all_before=timezone.now(), topic_marks={}),
+        unique_fields=['user', 'forum'],
+        update_fields=['read_all_before', 'topic_marks']
+    )
+    cache.delete(_pending_key(user.pk, forum.pk))
+
+
+def get_read_state(user, forum):
+    """The user's read state with pending marks merged in, or None before any visit."""
+    pending = cache.get(_pending_key(user.pk, forum.pk))
+    if pending is not None and time.time() - pending['since'] >= READ_MARK_FLUSH_SECONDS:
+        flush_read_marks(user.pk, forum.pk, pending)
+        pending = None
+
+    state = ForumReadState.objects.filter(user=user, forum=forum).first()
+    if pending is None:
+        return state
+    if state is None:
+        since = datetime.fromtimestamp(pending['since'], tz=dt_timezone.utc)
+        return ForumReadState(user=user, forum=forum, read_all_before=since, topic_marks=pending['marks'])
+    state.topic_marks = _merge_marks(state.topic_marks, pending['marks'])
+    return state
+
+
+def annotate_unread(user, forum, topics):
+    """Set ``unread_count`` and ``is_unvisited`` on each topic for the badges."""
+    state = get_read_state(user, forum)
+    for topic in topics:
+        count = state.unread_count(topic) if state is not None else 0
+        topic.is_unvisited = count is None
+        topic.unread_count = count or 0
+    return topics
@@ -0,0 +1,63 @@
+"""
+"Students who took this also took" recommendations from co-enrollment.
+
+Think of enrollments as a sparse 0/1 matrix A with a row per student and a
+column per course. Two courses are similar when the cosine of their columns
+is high:
+
+    sim(i, j) = co(i, j) / sqrt(n(i) * n(j))
+
+where co = AᵀA counts the students enrolled in both courses and n(i) is the
+number of students in course i. The product is built one course row at a
+time from inverted lists (course -> students -> courses), with
+Counter.update doing the counting in C. Memory therefore stays proportional
+to the number of enrollments rather than to courses², and the work is
+Σ d² over students, where d is a student's number of courses.
+"""
+import heapq
+import math
+from collections import Counter, defaultdict
+from operator import itemgetter
+
+# Students enrolled in more courses than this only contribute the first
+# courses they enrolled in; a handful of "collect everything" accounts would otherwise dominate
+# both the run time (d²) and the similarities.
+MAX_COURSES_PER_STUDENT = 200
+
+
+def course_neighbours(enrollments, top_n=10, min_common=2):
+    """
+    Yield ``(course_id, [(other_course_id, score), ...])`` with each course's
+    ``top_n`` most similar courses, best first. ``enrollments`` is an iterable
+    of ``(student_id, course_id)`` pairs in enrollment order, which decides
+    the courses kept for students over MAX_COURSES_PER_STUDENT; pairs of
+    courses sharing fewer than ``min_common`` students are ignored as noise.
+    """
+    by_student = defaultdict(list)
+    for student_id, course_id in enrollments:
+        by_student[student_id].append(course_id)
+
+    students_per_course = Counter()
+    by_course = defaultdict(list)
+    for student_id, courses in by_student.items():
+        courses = courses[:MAX_COURSES_PER_STUDENT]
+        by_student[student_id] = courses
+        students_per_course.update(courses)
+        if len(courses) > 1:
+            for course_id in courses:
+                by_course[course_id].append(student_id)
+
+    for course_id, students in by_course.items():
+        co = Counter()
+        for student_id in students:
+            co.update(by_student[student_id])
+        del co[course_id]
+
+        norm = students_per_course[course_id]
+        scored = (
+            (other_id, shared / math.sqrt(norm * students_per_course[other_id]))
+            for other_id, shared in co.items() if shared >= min_common
+        )
+        neighbours = heapq.nlargest(top_n, scored, key=itemgetter(1))
+        if neighbours:
+            yield course_id, neighbours
@@ -0,0 +1,7 @@
+from django.urls import path
+
+from . import consumers
+
+websocket_urlpatterns = [
+    path('ws/topic/<int:topic_pk>/', consumers.TopicConsumer.as_asgi()),
+]
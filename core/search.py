@@ -0,0 +1,205 @@
+"""
+Full-text search for course forums.
+
+On SQLite, topics and posts are indexed in an FTS5 virtual table that
+triggers keep in sync with core_topic and core_post. Results are ranked with
+BM25, with title matches weighted above body matches. On other databases,
+search_forum() falls back to a plain icontains scan, so the feature still
+works there, just without ranking.
+
+Row ids in the index encode the source row: a topic is stored as -topic.id
+and a post as +post.id. That way every trigger touches the index through
+its rowid B-tree instead of scanning it.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+FORUM_SEARCH_TABLE = 'core_forumsearch'
+
+# Markers wrapped around matched terms by snippet(); swapped for <mark> after
+# the snippet has been HTML-escaped, so user content can never inject markup.
+HIGHLIGHT_START = '\x02'
+HIGHLIGHT_END = '\x03'
+
+FORUM_SEARCH_DDL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FORUM_SEARCH_TABLE} USING fts5(
+        scope, title, body, topic_id UNINDEXED, position UNINDEXED,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS core_topic_search_insert AFTER INSERT ON core_topic BEGIN
+        INSERT INTO {FORUM_SEARCH_TABLE} (rowid, scope, title, body, topic_id, position)
+        VALUES (-new.id, 'f' || new.forum_id, new.title, new.content, new.id, 0);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS core_topic_search_update AFTER UPDATE OF title, content, forum_id ON core_topic BEGIN
+        DELETE FROM {FORUM_SEARCH_TABLE} WHERE rowid = -old.id;
+        INSERT INTO {FORUM_SEARCH_TABLE} (rowid, scope, title, body, topic_id, position)
+        VALUES (-new.id, 'f' || new.forum_id, new.title, new.content, new.id, 0);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS core_topic_search_delete AFTER DELETE ON core_topic BEGIN
+        DELETE FROM {FORUM_SEARCH_TABLE} WHERE rowid = -old.id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS core_post_search_insert AFTER INSERT ON core_post BEGIN
+        INSERT INTO {FORUM_SEARCH_TABLE} (rowid, scope, title, body, topic_id, position)
+        SELECT new.id, 'f' || forum_id, '', new.content, new.topic_id, new.position
+        FROM core_topic WHERE id = new.topic_id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS core_post_search_update AFTER UPDATE OF content, position ON core_post BEGIN
+        DELETE FROM {FORUM_SEARCH_TABLE} WHERE rowid = old.id;
+        INSERT INTO {FORUM_SEARCH_TABLE} (rowid, scope, title, body, topic_id, position)
+        SELECT new.id, 'f' || forum_id, '', new.content, new.topic_id, new.position
+        FROM core_topic WHERE id = new.topic_id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS core_post_search_delete AFTER DELETE ON core_post BEGIN
+        DELETE FROM {FORUM_SEARCH_TABLE} WHERE rowid = old.id;
+    END""",
+]
+
+FORUM_SEARCH_TRIGGERS = [
+    'core_topic_search_insert',
+    'core_topic_search_update',
+    'core_topic_search_delete',
+    'core_post_search_insert',
+    'core_post_search_update',
+    'core_post_search_delete',
+]
+
+FORUM_SEARCH_DROP = [
+    *(f'DROP TRIGGER IF EXISTS {name}' for name in FORUM_SEARCH_TRIGGERS),
+    f'DROP TABLE IF EXISTS {FORUM_SEARCH_TABLE}',
+]
+
+FORUM_SEARCH_REBUILD = [
+    f'DELETE FROM {FORUM_SEARCH_TABLE}',
+    f"""INSERT INTO {FORUM_SEARCH_TABLE} (rowid, scope, title, body, topic_id, position)
+        SELECT -id, 'f' || forum_id, title, content, id, 0 FROM core_topic""",
+    f"""INSERT INTO {FORUM_SEARCH_TABLE} (rowid, scope, title, body, topic_id, position)
+        SELECT p.id, 'f' || t.forum_id, '', p.content, p.topic_id, p.position
+        FROM core_post p JOIN core_topic t ON t.id = p.topic_id""",
+    f"INSERT INTO {FORUM_SEARCH_TABLE} ({FORUM_SEARCH_TABLE}) VALUES ('optimize')",
+]
+
+# Title hits count ten times as much as body hits (scope carries no weight)
+FORUM_SEARCH_QUERY = f"""
+    SELECT topic_id, position,
+           snippet({FORUM_SEARCH_TABLE}, 1, %s, %s, '...', 12),
+           snippet({FORUM_SEARCH_TABLE}, 2, %s, %s, '...', 24)
+    FROM {FORUM_SEARCH_TABLE}
+    WHERE {FORUM_SEARCH_TABLE} MATCH %s
+    ORDER BY bm25({FORUM_SEARCH_TABLE}, 0.0, 10.0, 1.0)
+    LIMIT %s
+"""
+
+
+def has_fts5(conn=connection):
+    return conn.vendor == 'sqlite'
+
+
+def install_forum_search(cursor):
+    """Create the FTS5 table and its sync triggers (idempotent)."""
+    for statement in FORUM_SEARCH_DDL:
+        cursor.execute(statement)
+
+
+def suspend_forum_search_triggers(cursor):
+    """
+    Drop the sync triggers (keeping the index). SQLite rebuilds a table to
+    alter it, and the post triggers reference core_topic, so migrations that
+    alter core_topic or core_post must run between suspend and resume.
+    """
+    for name in FORUM_SEARCH_TRIGGERS:
+        cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+
+
+def resume_forum_search_triggers(cursor):
+    """Re-create the sync triggers dropped by suspend_forum_search_triggers()."""
+    for statement in FORUM_SEARCH_DDL[1:]:
+        cursor.execute(statement)
+
+
+def rebuild_forum_search(cursor):
+    """Re-index every topic and post from scratch."""
+    for statement in FORUM_SEARCH_REBUILD:
+        cursor.execute(statement)
+
+
+def fts_terms(query):
+    """
+    Quote the words of free text as an FTS5 phrase list: every word must
+    match, the last one as a prefix (for search-as-you-type). Returns None
+    when the text has no searchable words.
+    """
+    terms = re.findall(r'\w+', query)
+    if not terms:
+        return None
+    return ' '.join(f'"{term}"' for term in terms) + '*'
+
+
+def build_match_expression(forum_id, query):
+    """FTS5 expression for ``query`` restricted to the given forum."""
+    words = fts_terms(query)
+    if words is None:
+        return None
+    return f'scope : "f{forum_id}" AND {{title body}} : ({words})'
+
+
+def highlight(snippet):
+    text = escape(snippet)
+    return mark_safe(text.replace(HIGHLIGHT_START, '<mark>').replace(HIGHLIGHT_END, '</mark>'))
+
+
+def search_forum(forum, query, limit=50):
+    """
+    Return up to ``limit`` hits for ``query`` in ``forum``, best first.
+
+    Each hit is a dict with the ``topic``, the reply ``position`` (0 for the
+    topic itself) and a highlighted ``snippet``.
+    """
+    from .models import Topic
+
+    if not has_fts5():
+        return _search_forum_fallback(forum, query, limit)
+
+    expression = build_match_expression(forum.pk, query)
+    if expression is None:
+        return []
+
+    with connection.cursor() as cursor:
+        cursor.execute(FORUM_SEARCH_QUERY, [
+            HIGHLIGHT_START, HIGHLIGHT_END, HIGHLIGHT_START, HIGHLIGHT_END, expression, limit,
+        ])
+        rows = cursor.fetchall()
+
+    topics = Topic.objects.select_related('author').in_bulk({row[0] for row in rows})
+    hits = []
+    for topic_id, position, title_snippet, body_snippet in rows:
+        if topic_id not in topics:
+            continue
+        snippet = title_snippet if HIGHLIGHT_START in title_snippet else body_snippet
+        hits.append({
+            'topic': topics[topic_id],
+            'position': position,
+            'snippet': highlight(snippet),
+        })
+    return hits
+
+
+def _search_forum_fallback(forum, query, limit):
+    from .models import Topic, Post
+
+    query = query.strip()
+    if not query:
+        return []
+    hits = []
+    for topic in Topic.objects.filter(
+        Q(title__icontains=query) | Q(content__icontains=query), forum=forum
+    ).select_related('author')[:limit]:
+        hits.append({'topic': topic, 'position': 0, 'snippet': escape(topic.title)})
+    for post in Post.objects.filter(
+        topic__forum=forum, content__icontains=query
+    ).select_related('topic__author')[:limit - len(hits)]:
+        hits.append({'topic': post.topic, 'position': post.position, 'snippet': escape(post.content[:200])})
+    return hits
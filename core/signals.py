@@ -1,7 +1,23 @@
-from django.db.models.signals import post_save
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.db.models import F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+from django.contrib.auth.signals import user_logged_in
+from django.core.signals import request_finished
+from django.db.models.signals import m2m_changed, post_save, post_delete, pre_delete, pre_save
 from django.dispatch import receiver
 from django.contrib.auth import get_user_model
 
+from .analytics import event_buffer, log_event_on_commit
+from .caching import bump_namespace
+from .catalog_search import get_catalog_backend
+from .certificates import invalidate_certificate_verification
+from .models import (
+    Assignment, Category, Certificate, Course, Enrollment, Forum, ForumTagCount, Lesson, Module, Post, Quiz,
+    QuizAttempt, Submission, Topic, TopicTagging,
+)
+from .upsert import upsert
+
 User = get_user_model()
 
 
@@ -9,3 +25,230 @@ User = get_user_model()
 def user_created(sender, instance, created, **kwargs):
     if created:
         pass  # later logic here
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_topic_page(sender, instance, **kwargs):
+    """Drop the cached topic_detail fragment for the page this post sits on."""
+    cache.delete(make_template_fragment_key('topic_posts', [instance.topic_id, instance.page_number]))
+
+
+@receiver(post_delete, sender=Post)
+def decrement_reply_count(sender, instance, **kwargs):
+    # The last reply may be the one deleted: point the stats at the newest
+    # remaining reply, or back at the topic itself when none is left
+    latest = Post.objects.filter(topic=OuterRef('pk')).order_by('-position')
+    Topic.objects.filter(pk=instance.topic_id).update(
+        reply_count=Greatest(F('reply_count') - 1, 0),
+        last_post_at=Coalesce(Subquery(latest.values('created_at')[:1]), F('created_at')),
+        last_post_author=Subquery(latest.values('author')[:1]),
+    )
+
+
+@receiver(post_save, sender=TopicTagging)
+def increment_tag_count(sender, instance, created, **kwargs):
+    if created:
+        upsert(
+            ForumTagCount(forum_id=instance.topic.forum_id, tag_id=instance.tag_id, topic_count=1),
+            unique_fields=['forum', 'tag'],
+            increment_fields=['topic_count']
+        )
+
+
+@receiver(post_delete, sender=TopicTagging)
+def decrement_tag_count(sender, instance, **kwargs):
+    # Taggings are deleted before their topic on cascade, so the join still resolves
+    ForumTagCount.objects.filter(
+        forum__topics=instance.topic_id, tag_id=instance.tag_id, topic_count__gt=0
+    ).update(topic_count=F('topic_count') - 1)
+
+
+@receiver(post_save, sender=Course)
+def index_course(sender, instance, **kwargs):
+    get_catalog_backend().index_course(instance.pk)
+
+
+@receiver(post_delete, sender=Course)
+def unindex_course(sender, instance, **kwargs):
+    get_catalog_backend().remove_course(instance.pk)
+
+
+@receiver(post_save, sender=Lesson)
+@receiver(post_delete, sender=Lesson)
+def reindex_lesson_course(sender, instance, **kwargs):
+    get_catalog_backend().index_course(instance.module.course_id)
+
+
+@receiver(post_save, sender=Category)
+def reindex_category_courses(sender, instance, created, **kwargs):
+    if not created:
+        backend = get_catalog_backend()
+        for course_id in instance.course_set.values_list('pk', flat=True):
+            backend.index_course(course_id)
+
+
+@receiver(pre_delete, sender=Category)
+def remember_category_courses(sender, instance, **kwargs):
+    # Courses are detached with a bulk UPDATE (SET_NULL), so note them beforehand
+    instance._course_ids = list(instance.course_set.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Category)
+def reindex_detached_courses(sender, instance, **kwargs):
+    backend = get_catalog_backend()
+    for course_id in getattr(instance, '_course_ids', ()):
+        backend.index_course(course_id)
+
+
+@receiver(pre_save, sender=Course)
+def remember_course_category(sender, instance, **kwargs):
+    # Category moves and (de)activation touch the old category's listings and count
+    instance._old_catalog_state = (
+        Course.objects.filter(pk=instance.pk).values_list('category_id', 'is_active').first()
+        if instance.pk else None
+    )
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+def invalidate_course_pages(sender, instance, **kwargs):
+    """Orphan cached pages and counts that show this course (see core.caching)."""
+    namespaces = {'courses', 'search', f'course:{instance.pk}', f'category:{instance.category_id}'}
+    old_state = getattr(instance, '_old_catalog_state', None)
+    if old_state is not None:
+        namespaces.add(f'category:{old_state[0]}')
+    bump_namespace(*namespaces)
+
+
+@receiver(post_save, sender=Course)
+def update_category_course_counts(sender, instance, created, **kwargs):
+    # The category each version of the course is counted in (None when inactive)
+    old_state = getattr(instance, '_old_catalog_state', None)
+    old_category_id = old_state[0] if old_state is not None and old_state[1] else None
+    new_category_id = instance.category_id if instance.is_active else None
+    if old_category_id == new_category_id:
+        return
+    if old_category_id is not None:
+        Category.objects.filter(pk=old_category_id, course_count__gt=0).update(course_count=F('course_count') - 1)
+    if new_category_id is not None:
+        Category.objects.filter(pk=new_category_id).update(course_count=F('course_count') + 1)
+    # Every listing's sidebar shows the counts
+    bump_namespace('categories')
+
+
+@receiver(post_delete, sender=Course)
+def decrement_category_course_count(sender, instance, **kwargs):
+    if instance.is_active and instance.category_id is not None:
+        Category.objects.filter(pk=instance.category_id, course_count__gt=0).update(course_count=F('course_count') - 1)
+        bump_namespace('categories')
+
+
+@receiver(post_save, sender=Module)
+@receiver(post_delete, sender=Module)
+def invalidate_module_course(sender, instance, **kwargs):
+    bump_namespace(f'course:{instance.course_id}')
+
+
+@receiver(post_save, sender=Lesson)
+@receiver(post_delete, sender=Lesson)
+def invalidate_lesson_course(sender, instance, **kwargs):
+    # Lesson titles are part of the catalog search index
+    bump_namespace(f'course:{instance.module.course_id}', 'search')
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_pages(sender, instance, **kwargs):
+    bump_namespace('categories', 'search', f'category:{instance.pk}')
+
+
+@receiver(post_save, sender=Certificate)
+@receiver(post_delete, sender=Certificate)
+def invalidate_certificate_verify_page(sender, instance, **kwargs):
+    """Revocations and name corrections show up on verify_certificate at once."""
+    invalidate_certificate_verification(instance.certificate_id)
+
+
+# Analytics events. Each is logged once, from the write that causes it, and
+# only after that write commits; the buffer writes them all when the request
+# finishes (see core.analytics). Enrollments made by enroll_course and course
+# completions (issue_certificate) are upserts that skip post_save, so those
+# views log them directly.
+
+@receiver(post_save, sender=Enrollment)
+def log_enrollment(sender, instance, created, **kwargs):
+    if created:
+        log_event_on_commit('course_enrollment', course_id=instance.course_id, user_id=instance.student_id)
+
+
+@receiver(m2m_changed, sender=Enrollment.completed_lessons.through)
+def log_lesson_completions(sender, instance, action, reverse, pk_set, **kwargs):
+    # pk_set only holds the lessons that were not completed yet
+    if action != 'post_add' or not pk_set:
+        return
+    if reverse:
+        enrollments = Enrollment.objects.filter(pk__in=pk_set).values_list('course_id', 'student_id')
+        for course_id, student_id in enrollments:
+            log_event_on_commit('lesson_completion', course_id=course_id, user_id=student_id,
+                                metadata={'lesson': instance.pk})
+    else:
+        for lesson_pk in pk_set:
+            log_event_on_commit('lesson_completion', course_id=instance.course_id, user_id=instance.student_id,
+                                metadata={'lesson': lesson_pk})
+
+
+@receiver(post_save, sender=QuizAttempt)
+def log_quiz_attempt(sender, instance, created, **kwargs):
+    if created:
+        course_id = (
+            Quiz.objects.filter(pk=instance.quiz_id).values_list('lesson__module__course_id', flat=True).get()
+        )
+        # submit_quiz stores the score after creating the attempt, so read it on commit
+        log_event_on_commit(
+            'quiz_attempt', course_id=course_id, user_id=instance.student_id, value=lambda: instance.score,
+            metadata={'quiz': instance.quiz_id, 'attempt': instance.attempt_number}
+        )
+
+
+@receiver(post_save, sender=Submission)
+def log_submission(sender, instance, created, **kwargs):
+    if created:
+        course_id = (
+            Assignment.objects.filter(pk=instance.assignment_id)
+            .values_list('lesson__module__course_id', flat=True).get()
+        )
+        log_event_on_commit(
+            'assignment_submission', course_id=course_id, user_id=instance.student_id,
+            metadata={'assignment': instance.assignment_id}
+        )
+
+
+@receiver(post_save, sender=Topic)
+def log_topic(sender, instance, created, **kwargs):
+    if created:
+        course_id = Forum.objects.filter(pk=instance.forum_id).values_list('course_id', flat=True).get()
+        log_event_on_commit(
+            'forum_activity', course_id=course_id, user_id=instance.author_id, metadata={'topic': instance.pk}
+        )
+
+
+@receiver(post_save, sender=Post)
+def log_post(sender, instance, created, **kwargs):
+    if created:
+        course_id = Topic.objects.filter(pk=instance.topic_id).values_list('forum__course_id', flat=True).get()
+        log_event_on_commit(
+            'forum_activity', course_id=course_id, user_id=instance.author_id,
+            metadata={'topic': instance.topic_id, 'post': instance.pk}
+        )
+
+
+@receiver(user_logged_in)
+def log_login(sender, request, user, **kwargs):
+    log_event_on_commit('user_engagement', user_id=user.pk, metadata={'action': 'login'})
+
+
+@receiver(request_finished)
+def flush_analytics_events(sender, **kwargs):
+    """Write the analytics events buffered during the request, after its response was sent."""
+    event_buffer.flush()
@@ -0,0 +1,218 @@
+"""
+Columnar snapshots of analytics tables for offline analysis.
+
+Each table is exported to a directory of parts, one per ``chunk_size`` rows
+in id order, and each part holds one NumPy ``.npy`` file per column:
+
+    <output>/manifest.json
+    <output>/analytics/part-0000-000000/id.npy
+    <output>/analytics/part-0000-000000/analytics_type.npy
+    ...
+
+The files are written with the standard library (array + a hand-built .npy
+header), so exporting needs no NumPy on the web hosts, while readers can
+``np.load(path, mmap_mode='r')`` them or concatenate the parts in pandas
+without going through the ORM.
+
+- Integers are int64 and floats float64; missing values are -1 (ids) or NaN.
+- Datetimes are datetime64[us] in UTC.
+- Event and grade types and courses are dictionary-encoded: the column holds an
+  int32 code into ``manifest['dictionaries'][name]`` (-1 for none).
+  Entries are only ever appended, so codes stay valid across incremental
+  exports.
+
+Analytics events are never changed once written, so that table is exported
+incrementally: the manifest records the last exported id, the next run only
+reads newer rows (``id > last_id``), and the manifest is replaced after every
+part, so an interrupted export resumes from its last complete part.
+
+Quiz attempts and grades are updated in place (regrading, upserted scores),
+so they are exported in full on every run, as a new generation of parts
+that replaces the previous one in the manifest once it is complete.
+
+Parts are written under a temporary name and renamed, so readers following
+the manifest never see a partial part.
+"""
+import json
+import os
+import shutil
+import struct
+import sys
+from array import array
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from .models import Analytics, Grade, QuizAttempt
+
+MANIFEST_NAME = 'manifest.json'
+MANIFEST_FORMAT = 1
+
+# Column kinds: (array typecode, .npy dtype descriptor)
+COLUMN_KINDS = {
+    'int': ('q', '<i8'),
+    'float': ('d', '<f8'),
+    'datetime': ('q', '<M8[us]'),
+    'code': ('i', '<i4'),
+}
+
+# name -> (model, [(column, ORM path, kind or dictionary name)])
+TABLES = {
+    'analytics': (Analytics, [
+        ('id', 'id', 'int'),
+        ('date_recorded', 'date_recorded', 'datetime'),
+        ('analytics_type', 'analytics_type', 'analytics_type'),
+        ('course', 'course_id', 'course'),
+        ('user_id', 'user_id', 'int'),
+        ('value', 'value', 'float'),
+    ]),
+    'quiz_attempts': (QuizAttempt, [
+        ('id', 'id', 'int'),
+        ('completed_at', 'completed_at', 'datetime'),
+        ('course', 'quiz__lesson__module__course_id', 'course'),
+        ('quiz_id', 'quiz_id', 'int'),
+        ('student_id', 'student_id', 'int'),
+        ('attempt_number', 'attempt_number', 'int'),
+        ('score', 'score', 'float'),
+        ('time_taken', 'time_taken', 'int'),
+    ]),
+    'grades': (Grade, [
+        ('id', 'id', 'int'),
+        ('date_recorded', 'date_recorded', 'datetime'),
+        ('course', 'enrollment__course_id', 'course'),
+        ('student_id', 'enrollment__student_id', 'int'),
+        ('grade_type', 'grade_type', 'grade_type'),
+        ('assignment_id', 'assignment_id', 'int'),
+        ('quiz_id', 'quiz_id', 'int'),
+        ('score', 'score', 'float'),
+        ('max_points', 'max_points', 'float'),
+    ]),
+}
+
+# Tables whose rows are only ever inserted, and can be exported incrementally
+APPEND_ONLY_TABLES = {'analytics'}
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+
+
+def write_npy(path, descr, values):
+    """Write the 1-d ``array`` ``values`` as a version 1.0 .npy file with dtype ``descr``."""
+    header = f"{{'descr': '{descr}', 'fortran_order': False, 'shape': ({len(values)},), }}"
+    # The header is padded with spaces so the data starts on a 64-byte boundary
+    preamble = 10
+    header += ' ' * (-(preamble + len(header) + 1) % 64) + '\n'
+    if sys.byteorder != 'little':
+        values = array(values.typecode, values)
+        values.byteswap()
+    with open(path, 'wb') as npy:
+        npy.write(b'\x93NUMPY\x01\x00' + struct.pack('<H', len(header)) + header.encode('latin1'))
+        values.tofile(npy)
+
+
+def load_manifest(output_dir):
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {
+            'format': MANIFEST_FORMAT,
+            'tables': {},
+            'dictionaries': {'analytics_type': [], 'course': [], 'grade_type': []},
+        }
+    with open(path, encoding='utf-8') as manifest_file:
+        return json.load(manifest_file)
+
+
+def save_manifest(output_dir, manifest):
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    with open(path + '.tmp', 'w', encoding='utf-8') as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+def _encoder(kind, dictionaries):
+    """Return ``(typecode, descr, encode)`` for a column of ``kind``."""
+    if kind in COLUMN_KINDS:
+        typecode, descr = COLUMN_KINDS[kind]
+        if kind == 'float':
+            return typecode, descr, lambda value: float('nan') if value is None else value
+        if kind == 'datetime':
+            return typecode, descr, lambda value: -(2 ** 63) if value is None else (value - EPOCH) // MICROSECOND
+        return typecode, descr, lambda value: -1 if value is None else value
+
+    entries = dictionaries[kind]
+    codes = {entry: code for code, entry in enumerate(entries)}
+
+    def encode(value):
+        if value is None:
+            return -1
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(entries)
+            entries.append(value)
+        return code
+
+    typecode, descr = COLUMN_KINDS['code']
+    return typecode, descr, encode
+
+
+def export_table(output_dir, table, manifest, chunk_size=100_000):
+    """
+    Export ``table``, one part per ``chunk_size`` rows: the rows newer than its
+    manifest entry for append-only tables, all of them for the others. Yields
+    ``(part, rows)`` as each part is saved.
+    """
+    model, columns = TABLES[table]
+    incremental = table in APPEND_ONLY_TABLES
+    previous = manifest['tables'].get(table)
+    if incremental and previous:
+        state = previous
+    else:
+        state = {
+            'generation': previous.get('generation', 0) + 1 if previous else 0,
+            'last_id': 0,
+            'rows': 0,
+            'parts': [],
+            'columns': {name: COLUMN_KINDS.get(kind, COLUMN_KINDS['code'])[1] for name, _, kind in columns},
+        }
+        if incremental:
+            manifest['tables'][table] = state
+    encoders = [_encoder(kind, manifest['dictionaries']) for _, _, kind in columns]
+    rows = (
+        model.objects.filter(id__gt=state['last_id'])
+        .order_by('id')
+        .values_list(*(path for _, path, _ in columns))
+        .iterator(chunk_size=min(chunk_size, 10_000))
+    )
+    os.makedirs(os.path.join(output_dir, table), exist_ok=True)
+    descrs = [descr for _, descr, _ in encoders]
+
+    def save_part(values):
+        part = f'{table}/part-{state.get("generation", 0):04d}-{len(state["parts"]):06d}'
+        staging = os.path.join(output_dir, part + '.tmp')
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        for (name, _, _), descr, column in zip(columns, descrs, values):
+            write_npy(os.path.join(staging, name + '.npy'), descr, column)
+        # A part left behind by a run that stopped before saving the manifest
+        shutil.rmtree(os.path.join(output_dir, part), ignore_errors=True)
+        os.replace(staging, os.path.join(output_dir, part))
+        state['parts'].append(part)
+        state['rows'] += len(values[0])
+        state['last_id'] = values[0][-1]
+        if incremental:
+            save_manifest(output_dir, manifest)
+        return part
+
+    values = [array(typecode) for typecode, _, _ in encoders]
+    for row in rows:
+        for column, (_, _, encode), value in zip(values, encoders, row):
+            column.append(encode(value))
+        if len(values[0]) == chunk_size:
+            yield save_part(values), chunk_size
+            values = [array(typecode) for typecode, _, _ in encoders]
+    if values[0]:
+        yield save_part(values), len(values[0])
+
+    if not incremental:
+        manifest['tables'][table] = state
+        save_manifest(output_dir, manifest)
+        for part in previous['parts'] if previous else ():
+            shutil.rmtree(os.path.join(output_dir, part), ignore_errors=True)
@@ -1,3 +1,1407 @@
-from django.test import TestCase
+import ast
+import json
+import math
+import os
+import shutil
+import struct
+import tempfile
+import zipfile
+from array import array
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+import qrcode
+from asgiref.sync import async_to_sync, sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from channels.routing import URLRouter
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+from reportlab import rl_config
+
+from . import analytics, catalog_search, certificates, read_markers, recommendations, search, snapshots, views
+from .analytics import (
+    EventBuffer, analytics_summary, event_buffer, log_event, rebuild_rollups, replay_spilled_events,
+)
+from .catalog_search import get_catalog_backend
+from .models import (
+    AccessibilitySettings, Analytics, AnalyticsDailyRollup, AnswerOption, Assignment, Category, Certificate,
+    CertificateTemplate, Course, CourseGrade, CourseRecommendation, CustomUser, Enrollment, Forum, ForumReadState,
+    ForumTagCount, Grade, Lesson, Module, Notification, Post, Question, Quiz, QuizAttempt, Submission, Topic,
+    TopicTag, TopicTagging,
+)
+from .routing import websocket_urlpatterns
+from .upsert import upsert
+
+
+class GradebookAutosaveTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.instructor = CustomUser.objects.create_user('instructor', role='instructor')
+        self.student = CustomUser.objects.create_user('student', role='student')
+        self.course = Course.objects.create(title='Python', description='d', instructor=self.instructor)
+        lesson = Lesson.objects.create(module=Module.objects.create(course=self.course, title='m'), title='l')
+        self.assignment = Assignment.objects.create(lesson=lesson, title='a', description='d', due_date=timezone.now())
+        self.quiz = Quiz.objects.create(lesson=lesson, title='q')
+        self.enrollment = Enrollment.objects.create(student=self.student, course=self.course)
+        self.client.force_login(self.instructor)
+
+    def save_cells(self, *cells):
+        return self.client.post(
+            reverse('save_gradebook_cells', kwargs={'course_pk': self.course.pk}),
+            json.dumps({'cells': list(cells)}), content_type='application/json'
+        )
+
+    def cell(self, score, item=None):
+        item = item or self.quiz
+        return {'enrollment': self.enrollment.pk, 'type': item._meta.model_name, 'item': item.pk, 'score': score,
+                'max_points': 100}
+
+    def test_batch_updates_grades_and_totals(self):
+        response = self.save_cells(self.cell(80, self.assignment), self.cell(60))
+        self.assertEqual(response.json()['totals'], [{
+            'enrollment': self.enrollment.pk, 'final_grade': 70.0, 'letter_grade': 'C',
+        }])
+        self.save_cells(self.cell(100))
+        self.assertEqual(Grade.objects.count(), 2)
+        self.assertEqual(CourseGrade.objects.get().final_grade, 90.0)
+        response = self.client.get(reverse('instructor_gradebook', kwargs={'course_pk': self.course.pk}))
+        self.assertContains(response, 'value="80"')
+
+    def test_invalid_scores_are_rejected(self):
+        for score in ('nan', 'inf', -1, 101, 'abc'):
+            self.assertEqual(self.save_cells(self.cell(score)).status_code, 400, score)
+        self.assertFalse(Grade.objects.exists())
+
+    def test_empty_score_deletes_the_grade(self):
+        self.save_cells(self.cell(80, self.assignment), self.cell(60))
+        response = self.save_cells(self.cell('', self.assignment))
+        self.assertEqual(response.json()['totals'][0]['final_grade'], 60.0)
+        self.assertEqual(list(Grade.objects.values_list('quiz', flat=True)), [self.quiz.pk])
+        # Clearing an empty cell is a no-op
+        self.assertEqual(self.save_cells(self.cell(None, self.assignment)).status_code, 200)
+
+    def test_cells_of_other_courses_are_rejected(self):
+        other = Course.objects.create(title='Other', description='d', instructor=self.instructor)
+        enrollment = Enrollment.objects.create(student=self.student, course=other)
+        cell = dict(self.cell(50), enrollment=enrollment.pk)
+        self.assertEqual(self.save_cells(self.cell(50), cell).status_code, 400)
+        # The batch is all or nothing
+        self.assertFalse(Grade.objects.exists())
+
+    def test_only_the_course_instructor_can_save(self):
+        self.client.force_login(CustomUser.objects.create_user('other', role='instructor'))
+        self.assertEqual(self.save_cells(self.cell(50)).status_code, 403)
+
+    def test_one_notification_per_grading_session(self):
+        for score in (10, 20, 30):
+            self.save_cells(self.cell(score))
+        notifications = Notification.objects.filter(recipient=self.student, notification_type='grade_update')
+        self.assertEqual(notifications.count(), 1)
+
+
+class UpsertTests(TestCase):
+    def setUp(self):
+        self.instructor = CustomUser.objects.create_user('instructor', role='instructor')
+        self.student = CustomUser.objects.create_user('student', role='student')
+        self.course = Course.objects.create(title='Python', description='d', instructor=self.instructor)
+
+    def test_do_nothing_reports_whether_the_row_was_created(self):
+        enrollment = Enrollment(student=self.student, course=self.course)
+        self.assertEqual(upsert(enrollment, unique_fields=['student', 'course']), 1)
+        enrollment = Enrollment(student=self.student, course=self.course)
+        self.assertEqual(upsert(enrollment, unique_fields=['student', 'course']), 0)
+        self.assertEqual(Enrollment.objects.count(), 1)
+
+    def test_update_fields_overwrite_the_existing_row(self):
+        enrollment = Enrollment.objects.create(student=self.student, course=self.course)
+        lesson = Lesson.objects.create(module=Module.objects.create(course=self.course, title='m'), title='l')
+        assignment = Assignment.objects.create(lesson=lesson, title='a', description='d', due_date=timezone.now())
+        for score in (50, 70):
+            upsert(
+                Grade(enrollment=enrollment, assignment=assignment, score=score, max_points=100,
+                      grade_type='assignment'),
+                unique_fields=['enrollment', 'assignment'],
+                update_fields=['score', 'max_points']
+            )
+        self.assertEqual(list(Grade.objects.values_list('score', flat=True)), [70])
+
+    def test_toggle_fields_flip_and_return_the_new_value(self):
+        def toggle():
+            (enabled,) = upsert(
+                AccessibilitySettings(user=self.student, high_contrast_mode=True),
+                unique_fields=['user'],
+                toggle_fields=['high_contrast_mode'],
+                returning=['high_contrast_mode']
+            )
+            return bool(enabled)
+
+        self.assertEqual([toggle(), toggle(), toggle()], [True, False, True])
+        self.assertEqual(AccessibilitySettings.objects.count(), 1)
+
+    def test_increment_fields_with_unique_condition(self):
+        today = timezone.localdate()
+        for course in (None, None, self.course):
+            rollup = AnalyticsDailyRollup(course=course, analytics_type='quiz_attempt', day=today, count=2,
+                                          value_sum=1.5)
+            if course is None:
+                upsert(rollup, unique_fields=['analytics_type', 'day'], unique_condition='"course_id" IS NULL',
+                       increment_fields=['count', 'value_sum'])
+            else:
+                upsert(rollup, unique_fields=['course', 'analytics_type', 'day'],
+                       unique_condition='"course_id" IS NOT NULL', increment_fields=['count', 'value_sum'])
+
+        sitewide = AnalyticsDailyRollup.objects.get(course=None)
+        self.assertEqual((sitewide.count, sitewide.value_sum), (4, 3.0))
+        self.assertEqual(AnalyticsDailyRollup.objects.get(course=self.course).count, 2)
+
+    def test_returning_gives_the_stored_row(self):
+        enrollment = Enrollment.objects.create(student=self.student, course=self.course)
+        for certificate_id, full_name in (('FIRST', 'Jane'), ('SECOND', 'Jane Doe')):
+            (stored_id,) = upsert(
+                Certificate(enrollment=enrollment, certificate_id=certificate_id, full_name=full_name),
+                unique_fields=['enrollment'],
+                update_fields=['full_name'],
+                returning=['certificate_id']
+            )
+            self.assertEqual(stored_id, 'FIRST')
+        self.assertEqual(Certificate.objects.get().full_name, 'Jane Doe')
+
+    def test_auto_now_fields_are_refreshed(self):
+        AccessibilitySettings.objects.create(user=self.student)
+        AccessibilitySettings.objects.update(updated_at=timezone.now() - timedelta(days=1))
+        upsert(AccessibilitySettings(user=self.student, audio_volume_level=20), unique_fields=['user'],
+               update_fields=['audio_volume_level'])
+        settings = AccessibilitySettings.objects.get()
+        self.assertEqual(settings.audio_volume_level, 20)
+        self.assertGreater(settings.updated_at, timezone.now() - timedelta(minutes=1))
+
+    def test_signals_do_not_fire(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            upsert(Enrollment(student=self.student, course=self.course), unique_fields=['student', 'course'])
+        event_buffer.flush()
+        # A saved Enrollment would have been logged by its post_save receiver
+        self.assertFalse(Analytics.objects.filter(analytics_type='course_enrollment').exists())
+
+
+class ForumTopicStatsTests(TestCase):
+    def setUp(self):
+        self.instructor = CustomUser.objects.create_user('instructor', role='instructor')
+        self.student = CustomUser.objects.create_user('student', role='student')
+        self.course = Course.objects.create(title='Python', description='d', instructor=self.instructor)
+        Enrollment.objects.create(student=self.student, course=self.course)
+        self.forum = Forum.objects.create(course=self.course)
+        self.client.force_login(self.student)
+
+    def reply(self, topic, user=None):
+        self.client.force_login(user or self.student)
+        self.client.post(reverse('create_post', kwargs={'topic_pk': topic.pk}), {'content': 'reply'})
+        return Post.objects.filter(topic=topic).latest('position')
+
+    def test_replies_update_the_topic_stats(self):
+        topic = Topic.objects.create(forum=self.forum, title='t', content='c', author=self.instructor)
+        first = self.reply(topic)
+        second = self.reply(topic, self.instructor)
+        topic.refresh_from_db()
+        self.assertEqual((first.position, second.position), (1, 2))
+        self.assertEqual((topic.reply_count, topic.last_post_position, topic.last_post_author),
+                         (2, 2, self.instructor))
+
+    def test_deleting_the_last_reply_falls_back_to_the_previous_one(self):
+        topic = Topic.objects.create(forum=self.forum, title='t', content='c', author=self.instructor)
+        first = self.reply(topic)
+        self.reply(topic, self.instructor).delete()
+        topic.refresh_from_db()
+        self.assertEqual((topic.reply_count, topic.last_post_author, topic.last_post_at),
+                         (1, self.student, first.created_at))
+
+        first.delete()
+        topic.refresh_from_db()
+        self.assertEqual((topic.reply_count, topic.last_post_author, topic.last_post_at),
+                         (0, None, topic.created_at))
+        # Positions are never reused
+        self.assertEqual(self.reply(topic).position, 3)
+
+    def test_topic_list_follows_the_cursor(self):
+        topics = [Topic.objects.create(forum=self.forum, title=f'topic {i}', content='c', author=self.student)
+                  for i in range(7)]
+        Topic.objects.filter(pk=topics[0].pk).update(is_pinned=True)
+        self.reply(topics[2])
+
+        url = reverse('course_forum', kwargs={'course_pk': self.course.pk})
+        seen = []
+        cursor = None
+        with mock.patch.object(views, 'FORUM_TOPICS_PER_PAGE', 3):
+            while True:
+                response = self.client.get(url, {'after': cursor} if cursor else {})
+                seen += [topic.title for topic in response.context['topics']]
+                cursor = response.context['next_cursor']
+                if cursor is None:
+                    break
+        # Pinned first, then by latest activity
+        self.assertEqual(seen, ['topic 0', 'topic 2', 'topic 6', 'topic 5', 'topic 4', 'topic 3', 'topic 1'])
+
+    def test_malformed_cursor_shows_the_first_page(self):
+        Topic.objects.create(forum=self.forum, title='t', content='c', author=self.student)
+        response = self.client.get(reverse('course_forum', kwargs={'course_pk': self.course.pk}), {'after': 'x-y'})
+        self.assertEqual([topic.title for topic in response.context['topics']], ['t'])
+
+
+class TopicPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch.object(Topic, 'POSTS_PER_PAGE', 3)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        instructor = CustomUser.objects.create_user('instructor', role='instructor')
+        self.student = CustomUser.objects.create_user('student', role='student')
+        self.course = Course.objects.create(title='Python', description='d', instructor=instructor)
+        Enrollment.objects.create(student=self.student, course=self.course)
+        forum = Forum.objects.create(course=self.course)
+        self.topic = Topic.objects.create(forum=forum, title='t', content='c', author=self.student)
+        self.client.force_login(self.student)
+        for i in range(1, 8):
+            self.response = self.client.post(reverse('create_post', kwargs={'topic_pk': self.topic.pk}),
+                                             {'content': f'reply {i}'})
+
+    def page(self, number):
+        return self.client.get(reverse('topic_detail', kwargs={'topic_pk': self.topic.pk}), {'page': number})
+
+    def jump(self, **params):
+        return self.client.get(reverse('jump_to_post', kwargs={'topic_pk': self.topic.pk}), params).url
+
+    def test_pages_are_position_ranges(self):
+        self.assertTrue(self.response.url.endswith('?page=3#post-7'))
+        response = self.page(2)
+        self.assertEqual([post.position for post in response.context['posts']], [4, 5, 6])
+        self.assertEqual(response.context['num_pages'], 3)
+        self.assertEqual(self.page(99).context['page'], 3)
+
+    def test_edited_and_deleted_replies_refresh_the_cached_page(self):
+        self.assertContains(self.page(2), 'reply 5')
+        post = Post.objects.get(topic=self.topic, position=5)
+        post.content = 'edited'
+        post.save()
+        self.assertContains(self.page(2), 'edited')
+        post.delete()
+        self.assertNotContains(self.page(2), 'edited')
+
+    def test_jump_to_post(self):
+        self.assertTrue(self.jump(post=5).endswith('?page=2#post-5'))
+        self.assertTrue(self.jump().endswith('?page=3#post-7'))
+        Post.objects.get(topic=self.topic, position=5).delete()
+        # The next surviving reply
+        self.assertTrue(self.jump(post=5).endswith('?page=2#post-6'))
+
+    def test_jump_to_post_requires_enrollment(self):
+        self.client.force_login(CustomUser.objects.create_user('outsider', role='student'))
+        self.assertEqual(self.jump(post=5), reverse('course_forum', kwargs={'course_pk': self.course.pk}))
+
+
+class ForumSearchTests(TestCase):
+    def setUp(self):
+        instructor = CustomUser.objects.create_user('instructor', role='instructor')
+        self.student = CustomUser.objects.create_user('student', role='student')
+        self.course = Course.objects.create(title='Python', description='d', instructor=instructor)
+        Enrollment.objects.create(student=self.student, course=self.course)
+        self.forum = Forum.objects.create(course=self.course)
+        self.client.force_login(self.student)
+
+    def search(self, query):
+        return self.client.get(reverse('forum_search', kwargs={'course_pk': self.course.pk}), {'q': query})
+
+    def results(self, query):
+        return [(hit['topic'].title, hit['position']) for hit in self.search(query).context['results']]
+
+    def test_triggers_keep_the_index_in_sync(self):
+        topic = Topic.objects.create(forum=self.forum, title='Decorators question', content='How do closures work?',
+                                     author=self.student)
+        other = Topic.objects.create(forum=self.forum, title='Other', content='nothing', author=self.student)
+        Post.objects.create(topic=other, content='I think decorators wrap functions', author=self.student,
+                            position=1)
+        # Title matches rank above body matches; the prefix matches "decorators"
+        self.assertEqual(self.results('decorat'), [('Decorators question', 0), ('Other', 1)])
+
+        Post.objects.filter(topic=other).delete()
+        self.assertEqual(self.results('decorat'), [('Decorators question', 0)])
+        topic.title = 'Generators question'
+        topic.save()
+        self.assertEqual(self.results('decorat'), [])
+        self.assertEqual(self.results('generators closures'), [('Generators question', 0)])
+        topic.delete()
+        self.assertEqual(self.results('generators'), [])
+
+    def test_snippets_are_escaped(self):
+        topic = Topic.objects.create(forum=self.forum, title='t', content='x', author=self.student)
+        Post.objects.create(topic=topic, content='<b>decorators</b>', author=self.student, position=1)
+        self.assertContains(self.search('decorators'), '&lt;b&gt;<mark>decorators</mark>&lt;/b&gt;')
+
+    def test_other_forums_and_query_syntax_do_not_match(self):
+        other = Course.objects.create(title='Other', description='d', instructor=self.course.instructor)
+        Topic.objects.create(forum=Forum.objects.create(course=other), title='Decorators', content='x',
+                             author=self.student)
+        self.assertEqual(self.results('decorators'), [])
+        self.assertEqual(self.results('"*" OR NEAR('), [])
+
+    def test_rebuild_command(self):
+        Topic.objects.create(forum=self.forum, title='t', content='closures', author=self.student)
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {search.FORUM_SEARCH_TABLE}')
+        self.assertEqual(self.results('closures'), [])
+        call_command('rebuild_forum_search', stdout=StringIO())
+        self.assertEqual(self.results('closures'), [('t', 0)])
+
+    def test_match_expression(self):
+        self.assertEqual(search.build_match_expression(3, 'foo-bar "baz'),
+                         'scope : "f3" AND {title body} : ("foo" "bar" "baz"*)')
+        self.assertIsNone(search.build_match_expression(3, '*()'))
+
+
+class TopicStreamTests(TransactionTestCase):
+    def setUp(self):
+        # Write the analytics events of these committed rows before the tables are flushed
+        self.addCleanup(event_buffer.flush)
+        self.instructor = CustomUser.objects.create_user('instructor', role='instructor')
+        self.student = CustomUser.objects.create_user('student', role='student')
+        course = Course.objects.create(title='Python', description='d', instructor=self.instructor)
+        Enrollment.objects.create(student=self.student, course=course)
+        self.topic = Topic.objects.create(forum=Forum.objects.create(course=course), title='t', content='c',
+                                          author=self.student)
+        self.application = URLRouter(websocket_urlpatterns)
+
+    async def connect(self, user):
+        communicator = ApplicationCommunicator(self.application, {
+            'type': 'websocket',
+            'path': f'/ws/topic/{self.topic.pk}/',
+            'user': user,
+            'headers': [],
+            'query_string': b'',
+            'subprotocols': [],
+        })
+        await communicator.send_input({'type': 'websocket.connect'})
+        return communicator, (await communicator.receive_output(timeout=3))['type']
+
+    async def disconnect(self, communicator):
+        await communicator.send_input({'type': 'websocket.disconnect', 'code': 1000})
+        await communicator.wait(timeout=3)
+
+    def test_viewers_receive_new_replies(self):
+        self.client.force_login(self.student)
+
+        async def watch():
+            communicator, event = await self.connect(self.student)
+            self.assertEqual(event, 'websocket.accept')
+            await sync_to_async(self.client.post)(reverse('create_post', kwargs={'topic_pk': self.topic.pk}),
+                                                  {'content': 'live reply'})
+            message = json.loads((await communicator.receive_output(timeout=3))['text'])
+            await self.disconnect(communicator)
+            return message
+
+        message = async_to_sync(watch)()
+        self.assertEqual((message['position'], message['page'], message['reply_count']), (1, 1, 1))
+        self.assertIn('live reply', message['html'])
+
+    def test_only_course_members_can_connect(self):
+        outsider = CustomUser.objects.create_user('outsider', role='student')
+        other_instructor = CustomUser.objects.create_user('other', role='instructor')
+
+        async def connect_all():
+            events = []
+            for user in (self.instructor, outsider, other_instructor, AnonymousUser()):
+                communicator, event = await self.connect(user)
+                events.append(event)
+                if event == 'websocket.accept':
+                    await self.disconnect(communicator)
+            return events
+
+        self.assertEqual(async_to_sync(connect_all)(),
+                         ['websocket.accept', 'websocket.close', 'websocket.close', 'websocket.close'])
+
+
+class ReadMarkerTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.instructor = CustomUser.objects.create_user('instructor', role='instructor')
+        self.student = CustomUser.objects.create_user('student', role='student')
+        self.course = Course.objects.create(title='Python', description='d', instructor=self.instructor)
+        Enrollment.objects.create(student=self.student, course=self.course)
+        self.forum = Forum.objects.create(course=self.course)
+        self.topic = Topic.objects.create(forum=self.forum, title='read', content='c', author=self.instructor)
+        self.reply(self.topic)
+        self.reply(self.topic)
+
+    def reply(self, topic):
+        self.client.force_login(self.instructor)
+        self.client.post(reverse('create_post', kwargs={'topic_pk': topic.pk}), {'content': 'reply'})
+        self.client.force_login(self.student)
+
+    def badges(self):
+        response = self.client.get(reverse('course_forum', kwargs={'course_pk': self.course.pk}))
+        return {topic.title: (topic.unread_count, topic.is_unvisited) for topic in response.context['topics']}
+
+    def test_unread_replies_and_unvisited_topics(self):
+        self.client.get(reverse('topic_detail', kwargs={'topic_pk': self.topic.pk}))
+        self.reply(self.topic)
+        new_topic = Topic.objects.create(forum=self.forum, title='new', content='c', author=self.instructor)
+        self.assertEqual(self.badges(), {'new': (0, True), 'read': (1, False)})
+        # Marks are collected in the cache until the flush interval has passed
+        self.assertFalse(ForumReadState.objects.exists())
+
+        self.client.get(reverse('topic_detail', kwargs={'topic_pk': new_topic.pk}))
+        self.assertEqual(self.badges(), {'new': (0, False), 'read': (1, False)})
+
+    def test_marks_are_flushed_to_the_read_state(self):
+        with mock.patch.object(read_markers, 'READ_MARK_FLUSH_SECONDS', 0):
+            self.client.get(reverse('topic_detail', kwargs={'topic_pk': self.topic.pk}))
+        state = ForumReadState.objects.get(user=self.student, forum=self.forum)
+        self.assertEqual(state.topic_marks, {str(self.topic.pk): 2})
+        self.reply(self.topic)
+        self.assertEqual(self.badges(), {'read': (1, False)})
+
+    def test_mark_forum_read(self):
+        self.client.get(reverse('topic_detail', kwargs={'topic_pk': self.topic.pk}))
+        self.reply(self.topic)
+        self.client.post(reverse('mark_forum_read', kwargs={'course_pk': self.course.pk}))
+        self.assertEqual(self.badges(), {'read': (0, False)})
+        self.assertEqual(ForumReadState.objects.get().topic_marks, {})
+
+    def test_marks_of_quiet_topics_are_pruned(self):
+        quiet = Topic.objects.create(forum=self.forum, title='quiet', content='c', author=self.instructor,
+                                     last_post_at=timezone.now() - timedelta(days=2))
+        ForumReadState.objects.create(user=self.student, forum=self.forum,
+                                      read_all_before=timezone.now() - timedelta(days=1))
+        pending = {'marks': {str(quiet.pk): 0, str(self.topic.pk): 2}, 'since': 0}
+        with mock.patch.object(read_markers, 'MAX_TOPIC_MARKS', 1):
+            read_markers.flush_read_marks(self.student.pk, self.forum.pk, pending)
+        self.assertEqual(ForumReadState.objects.get().topic_marks, {str(self.topic.pk): 2})
+
+
+class TagFilterTests(TestCase):
+    def setUp(self):
+        instructor = CustomUser.objects.create_user('instructor', role='instructor')
+        self.course = Course.objects.create(title='Python', description='d', instructor=instructor)
+        self.forum = Forum.objects.create(course=self.course)
+        self.alpha = TopicTag.objects.create(name='alpha')
+        self.beta = TopicTag.objects.create(name='beta')
+        self.client.force_login(instructor)
+        create = reverse('create_topic', kwargs={'forum_pk': self.forum.pk})
+        self.client.post(create, {'title': 'both', 'content': 'x', 'tags': [self.alpha.pk, self.beta.pk]})
+        self.client.post(create, {'title': 'alpha only', 'content': 'x', 'tags': [self.alpha.pk]})
+        self.client.post(create, {'title': 'untagged', 'content': 'x'})
+
+    def titles(self, **params):
+        response = self.client.get(reverse('course_forum', kwargs={'course_pk': self.course.pk}), params)
+        return sorted(topic.title for topic in response.context['topics'])
+
+    def counts(self):
+        return {count.tag.name: count.topic_count for count in ForumTagCount.objects.filter(forum=self.forum)}
+
+    def test_match_any_or_all(self):
+        tags = [self.alpha.pk, self.beta.pk]
+        self.assertEqual(self.titles(tag=tags), ['alpha only', 'both'])
+        self.assertEqual(self.titles(tag=tags, match='all'), ['both'])
+        self.assertEqual(self.titles(tag=[self.beta.pk, 'x']), ['both'])
+        self.assertEqual(self.titles(), ['alpha only', 'both', 'untagged'])
+
+    def test_counts_follow_taggings(self):
+        self.assertEqual(self.counts(), {'alpha': 2, 'beta': 1})
+        Topic.objects.get(title='both').delete()
+        self.assertEqual(self.counts(), {'alpha': 1, 'beta': 0})
+        TopicTagging.objects.create(topic=Topic.objects.get(title='untagged'), tag=self.beta)
+        self.assertEqual(self.counts(), {'alpha': 1, 'beta': 1})
+
+
+class CatalogSearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.instructor = CustomUser.objects.create_user('ada', role='instructor', first_name='Ada',
+                                                         last_name='Lovelace')
+        self.data = Category.objects.create(name='Data')
+        self.web = Category.objects.create(name='Web')
+        self.python = Course.objects.create(title='Python Basics', description='intro', instructor=self.instructor,
+                                            category=self.data)
+        self.django = Course.objects.create(title='Django', description='web apps with python',
+                                            instructor=self.instructor, category=self.web)
+
+    def search(self, query, category=None):
+        return get_catalog_backend().search(query, category_id=category)
+
+    def test_title_matches_rank_first(self):
+        self.assertEqual(self.search('python'), [self.python.pk, self.django.pk])
+        self.assertEqual(self.search('python', category=self.web.pk), [self.django.pk])
+        self.assertEqual(sorted(self.search('lovelace')), sorted([self.python.pk, self.django.pk]))
+        self.assertEqual(self.search('"'), [])
+
+    def test_index_follows_lessons_categories_and_courses(self):
+        module = Module.objects.create(course=self.django, title='m')
+        lesson = Lesson.objects.create(module=module, title='Risotto technique')
+        self.assertEqual(self.search('risott'), [self.django.pk])
+        lesson.delete()
+        self.assertEqual(self.search('risotto'), [])
+
+        self.data.name = 'Analytics'
+        self.data.save()
+        self.assertEqual(self.search('analytics'), [self.python.pk])
+
+        self.django.is_active = False
+        self.django.save()
+        self.assertEqual(self.search('python'), [self.python.pk])
+        self.python.delete()
+        self.assertEqual(self.search('python'), [])
+
+    def test_course_list_pages_ranked_results(self):
+        response = self.client.get(reverse('course_list'), {'q': 'python', 'category': 'data'})
+        self.assertEqual([course.pk for course in response.context['courses']], [self.python.pk])
+
+    def test_rebuild_command(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {catalog_search.CATALOG_SEARCH_TABLE}')
+        call_command('rebuild_catalog_search', stdout=StringIO())
+        self.assertEqual(self.search('python'), [self.python.pk, self.django.pk])
+
+    def test_database_backend(self):
+        backend = catalog_search.DatabaseCatalogBackend()
+        self.assertEqual(sorted(backend.search('python')), sorted([self.python.pk, self.django.pk]))
+        self.assertEqual(backend.search('python', category_id=self.data.pk), [self.python.pk])
+
+
+class CourseListPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.instructor = CustomUser.objects.create_user('instructor', role='instructor')
+        self.category = Category.objects.create(name='Web')
+        now = timezone.now()
+        for i in range(30):
+            course = Course.objects.create(title=f'Course {i}', description='d', instructor=self.instructor,
+                                           category=self.category if i % 2 else None)
+            Course.objects.filter(pk=course.pk).update(created_at=now - timedelta(minutes=i))
+        self.client.force_login(self.instructor)
+
+    def titles(self, response):
+        return [course.title for course in response.context['courses']]
+
+    def test_offset_pages(self):
+        response = self.client.get(reverse('course_list'))
+        self.assertEqual(self.titles(response), [f'Course {i}' for i in range(12)])
+        self.assertEqual(response.context['page_obj'].paginator.num_pages, 3)
+        self.assertEqual(self.titles(self.client.get(reverse('course_list'), {'page': 3}))[0], 'Course 24')
+        response = self.client.get(reverse('course_list'), {'category': self.category.pk, 'per_page': 1000})
+        self.assertEqual(len(response.context['courses']), 15)
+
+    def test_count_is_cached_until_the_catalog_changes(self):
+        self.client.get(reverse('course_list'))
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('course_list'), {'page': 2})
+        self.assertFalse([query for query in queries if query['sql'].startswith('SELECT COUNT(*) AS "__count" FROM "core_course"')])
+
+        Course.objects.create(title='New', description='d', instructor=self.instructor)
+        response = self.client.get(reverse('course_list'), {'page': 2})
+        self.assertEqual(response.context['page_obj'].paginator.count, 31)
+
+    def test_deep_pages_continue_from_a_cursor(self):
+        with mock.patch.object(views, 'COURSE_OFFSET_PAGES', 2):
+            response = self.client.get(reverse('course_list'), {'page': 5})
+            self.assertEqual(response.context['page_obj'].number, 2)
+            response = self.client.get(reverse('course_list'), {'after': response.context['next_cursor']})
+        self.assertEqual(self.titles(response), [f'Course {i}' for i in range(24, 30)])
+        self.assertIsNone(response.context['next_cursor'])
+
+
+class AnonymousPageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.instructor = CustomUser.objects.create_user('instructor', password='pw', role='instructor')
+        self.web = Category.objects.create(name='Web')
+        self.data = Category.objects.create(name='Data')
+        self.course = Course.objects.create(title='Alpha', description='d', instructor=self.instructor,
+                                            category=self.web)
+        self.other = Course.objects.create(title='Beta', description='d', instructor=self.instructor,
+                                           category=self.data)
+        self.module = Module.objects.create(course=self.course, title='m')
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        return response, len(queries)
+
+    def test_repeat_visits_are_served_from_cache(self):
+        for url in [reverse('home'), reverse('course_list'), f"{reverse('course_list')}?category={self.web.pk}",
+                    reverse('course_detail', kwargs={'pk': self.course.pk})]:
+            first, _ = self.get(url)
+            second, num_queries = self.get(url)
+            self.assertEqual(first.status_code, 200)
+            self.assertEqual(num_queries, 0, url)
+            self.assertEqual(first.content, second.content)
+            self.assertNotIn(b'csrfmiddlewaretoken', first.content)
+
+    def test_lesson_change_invalidates_only_its_course(self):
+        course_url = reverse('course_detail', kwargs={'pk': self.course.pk})
+        other_url = reverse('course_detail', kwargs={'pk': self.other.pk})
+        self.get(course_url)
+        self.get(other_url)
+        Lesson.objects.create(module=self.module, title='Brand new lesson')
+        response, num_queries = self.get(course_url)
+        self.assertGreater(num_queries, 0)
+        self.assertContains(response, 'Brand new lesson')
+        self.assertEqual(self.get(other_url)[1], 0)
+
+    def test_course_change_invalidates_its_category_listings(self):
+        web_url = f"{reverse('course_list')}?category={self.web.pk}"
+        data_url = f"{reverse('course_list')}?category={self.data.pk}"
+        self.get(web_url)
+        self.get(data_url)
+        self.course.title = 'Alpha Two'
+        self.course.save()
+        self.assertEqual(self.get(data_url)[1], 0)
+        self.assertContains(self.get(web_url)[0], 'Alpha Two')
+
+        self.course.category = self.data
+        self.course.save()
+        self.assertContains(self.get(data_url)[0], 'Alpha Two')
+        self.assertNotContains(self.get(web_url)[0], 'Alpha Two')
+
+    def test_logged_in_users_bypass_the_cache(self):
+        self.get(reverse('course_list'))
+        self.client.login(username='instructor', password='pw')
+        response, num_queries = self.get(reverse('course_list'))
+        self.assertGreater(num_queries, 0)
+        self.assertContains(response, 'Signed in as instructor')
+
+
+class CategoryCountTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.instructor = CustomUser.objects.create_user('instructor', role='instructor')
+        self.forex = Category.objects.create(name='Forex Trading')
+        self.web = Category.objects.create(name='Web')
+
+    def counts(self):
+        return dict(Category.objects.values_list('name', 'course_count'))
+
+    def test_slugs_are_unique(self):
+        self.assertEqual(self.forex.slug, 'forex-trading')
+        self.assertEqual(Category.objects.create(name='Forex  trading!').slug, 'forex-trading-2')
+
+    def test_count_follows_active_courses(self):
+        course = Course.objects.create(title='A', description='d', instructor=self.instructor, category=self.forex)
+        draft = Course.objects.create(title='B', description='d', instructor=self.instructor, category=self.forex,
+                                      is_active=False)
+        self.assertEqual(self.counts()['Forex Trading'], 1)
+        draft.is_active = True
+        draft.save()
+        self.assertEqual(self.counts()['Forex Trading'], 2)
+        draft.category = self.web
+        draft.save()
+        self.assertEqual((self.counts()['Forex Trading'], self.counts()['Web']), (1, 1))
+        draft.title = 'Renamed'
+        draft.save()
+        self.assertEqual(self.counts()['Web'], 1)
+        course.delete()
+        self.assertEqual(self.counts()['Forex Trading'], 0)
+
+    def test_listing_resolves_slugs_without_aggregating(self):
+        self.client.force_login(self.instructor)
+        response = self.client.get(reverse('course_list'), {'category': 'forex-trading'})
+        self.assertEqual(response.context['selected_category'], self.forex.pk)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('course_list'))
+        self.assertFalse([query for query in queries
+                          if 'GROUP BY' in query['sql'] and 'core_category' in query['sql']])
+
+
+class TypeaheadTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        instructor = CustomUser.objects.create_user('ada', role='instructor', first_name='Ada', last_name='Lovelace')
+        web = Category.objects.create(name='Web Development')
+        Course.objects.create(title='Intro to Python Basics', description='d', instructor=instructor, category=web)
+        Course.objects.create(title='Python for Data', description='d', instructor=instructor)
+        self.draft = Course.objects.create(title='Café Culture', description='d', instructor=instructor,
+                                           is_active=False)
+
+    def titles(self, query):
+        response = self.client.get(reverse('course_typeahead'), {'q': query})
+        return [result['title'] for result in response.json()['results']]
+
+    def test_prefix_matches(self):
+        self.assertEqual(self.titles('pyth'), ['Python for Data', 'Intro to Python Basics'])
+        self.assertEqual(self.titles('python ba'), ['Intro to Python Basics'])
+        self.assertEqual(self.titles('lovel'), ['Intro to Python Basics', 'Python for Data'])
+        self.assertEqual(self.titles('web dev'), ['Intro to Python Basics'])
+        self.assertEqual(self.titles('cafe'), [])
+
+    def test_lookups_skip_the_database_until_the_catalog_changes(self):
+        self.titles('py')
+        with self.assertNumQueries(0):
+            self.titles('intro')
+            self.titles('py')
+        self.draft.is_active = True
+        self.draft.save()
+        self.assertEqual(self.titles('CAFÉ'), ['Café Culture'])
+
+
+class RecommendationTests(TestCase):
+    enrollments = [(1, 'a'), (1, 'b'), (2, 'a'), (2, 'b'), (3, 'a'), (3, 'c'), (4, 'c'), (5, 'b')]
+
+    def test_cosine_scores_best_first(self):
+        neighbours = dict(recommendations.course_neighbours(self.enrollments, top_n=5, min_common=1))
+        # a and b share students 1 and 2, and each has three students
+        self.assertEqual([course for course, score in neighbours['a']], ['b', 'c'])
+        self.assertAlmostEqual(neighbours['a'][0][1], 2 / 3)
+        self.assertAlmostEqual(neighbours['a'][1][1], 1 / (3 * 2) ** 0.5)
+        self.assertEqual(dict(neighbours['c']), {'a': neighbours['a'][1][1]})
+
+    def test_top_n_and_min_common(self):
+        neighbours = dict(recommendations.course_neighbours(self.enrollments, top_n=1, min_common=1))
+        self.assertEqual(neighbours['a'], [('b', 2 / 3)])
+        neighbours = dict(recommendations.course_neighbours(self.enrollments, top_n=5, min_common=2))
+        self.assertEqual(set(neighbours), {'a', 'b'})
+
+    def test_students_over_the_cap_keep_their_first_courses(self):
+        with mock.patch.object(recommendations, 'MAX_COURSES_PER_STUDENT', 2):
+            neighbours = dict(recommendations.course_neighbours(
+                [(1, 'a'), (1, 'b'), (1, 'c'), (2, 'a'), (2, 'c'), (3, 'a'), (3, 'c')], min_common=1))
+        # Student 1's enrollment in c no longer counts
+        self.assertEqual([course for course, score in neighbours['a']], ['c', 'b'])
+        self.assertAlmostEqual(dict(neighbours['a'])['c'], 2 / 6 ** 0.5)
+        self.assertAlmostEqual(dict(neighbours['a'])['b'], 1 / 3 ** 0.5)
+
+    def test_build_command_feeds_course_and_dashboard(self):
+        cache.clear()
+        instructor = CustomUser.objects.create_user('instructor', role='instructor')
+        courses = [Course.objects.create(title=f'C{i}', description='d', instructor=instructor) for i in range(3)]
+        students = [CustomUser.objects.create_user(f's{i}', role='student') for i in range(4)]
+        for student in students[:3]:
+            Enrollment.objects.create(student=student, course=courses[0])
+            Enrollment.objects.create(student=student, course=courses[1])
+        for student in students[:2]:
+            Enrollment.objects.create(student=student, course=courses[2])
+        Enrollment.objects.create(student=students[3], course=courses[0])
+
+        call_command('build_recommendations', stdout=StringIO())
+        stored = CourseRecommendation.objects.filter(course=courses[0]).order_by('rank')
+        self.assertEqual([rec.recommended.title for rec in stored], ['C1', 'C2'])
+
+        self.client.force_login(students[3])
+        response = self.client.get(reverse('course_detail', kwargs={'pk': courses[0].pk}))
+        self.assertEqual([course.title for course in response.context['also_taken']], ['C1', 'C2'])
+        response = self.client.get(reverse('student_dashboard'))
+        self.assertEqual([course.title for course in response.context['recommended_courses']], ['C1', 'C2'])
+
+
+class CertificateDownloadTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media = self.settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        cache.clear()
+        instructor = CustomUser.objects.create_user('instructor', role='instructor')
+        student = CustomUser.objects.create_user('student', role='student')
+        self.course = Course.objects.create(title='Python', description='d', instructor=instructor)
+        self.enrollment = Enrollment.objects.create(student=student, course=self.course)
+        self.certificate = Certificate.objects.create(enrollment=self.enrollment, certificate_id='ABC123',
+                                                      full_name='Jane Doe')
+        self.url = reverse('generate_certificate', kwargs={'enrollment_pk': self.enrollment.pk})
+        self.client.force_login(student)
+
+    def test_download_is_stored_and_revalidated(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+        self.certificate.refresh_from_db()
+        stored = self.certificate.pdf_file.name
+
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+        self.certificate.refresh_from_db()
+        self.assertEqual(self.certificate.pdf_file.name, stored)
+
+    def test_changed_inputs_render_again(self):
+        etag = self.client.get(self.url)['ETag']
+        self.certificate.refresh_from_db()
+        stored = self.certificate.pdf_file.name
+        storage = self.certificate.pdf_file.storage
+
+        self.certificate.full_name = 'Janet Doe'
+        self.certificate.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertFalse(storage.exists(stored))
+
+        template = self.course.certificate_template
+        template.title = 'Certificate of Excellence'
+        template.save()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+
+class CertificateZipTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media = self.settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        cache.clear()
+        self.instructor = CustomUser.objects.create_user('instructor', role='instructor')
+        self.course = Course.objects.create(title='Python', description='d', instructor=self.instructor)
+        for i in range(certificates.POOL_MIN_CERTIFICATES):
+            student = CustomUser.objects.create_user(f'student{i}', role='student')
+            enrollment = Enrollment.objects.create(student=student, course=self.course)
+            Certificate.objects.create(enrollment=enrollment, certificate_id=f'ID{i}', full_name=f'Student {i}')
+
+    def unzip(self, chunks):
+        return zipfile.ZipFile(BytesIO(b''.join(chunks)))
+
+    def test_course_download(self):
+        self.client.force_login(self.instructor)
+        url = reverse('download_course_certificates', kwargs={'course_pk': self.course.pk})
+        names = [f'ID{i}-student-{i}.pdf' for i in range(certificates.POOL_MIN_CERTIFICATES)]
+        # Rendered in-process here; the pool is covered below
+        with mock.patch.object(certificates, 'POOL_MIN_CERTIFICATES', 100):
+            archive = self.unzip(self.client.get(url).streaming_content)
+            self.assertEqual(sorted(archive.namelist()), names)
+            self.assertTrue(archive.read('ID0-student-0.pdf').startswith(b'%PDF'))
+            self.assertFalse(Certificate.objects.filter(pdf_hash='').exists())
+
+            # The second download reads the stored renderings
+            with mock.patch.object(certificates, 'render_certificate_pdf') as render:
+                again = self.unzip(self.client.get(url).streaming_content)
+            render.assert_not_called()
+        self.assertEqual(again.read('ID1-student-1.pdf'), archive.read('ID1-student-1.pdf'))
+
+    def test_stale_certificates_render_in_a_process_pool(self):
+        queryset = Certificate.objects.select_related('enrollment__course', 'enrollment__student').order_by('pk')
+        template = certificates.get_certificate_template(self.course)
+        archive = self.unzip(certificates.stream_certificates_zip(list(queryset), template, workers=2))
+        self.assertEqual(len(archive.namelist()), certificates.POOL_MIN_CERTIFICATES)
+        for certificate in queryset:
+            with certificate.pdf_file.open('rb') as pdf_file:
+                self.assertEqual(archive.read(certificates.certificate_zip_name(certificate)), pdf_file.read())
+
+
+def image_upload(color, size=(400, 200), name='image.png'):
+    output = BytesIO()
+    Image.new('RGBA', size, color).save(output, 'PNG')
+    return SimpleUploadedFile(name, output.getvalue())
+
+
+class CertificateLayerTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media = self.settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        cache.clear()
+        instructor = CustomUser.objects.create_user('instructor', role='instructor')
+        self.course = Course.objects.create(title='Python', description='d', instructor=instructor)
+        self.template = CertificateTemplate.objects.create(course=self.course, logo=image_upload((255, 0, 0, 255)))
+
+    def test_logo_layer_is_composed_once(self):
+        [(name, *placement)] = certificates.compile_template_layer(self.template)
+        self.assertEqual(tuple(placement), certificates.LOGO_BOX)
+        with default_storage.open(name) as layer, Image.open(layer) as image:
+            # 120 x 80 points at 300 dpi, the 2:1 logo centred on white
+            self.assertEqual(image.size, (500, 333))
+            red, green, _ = image.getpixel((250, 166))
+            self.assertTrue(red > 200 and green < 50)
+            self.assertEqual(image.getpixel((250, 5)), (255, 255, 255))
+
+        modified = default_storage.get_modified_time(name)
+        self.assertEqual(certificates.compile_template_layer(self.template)[0][0], name)
+        self.assertEqual(default_storage.get_modified_time(name), modified)
+
+    def test_background_flattens_everything_into_one_layer(self):
+        self.template.background_image = image_upload((0, 0, 255, 255), (1000, 800))
+        self.template.signature = image_upload((0, 0, 0, 255))
+        self.template.save()
+        [(name, *placement)] = certificates.compile_template_layer(self.template)
+        self.assertEqual(tuple(placement), (0, 0, *certificates.PAGE_SIZE))
+
+    def test_layers_are_embedded_as_binary_jpeg(self):
+        certificate = Certificate(enrollment=Enrollment(course=self.course), certificate_id='ABC123',
+                                  full_name='Jane Doe', issued_at=timezone.now())
+        use_a85 = rl_config.useA85
+        pdf = certificates.render_certificate_pdf(certificate, self.template)
+        self.assertEqual(rl_config.useA85, use_a85)
+        [(name, *placement)] = certificates.compile_template_layer(self.template)
+        with default_storage.open(name) as layer:
+            self.assertIn(layer.read(), pdf)
+        self.assertIn(b'/Filter [ /DCTDecode ]', pdf)
+
+
+class CertificateVerificationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        instructor = CustomUser.objects.create_user('instructor', role='instructor')
+        student = CustomUser.objects.create_user('student', role='student')
+        course = Course.objects.create(title='Python', description='d', instructor=instructor)
+        enrollment = Enrollment.objects.create(student=student, course=course)
+        self.certificate = Certificate.objects.create(enrollment=enrollment, certificate_id='ABC123',
+                                                      full_name='Jane Doe')
+        self.url = reverse('verify_certificate', kwargs={'certificate_id': 'ABC123'})
+
+    def test_valid_and_revoked(self):
+        self.assertContains(self.client.get(self.url), 'Valid Certificate')
+        with self.assertNumQueries(0):
+            self.assertContains(self.client.get(self.url), 'Jane Doe')
+        data = self.client.get(self.url, {'format': 'json'}).json()
+        self.assertEqual((data['status'], data['course']), ('valid', 'Python'))
+
+        self.certificate.is_active = False
+        self.certificate.save()
+        data = self.client.get(self.url, HTTP_ACCEPT='application/json').json()
+        self.assertEqual((data['status'], data['valid']), ('revoked', False))
+        self.assertContains(self.client.get(self.url), 'Revoked')
+
+    def test_unknown_ids_are_remembered(self):
+        url = reverse('verify_certificate', kwargs={'certificate_id': 'NOPE'})
+        self.assertEqual(self.client.get(url).status_code, 404)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 404)
+
+    def test_clients_revalidate_with_the_etag(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        etag = response['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.certificate.is_active = False
+        self.certificate.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'Revoked')
+
+    def test_qr_code_links_to_the_verification_page(self):
+        with self.settings(SITE_URL='https://lms.example.org/'):
+            self.assertEqual(certificates.certificate_verify_url(self.certificate),
+                             'https://lms.example.org/verify/ABC123/')
+
+
+class CertificateQRCodeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_runs_reproduce_the_qr_matrix(self):
+        payload = 'https://lms.example.org/verify/ABC123/'
+        modules, runs = certificates.qr_module_runs(payload)
+        qr = qrcode.QRCode(border=0)
+        qr.add_data(payload)
+        qr.make(fit=True)
+        matrix = qr.get_matrix()
+        self.assertEqual(modules, len(matrix))
+        drawn = [[False] * modules for _ in range(modules)]
+        for row, column, length in runs:
+            self.assertFalse(any(drawn[row][column:column + length]))
+            drawn[row][column:column + length] = [True] * length
+        self.assertEqual(drawn, matrix)
+
+    def test_layouts_are_cached_by_payload(self):
+        first = certificates.qr_module_runs('ABC123')
+        with mock.patch.object(qrcode, 'QRCode') as encoder:
+            self.assertEqual(certificates.qr_module_runs('ABC123'), first)
+        encoder.assert_not_called()
+
+    def test_code_is_drawn_as_vectors(self):
+        instructor = CustomUser.objects.create_user('instructor', role='instructor')
+        course = Course.objects.create(title='Python', description='d', instructor=instructor)
+        certificate = Certificate(enrollment=Enrollment(course=course), certificate_id='ABC123',
+                                  full_name='Jane Doe', issued_at=timezone.now())
+        pdf = certificates.render_certificate_pdf(certificate, CertificateTemplate(course=course))
+        self.assertNotIn(b'/Subtype /Image', pdf)
+        self.assertIn(certificates.qr_cache_key(certificates.certificate_verify_url(certificate)), cache)
+
+
+class CertificatePrerenderTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media = self.settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        cache.clear()
+        instructor = CustomUser.objects.create_user('instructor', role='instructor')
+        student = CustomUser.objects.create_user('student', role='student', first_name='Jane', last_name='Doe')
+        course = Course.objects.create(title='Python', description='d', instructor=instructor)
+        self.enrollment = Enrollment.objects.create(student=student, course=course)
+
+    def test_issued_certificate_is_rendered_after_commit(self):
+        with self.settings(CERTIFICATE_PRERENDER='core.certificates.prerender_certificate'):
+            with self.captureOnCommitCallbacks() as callbacks:
+                certificate_pk = certificates.issue_certificate(self.enrollment)
+            self.assertFalse(Certificate.objects.get(pk=certificate_pk).pdf_hash)
+            for callback in callbacks:
+                callback()
+        certificate = Certificate.objects.get(pk=certificate_pk)
+        self.assertEqual(certificate.full_name, 'Jane Doe')
+        self.assertTrue(certificate.pdf_hash)
+        with certificate.pdf_file.open('rb') as pdf_file:
+            self.assertTrue(pdf_file.read().startswith(b'%PDF'))
+
+        # Issuing again keeps the certificate and queues nothing
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.assertIsNone(certificates.issue_certificate(self.enrollment))
+        self.assertEqual(callbacks, [])
+
+    def test_sqlite_leaves_rendering_to_the_first_download(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            certificates.issue_certificate(self.enrollment)
+        self.assertEqual(callbacks, [])
+
+    def test_other_databases_render_on_the_worker_thread(self):
+        with mock.patch.object(connection, 'vendor', 'postgresql'), \
+                mock.patch.object(certificates, 'prerender_in_background') as prerender:
+            with self.captureOnCommitCallbacks(execute=True):
+                certificate_pk = certificates.issue_certificate(self.enrollment)
+        prerender.assert_called_once_with(certificate_pk)
+
+
+class CertificateTemplateImageTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media = self.settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.instructor = CustomUser.objects.create_user('instructor', role='instructor')
+        self.course = Course.objects.create(title='Python', description='d', instructor=self.instructor)
+
+    def upload(self, name, image, image_format, **options):
+        output = BytesIO()
+        image.save(output, image_format, **options)
+        return SimpleUploadedFile(name, output.getvalue())
+
+    def stored(self, field):
+        with field.open('rb'), Image.open(field) as image:
+            return image.format, image.size, image.mode
+
+    def test_uploads_are_shrunk_rotated_and_reencoded(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: rotated 90 degrees
+        logo = Image.new('RGBA', (2000, 2000), (0, 0, 0, 0))
+        logo.paste((255, 0, 0, 255), (500, 500, 1500, 1500))
+        template = CertificateTemplate.objects.create(
+            course=self.course,
+            background_image=self.upload('photo.jpeg', Image.new('RGB', (3000, 2000), 'navy'), 'JPEG', exif=exif),
+            logo=self.upload('logo.png', logo, 'PNG'),
+            signature=self.upload('signature.png', Image.new('RGB', (3000, 1000), 'white'), 'PNG'),
+        )
+        # Page and boxes at 300 dpi; the portrait photo fits the page height
+        self.assertEqual(self.stored(template.background_image), ('JPEG', (1700, 2550), 'RGB'))
+        self.assertEqual(self.stored(template.logo), ('PNG', (333, 333), 'RGBA'))
+        self.assertEqual(self.stored(template.signature), ('JPEG', (625, 208), 'RGB'))
+        self.assertTrue(template.signature.name.endswith('.jpg'))
+
+        # Stored files are left alone on later saves
+        name = template.background_image.name
+        template.title = 'Certificate of Excellence'
+        template.save()
+        self.assertEqual(CertificateTemplate.objects.get(pk=template.pk).background_image.name, name)
+
+    def test_template_form_upload(self):
+        self.client.force_login(self.instructor)
+        response = self.client.post(reverse('manage_certificate_template', kwargs={'course_pk': self.course.pk}), {
+            'title': 'Certificate', 'description': 'd', 'font_size': 14, 'text_color': '#000000', 'is_active': 'on',
+            'logo': self.upload('logo.png', Image.new('RGB', (1000, 1000), 'red'), 'PNG'),
+        })
+        self.assertEqual(response.status_code, 302)
+        template = CertificateTemplate.objects.get(course=self.course)
+        self.assertEqual(self.stored(template.logo), ('JPEG', (333, 333), 'RGB'))
+
+
+class AnalyticsRollupTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(event_buffer.flush)
+        instructor = CustomUser.objects.create_user('instructor', role='instructor')
+        self.course = Course.objects.create(title='Python', description='d', instructor=instructor)
+
+    def test_events_are_counted_in_rollups(self):
+        for _ in range(3):
+            log_event('course_enrollment', course=self.course, value=2)
+        log_event('user_engagement')
+        event_buffer.flush()
+
+        rollup = AnalyticsDailyRollup.objects.get(course=self.course)
+        self.assertEqual((rollup.count, rollup.value_sum), (3, 6.0))
+        self.assertEqual(AnalyticsDailyRollup.objects.get(course=None).count, 1)
+
+        old = Analytics.objects.create(analytics_type='course_enrollment', course=self.course)
+        Analytics.objects.filter(pk=old.pk).update(date_recorded=timezone.now() - timedelta(days=30))
+        self.assertEqual(rebuild_rollups(), 3)
+        totals, daily = analytics_summary([self.course.pk])
+        self.assertEqual(totals['course_enrollment'], 4)
+        self.assertEqual(sum(daily['course_enrollment'].values()), 3)
+
+    def test_closed_days_are_cached_until_they_leave_the_window(self):
+        for days_ago in (0, 10, 20):
+            AnalyticsDailyRollup.objects.create(
+                analytics_type='quiz_attempt', day=timezone.localdate() - timedelta(days=days_ago), count=1
+            )
+        totals, _ = analytics_summary(None)
+        self.assertEqual(totals['quiz_attempt'], 3)
+        with self.assertNumQueries(1):
+            totals, _ = analytics_summary(None)
+        self.assertEqual(totals['quiz_attempt'], 3)
+
+        # A week later today's row has closed: only that day is added to the cached total
+        later = timezone.localdate() + timedelta(days=7)
+        with mock.patch.object(analytics.timezone, 'localdate', return_value=later):
+            totals, daily = analytics_summary(None)
+        self.assertEqual((totals['quiz_attempt'], daily['quiz_attempt']), (3, {}))
+
+    def test_rebuild_invalidates_the_cached_totals(self):
+        AnalyticsDailyRollup.objects.create(
+            analytics_type='quiz_attempt', day=timezone.localdate() - timedelta(days=30), count=5
+        )
+        self.assertEqual(analytics_summary(None)[0]['quiz_attempt'], 5)
+        Analytics.objects.create(analytics_type='quiz_attempt')
+        rebuild_rollups()
+        self.assertEqual(analytics_summary(None)[0]['quiz_attempt'], 1)
+
+
+class EventBufferTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(event_buffer.flush)
+        instructor = CustomUser.objects.create_user('instructor', role='instructor')
+        self.student = CustomUser.objects.create_user('student', role='student')
+        self.course = Course.objects.create(title='Python', description='d', instructor=instructor)
+
+    def spill_dir(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path, ignore_errors=True)
+        return path
+
+    def test_events_are_written_in_one_batch(self):
+        buffer = EventBuffer(max_events=3, max_delay_ms=60_000)
+        for _ in range(3):
+            buffer.add(Analytics(analytics_type='quiz_attempt', course=self.course))
+        # Inside a transaction the flush waits for the end of the request
+        self.assertEqual((len(buffer), Analytics.objects.count()), (3, 0))
+        self.assertEqual(buffer.flush(), 3)
+        self.assertEqual(AnalyticsDailyRollup.objects.get(course=self.course).count, 3)
+        self.assertEqual(buffer.flush(), 0)
+
+    def test_request_end_flushes_the_shared_buffer(self):
+        log_event('forum_activity', course=self.course, user=self.student)
+        self.assertEqual(Analytics.objects.count(), 0)
+        self.client.force_login(self.student)
+        self.client.get(reverse('home'))
+        self.assertEqual((Analytics.objects.count(), len(event_buffer)), (1, 0))
+
+    def test_spill_files_are_unique_and_removed_once_written(self):
+        spill_dir = self.spill_dir()
+        buffer = EventBuffer(spill_dir=spill_dir)
+        buffer.add(Analytics(analytics_type='user_engagement'))
+        other = EventBuffer(spill_dir=spill_dir)
+        other.add(Analytics(analytics_type='user_engagement'))
+
+        names = os.listdir(spill_dir)
+        self.assertEqual(len(names), 2)
+        self.assertTrue(all(name.startswith(f'analytics-{os.getpid()}-') for name in names))
+        # Both files are locked by a live buffer, so replay leaves them alone
+        self.assertEqual(replay_spilled_events(spill_dir), (0, 0))
+        buffer.flush()
+        other.flush()
+        self.assertEqual(os.listdir(spill_dir), [])
+
+    def test_abandoned_spill_files_are_replayed(self):
+        spill_dir = self.spill_dir()
+        event = {'analytics_type': 'lesson_completion', 'course_id': self.course.pk, 'user_id': self.student.pk,
+                 'value': 1.0, 'metadata': {'lesson': 1}, 'date_recorded': timezone.now().isoformat()}
+        with open(os.path.join(spill_dir, f'analytics-{os.getpid()}-dead.jsonl'), 'w') as spill_file:
+            # The process died halfway through its last line
+            spill_file.write(json.dumps(event) + '\n' + json.dumps(event) + '\n{"analytics_type": "trunc')
+
+        self.assertEqual(replay_spilled_events(spill_dir), (1, 2))
+        self.assertEqual(Analytics.objects.filter(metadata__lesson=1).count(), 2)
+        self.assertEqual(AnalyticsDailyRollup.objects.get(course=self.course).count, 2)
+        self.assertEqual(os.listdir(spill_dir), [])
+
+    def test_failing_events_are_dropped_from_the_batch(self):
+        buffer = EventBuffer()
+        buffer.add(Analytics(analytics_type='user_engagement'))
+        buffer.add(Analytics(analytics_type='user_engagement', value=None))
+        with self.assertLogs('core.analytics', 'ERROR'):
+            self.assertEqual(buffer.flush(), 1)
+        self.assertEqual((len(buffer), Analytics.objects.count()), (0, 1))
+
+    def test_unwritable_batches_are_requeued_then_left_for_replay(self):
+        spill_dir = self.spill_dir()
+        buffer = EventBuffer(spill_dir=spill_dir)
+        buffer.add(Analytics(analytics_type='quiz_attempt'))
+        with mock.patch.object(analytics, 'write_events', side_effect=RuntimeError('down')), \
+                self.assertLogs('core.analytics', 'ERROR'):
+            for _ in range(analytics.MAX_FLUSH_ATTEMPTS - 1):
+                self.assertEqual(buffer.flush(), 0)
+                self.assertEqual((len(buffer), len(os.listdir(spill_dir))), (1, 1))
+            self.assertEqual(buffer.flush(), 0)
+        self.assertEqual(len(buffer), 0)
+        self.assertEqual(replay_spilled_events(spill_dir), (1, 1))
+
+    def test_full_queue_is_not_requeued(self):
+        buffer = EventBuffer(max_queued=2)
+        for _ in range(3):
+            buffer.add(Analytics(analytics_type='quiz_attempt'))
+        with mock.patch.object(analytics, 'write_events', side_effect=RuntimeError('down')), \
+                self.assertLogs('core.analytics', 'ERROR'):
+            buffer.flush()
+        self.assertEqual(len(buffer), 0)
+
+
+class AnalyticsSignalTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(event_buffer.flush)
+        self.instructor = CustomUser.objects.create_user('instructor', role='instructor')
+        self.student = CustomUser.objects.create_user('student', role='student')
+        self.course = Course.objects.create(title='Python', description='d', instructor=self.instructor)
+        module = Module.objects.create(course=self.course, title='m')
+        self.lesson = Lesson.objects.create(module=module, title='Lesson 1', order=1)
+        self.quiz = Quiz.objects.create(lesson=Lesson.objects.create(module=module, title='Lesson 2', order=2),
+                                        title='q', max_attempts=3)
+        self.assignment = Assignment.objects.create(lesson=self.lesson, title='a', description='d',
+                                                    due_date=timezone.now())
+        Enrollment.objects.create(student=self.student, course=self.course)
+        self.forum = Forum.objects.create(course=self.course)
+        self.client.force_login(self.student)
+
+    def events(self):
+        event_buffer.flush()
+        return sorted(Analytics.objects.values_list('analytics_type', flat=True))
+
+    def test_student_activity_is_logged_once_committed(self):
+        question = Question.objects.create(quiz=self.quiz, text='?', points=2)
+        correct = AnswerOption.objects.create(question=question, text='yes', is_correct=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(reverse('complete_lesson', kwargs={'pk': self.lesson.pk}))
+            self.client.get(reverse('complete_lesson', kwargs={'pk': self.lesson.pk}))
+            self.client.post(reverse('submit_quiz', kwargs={'quiz_pk': self.quiz.pk}),
+                             {f'question_{question.pk}': correct.pk})
+        self.assertEqual(self.events(), [
+            'course_completion', 'lesson_completion', 'lesson_completion', 'quiz_attempt',
+        ])
+        attempt = Analytics.objects.get(analytics_type='quiz_attempt')
+        self.assertEqual((attempt.course_id, attempt.value), (self.course.pk, 100.0))
+
+    def test_forum_and_enrollment_activity(self):
+        other = Course.objects.create(title='Other', description='d', instructor=self.instructor)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(reverse('enroll_course', kwargs={'pk': other.pk}))
+            self.client.get(reverse('enroll_course', kwargs={'pk': other.pk}))
+            topic = Topic.objects.create(forum=self.forum, title='t', content='x', author=self.student)
+            Post.objects.create(topic=topic, content='p', author=self.student, position=1)
+        self.assertEqual(self.events(), ['course_enrollment', 'forum_activity', 'forum_activity'])
+
+    def test_rolled_back_writes_log_nothing(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    Topic.objects.create(forum=self.forum, title='t', content='x', author=self.student)
+                    raise ValueError
+            except ValueError:
+                pass
+        self.assertEqual(self.events(), [])
+
+    def test_course_is_looked_up_in_one_query(self):
+        topic = Topic.objects.create(forum=self.forum, title='t', content='x', author=self.student)
+        submission = Submission(assignment=Assignment.objects.get(), student=self.student)
+        post = Post(topic=Topic.objects.get(), content='p', author=self.student, position=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            # The INSERT and the course lookup
+            with self.assertNumQueries(2):
+                submission.save()
+            with self.assertNumQueries(2):
+                post.save()
+        events = Analytics.objects.filter(course=self.course)
+        event_buffer.flush()
+        self.assertEqual(sorted(events.values_list('analytics_type', 'user_id')), [
+            ('assignment_submission', self.student.pk), ('forum_activity', self.student.pk),
+        ])
+        self.assertEqual(events.get(analytics_type='forum_activity').metadata, {'topic': topic.pk, 'post': post.pk})
+
+
+def read_npy(path):
+    """Parse a .npy file into ``(magic, data offset % 64, header, values)``."""
+    with open(path, 'rb') as npy:
+        raw = npy.read()
+    header_length = struct.unpack('<H', raw[8:10])[0]
+    header = ast.literal_eval(raw[10:10 + header_length].decode('latin1'))
+    typecode = {'<i8': 'q', '<f8': 'd', '<M8[us]': 'q', '<i4': 'i'}[header['descr']]
+    values = array(typecode)
+    values.frombytes(raw[10 + header_length:])
+    return raw[:8], (10 + header_length) % 64, header, list(values)
+
+
+class SnapshotTests(TestCase):
+    def setUp(self):
+        instructor = CustomUser.objects.create_user('instructor', role='instructor')
+        self.student = CustomUser.objects.create_user('student', role='student')
+        self.course = Course.objects.create(title='Python', description='d', instructor=instructor)
+        lesson = Lesson.objects.create(module=Module.objects.create(course=self.course, title='m'), title='l')
+        self.quiz = Quiz.objects.create(lesson=lesson, title='q')
+        self.enrollment = Enrollment.objects.create(student=self.student, course=self.course)
+        self.output = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.output, ignore_errors=True)
+
+    def export(self, *args):
+        call_command('export_analytics_snapshot', self.output, *args, stdout=StringIO())
+        with open(os.path.join(self.output, snapshots.MANIFEST_NAME)) as manifest_file:
+            return json.load(manifest_file)
+
+    def column(self, part, name):
+        return read_npy(os.path.join(self.output, part, name + '.npy'))[3]
+
+    def test_write_npy(self):
+        path = os.path.join(self.output, 'values.npy')
+        snapshots.write_npy(path, '<f8', array('d', [1.5, float('nan')]))
+        magic, alignment, header, values = read_npy(path)
+        self.assertEqual((magic, alignment), (b'\x93NUMPY\x01\x00', 0))
+        self.assertEqual(header, {'descr': '<f8', 'fortran_order': False, 'shape': (2,)})
+        self.assertEqual(values[0], 1.5)
+        self.assertTrue(math.isnan(values[1]))
+
+    def test_analytics_are_exported_incrementally(self):
+        events = [
+            Analytics.objects.create(analytics_type=analytics_type, course=self.course if i % 2 else None, value=i)
+            for i, analytics_type in enumerate(['quiz_attempt', 'forum_activity', 'quiz_attempt'])
+        ]
+        manifest = self.export('--chunk-size', '2')
+        table = manifest['tables']['analytics']
+        self.assertEqual((table['rows'], table['last_id'], len(table['parts'])), (3, events[-1].pk, 2))
+        self.assertEqual(sum((self.column(part, 'course') for part in table['parts']), []), [-1, 0, -1])
+        types = sum((self.column(part, 'analytics_type') for part in table['parts']), [])
+        self.assertEqual([manifest['dictionaries']['analytics_type'][code] for code in types],
+                         [event.analytics_type for event in events])
+
+        newest = Analytics.objects.create(analytics_type='lesson_completion')
+        table = self.export('--table', 'analytics')['tables']['analytics']
+        self.assertEqual((table['rows'], table['last_id'], len(table['parts'])), (4, newest.pk, 3))
+
+    def test_mutable_tables_are_exported_in_full(self):
+        QuizAttempt.objects.create(quiz=self.quiz, student=self.student, attempt_number=1, score=50)
+        Grade.objects.create(enrollment=self.enrollment, quiz=self.quiz, score=5, max_points=10, grade_type='quiz')
+        first = self.export('--table', 'quiz_attempts', '--table', 'grades')['tables']['grades']
+        self.assertEqual(self.column(first['parts'][0], 'score'), [5.0])
+
+        Grade.objects.update(score=9)
+        manifest = self.export('--table', 'grades')
+        grades = manifest['tables']['grades']
+        self.assertEqual((grades['rows'], grades['generation']), (1, first['generation'] + 1))
+        self.assertEqual(self.column(grades['parts'][0], 'score'), [9.0])
+        self.assertFalse(os.path.exists(os.path.join(self.output, first['parts'][0])))
+        self.assertEqual(self.column(manifest['tables']['quiz_attempts']['parts'][0], 'time_taken'), [-1])
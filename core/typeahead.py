@@ -0,0 +1,123 @@
+"""
+In-process prefix index for catalog search-as-you-type.
+
+Each worker keeps a sorted array of normalised phrases over active course
+titles, instructor names and category names and answers prefix queries with
+bisect, so keystrokes never reach the database. Every word boundary of a
+phrase is indexed ("intro to python" is stored as "intro to python", "to
+python" and "python"), which lets multi-word prefixes such as "python ba"
+match with a single range lookup.
+
+The index is tagged with the versions of the ``courses`` and ``categories``
+cache namespaces (see core.caching) and rebuilt lazily on the first lookup
+after either is bumped.
+"""
+import heapq
+import threading
+import unicodedata
+from bisect import bisect_left
+
+from django.db.models import Count
+
+from .caching import namespace_versions
+
+# Match kinds, best first: the title starts with the query, a later word of
+# the title does, or the instructor / category does
+TITLE_START, TITLE_WORD, RELATED = 0, 1, 2
+
+# Prefix results remembered per index build; short prefixes repeat constantly
+MEMO_SIZE = 4096
+
+
+def normalize(text):
+    """Lowercase, strip accents and reduce punctuation to single spaces."""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch)).lower()
+    return ' '.join(''.join(ch if ch.isalnum() else ' ' for ch in text).split())
+
+
+def _suffixes(phrase):
+    words = phrase.split()
+    return [' '.join(words[i:]) for i in range(len(words))]
+
+
+class CatalogPrefixIndex:
+    def __init__(self, courses):
+        """``courses`` yields dicts with id, title, instructor, username, category and score."""
+        self.courses = {}
+        entries = []
+        for course in courses:
+            self.courses[course['id']] = course
+            for i, suffix in enumerate(_suffixes(normalize(course['title']))):
+                entries.append((suffix, TITLE_START if i == 0 else TITLE_WORD, course['id']))
+            for related in (course['instructor'], course['username'], course['category']):
+                for suffix in _suffixes(normalize(related)):
+                    entries.append((suffix, RELATED, course['id']))
+        entries.sort()
+        self.keys = [entry[0] for entry in entries]
+        self.refs = [(entry[1], entry[2]) for entry in entries]
+        self._memo = {}
+
+    def search(self, query, limit=8):
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        if prefix not in self._memo:
+            if len(self._memo) >= MEMO_SIZE:
+                self._memo.clear()
+            self._memo[prefix] = self._rank(prefix)
+        return [self.courses[course_id] for course_id in self._memo[prefix][:limit]]
+
+    def _rank(self, prefix, keep=20):
+        start = bisect_left(self.keys, prefix)
+        end = bisect_left(self.keys, prefix + '\uffff', start)
+        best = {}
+        for kind, course_id in self.refs[start:end]:
+            if kind < best.get(course_id, RELATED + 1):
+                best[course_id] = kind
+        return heapq.nsmallest(
+            keep, best,
+            key=lambda pk: (best[pk], -self.courses[pk]['score'], self.courses[pk]['title'])
+        )
+
+
+_index = None
+_index_version = None
+_lock = threading.Lock()
+
+
+def build_catalog_index():
+    from .models import Course
+
+    courses = (
+        Course.objects.filter(is_active=True)
+        .annotate(score=Count('enrollments'))
+        .values('id', 'title', 'score', 'instructor__first_name', 'instructor__last_name',
+                'instructor__username', 'category__name')
+    )
+    return CatalogPrefixIndex(
+        {
+            'id': row['id'],
+            'title': row['title'],
+            'instructor': (
+                f"{row['instructor__first_name']} {row['instructor__last_name']}".strip()
+                or row['instructor__username']
+            ),
+            'username': row['instructor__username'],
+            'category': row['category__name'] or '',
+            'score': row['score'],
+        }
+        for row in courses.iterator()
+    )
+
+
+def get_catalog_index():
+    """This process's index, rebuilt if the catalog changed since it was built."""
+    global _index, _index_version
+    version = namespace_versions('courses', 'categories')
+    if _index is None or _index_version != version:
+        with _lock:
+            if _index is None or _index_version != version:
+                _index = build_catalog_index()
+                _index_version = version
+    return _index
@@ -0,0 +1,90 @@
+"""
+Single-statement upserts (INSERT ... ON CONFLICT) for hot write paths.
+
+Django's get_or_create() needs a SELECT plus an INSERT (and a retry on
+IntegrityError when two requests race), and update_or_create() adds an
+UPDATE on top. The helper below builds one INSERT ... ON CONFLICT statement
+from an unsaved model instance instead, so each write is a single round trip
+that is safe to retry. Both SQLite (3.35+) and PostgreSQL support the syntax.
+"""
+from django.db import connections, router
+
+
+def upsert(instance, unique_fields, update_fields=(), toggle_fields=(), increment_fields=(), returning=(),
+           unique_condition=None):
+    """
+    Insert ``instance`` or, if a row with the same ``unique_fields`` already
+    exists, update that row in place.
+
+    - ``update_fields`` are overwritten with the values from ``instance``.
+    - ``toggle_fields`` (booleans) are flipped on the existing row instead.
+    - ``increment_fields`` have the value from ``instance`` added to them.
+    - ``auto_now`` fields are always refreshed when a row is updated.
+    - With no update, toggle or increment fields the conflict is ignored
+      (DO NOTHING).
+
+    When ``unique_fields`` are covered by a partial unique index (e.g. one
+    per nullable column state), pass its SQL predicate as
+    ``unique_condition`` so the database can match the index.
+
+    Returns the ``returning`` columns of the written row as a tuple (or None
+    when a DO NOTHING insert hit an existing row). Without ``returning`` it
+    returns the number of rows written, so for DO NOTHING inserts a truthy
+    result means the row was created.
+
+    The row does not go through Model.save(), so save() overrides and
+    pre_save/post_save signals do NOT run: receivers of the model never see
+    the write, and whatever they do (cache invalidation, analytics,
+    notifications) is up to the caller.
+    """
+    model = type(instance)
+    opts = model._meta
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    table = quote(opts.db_table)
+
+    columns = []
+    params = []
+    for field in opts.concrete_fields:
+        if field.primary_key and getattr(instance, field.attname) is None:
+            continue
+        value = field.pre_save(instance, add=True)
+        columns.append(quote(field.column))
+        params.append(field.get_db_prep_save(value, connection))
+
+    conflict_target = '(' + ', '.join(quote(opts.get_field(name).column) for name in unique_fields) + ')'
+    if unique_condition:
+        conflict_target += f' WHERE {unique_condition}'
+
+    assignments = []
+    for name in update_fields:
+        column = quote(opts.get_field(name).column)
+        assignments.append(f'{column} = excluded.{column}')
+    for name in toggle_fields:
+        column = quote(opts.get_field(name).column)
+        assignments.append(f'{column} = NOT {table}.{column}')
+    for name in increment_fields:
+        column = quote(opts.get_field(name).column)
+        assignments.append(f'{column} = {table}.{column} + excluded.{column}')
+    if assignments:
+        for field in opts.concrete_fields:
+            if getattr(field, 'auto_now', False) and field.name not in update_fields:
+                column = quote(field.column)
+                assignments.append(f'{column} = excluded.{column}')
+        action = 'DO UPDATE SET ' + ', '.join(assignments)
+    else:
+        action = 'DO NOTHING'
+
+    sql = (
+        f'INSERT INTO {table} ({", ".join(columns)}) '
+        f'VALUES ({", ".join(["%s"] * len(columns))}) '
+        f'ON CONFLICT {conflict_target} {action}'
+    )
+    if returning:
+        sql += ' RETURNING ' + ', '.join(quote(opts.get_field(name).column) for name in returning)
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        if returning:
+            return cursor.fetchone()
+        return cursor.rowcount
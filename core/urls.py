@@ -34,6 +34,7 @@ urlpatterns = [
 
     # --- Course Management ---
     path('courses/', views.course_list, name='course_list'),
+    path('courses/typeahead/', views.course_typeahead, name='course_typeahead'),
     path('course/create/', views.create_course, name='create_course'),
     path('course/<int:pk>/', views.course_detail, name='course_detail'),
     path('course/<int:pk>/enroll/', views.enroll_course, name='enroll_course'),
@@ -61,11 +62,15 @@ urlpatterns = [
     path('gradebook/student/', views.student_gradebook, name='student_gradebook'),
     path('gradebook/instructor/<int:course_pk>/', views.instructor_gradebook, name='instructor_gradebook'),
     path('grade/<int:enrollment_pk>/<str:grade_type>/<int:item_pk>/', views.record_grade, name='record_grade'),
+    path('gradebook/instructor/<int:course_pk>/cells/', views.save_gradebook_cells, name='save_gradebook_cells'),
 
     # --- Forums ---
     path('forum/<int:course_pk>/', views.course_forum, name='course_forum'),
+    path('forum/<int:course_pk>/search/', views.forum_search, name='forum_search'),
+    path('forum/<int:course_pk>/mark-read/', views.mark_forum_topics_read, name='mark_forum_read'),
     path('forum/<int:forum_pk>/topic/create/', views.create_topic, name='create_topic'),
     path('topic/<int:topic_pk>/', views.topic_detail, name='topic_detail'),
+    path('topic/<int:topic_pk>/jump/', views.jump_to_post, name='jump_to_post'),
     path('topic/<int:topic_pk>/post/create/', views.create_post, name='create_post'),
 
     # --- Certificates ---
@@ -76,8 +81,10 @@ urlpatterns = [
     path('certificates/student/', views.student_certificates, name='student_certificates'),
     path('certificates/instructor/', views.instructor_certificates, name='instructor_certificates'),
     path('certificates/instructor/<int:course_pk>/', views.instructor_certificates, name='instructor_certificates_detail'),
+    path('certificates/instructor/<int:course_pk>/download/', views.download_course_certificates, name='download_course_certificates'),
     path('certificate/template/<int:course_pk>/', views.manage_certificate_template, name='manage_certificate_template'),
     path('certificate/eligibility/<int:course_pk>/', views.check_certificate_eligibility, name='certificate_eligibility'),
+    path('verify/<slug:certificate_id>/', views.verify_certificate, name='verify_certificate'),
 
     # --- Notifications ---
     path('notifications/', views.notifications_list, name='notifications_list'),
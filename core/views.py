@@ -3,8 +3,10 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.auth import login
 from django.contrib import messages
 from django.contrib.auth.views import LoginView
-from django.urls import reverse_lazy
-from django.db.models import Q
+from django.urls import reverse, reverse_lazy
+from django.utils import timezone
+from django.db import transaction
+from django.db.models import Q, F
 from .forms import (
     CustomUserCreationForm, UserUpdateForm, ReportGenerationForm, DashboardWidgetForm, 
     AccessibilitySettingsForm, QuizForm, QuestionForm, AnswerOptionFormSet, LessonForm, 
@@ -14,22 +16,86 @@ from .forms import (
 from .models import (
     Course, Category, Module, Enrollment, Lesson, Quiz, Question, AnswerOption, 
     QuizAttempt, QuizAnswer, Assignment, Submission, Grade, CourseGrade, Forum, 
-    Topic, Post, TopicTag, Certificate, CertificateTemplate, Notification, 
-    NotificationPreference, Analytics, Report, DashboardWidget, AccessibilitySettings, 
+    Topic, Post, TopicTag, TopicTagging, CourseRecommendation, Certificate, CertificateTemplate, Notification, 
+    NotificationPreference, Analytics, AnalyticsDailyRollup, Report, DashboardWidget, AccessibilitySettings, 
     AccessibilityAudit, ScreenReaderContent, KeyboardShortcut, CustomUser
 )
-from reportlab.lib.pagesizes import letter, landscape
-from reportlab.pdfgen import canvas
-from reportlab.lib.units import inch
-from reportlab.lib.colors import Color, HexColor
-from reportlab.lib.utils import ImageReader
-import qrcode
-from io import BytesIO
+import hashlib
 import os
-from django.http import HttpResponse, JsonResponse
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.http import FileResponse, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.utils.text import slugify
+from django.template.loader import render_to_string
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
 from django.db.models import Count, Avg, Sum
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone as dt_timezone
+from .analytics import analytics_summary, log_event_on_commit
+from .caching import cache_anonymous_page, catalog_namespaces, catalog_page_namespaces, versioned_key
+from .catalog_search import get_catalog_backend
+from .certificates import (
+    get_certificate_pdf, get_certificate_template, invalidate_certificate_verification, issue_certificate,
+    stream_certificates_zip, verification_cache_key,
+)
+from .consumers import topic_group_name
+from .pagination import CachedCountPaginator
+from .read_markers import annotate_unread, mark_forum_read, mark_topic_read
+from .search import search_forum
+from .typeahead import get_catalog_index
+from .upsert import upsert
 import json
+import math
+from urllib.parse import urlencode
+
+# Maximum number of gradebook cells accepted by a single autosave request
+GRADEBOOK_BATCH_LIMIT = 200
+
+# Autosave notifies each student of grade changes at most once per this many
+# seconds, so a grading session sends one notification rather than one per batch
+GRADEBOOK_NOTIFY_INTERVAL = 60 * 60
+
+# Reference point for the integer timestamps used in keyset pagination cursors
+KEYSET_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+# How long verify_certificate keeps a result: saves and deletes of the
+# certificate clear it, so this only bounds course renames. Unknown IDs are
+# remembered briefly so guessing cannot hammer the database.
+CERTIFICATE_VERIFY_TIMEOUT = 60 * 60
+CERTIFICATE_VERIFY_MISS_TIMEOUT = 5 * 60
+
+# Co-enrollment recommendations shown on course pages and the student dashboard
+COURSE_RECOMMENDATIONS_SHOWN = 4
+
+# Courses per catalog page (default and the most a ?per_page= may ask for)
+COURSES_PER_PAGE = 12
+COURSES_PER_PAGE_MAX = 48
+
+# Numbered catalog pages; anything deeper is reached with keyset cursors
+COURSE_OFFSET_PAGES = 20
+
+# Suggestions returned by course_typeahead
+TYPEAHEAD_RESULTS = 8
+
+# Topics shown per page of a course forum
+FORUM_TOPICS_PER_PAGE = 25
+
+# Maximum number of tags a forum page can be filtered by at once
+FORUM_TAG_FILTER_LIMIT = 5
+
+# Maximum number of hits returned by forum_search
+FORUM_SEARCH_RESULTS = 50
+
+# URL mode -> AccessibilitySettings field flipped by toggle_accessibility_mode
+ACCESSIBILITY_TOGGLES = {
+    'high_contrast': 'high_contrast_mode',
+    'large_text': 'large_text_mode',
+    'reduced_motion': 'reduced_motion_mode',
+    'screen_reader': 'screen_reader_optimized',
+    'keyboard_nav': 'keyboard_navigation_enabled',
+}
 
 class CustomLoginView(LoginView):
     template_name = 'core/login.html'
@@ -46,6 +112,7 @@ class CustomLoginView(LoginView):
         else:
             return reverse_lazy('dashboard')  # fallback
 
+@cache_anonymous_page(lambda request: catalog_namespaces())
 def home(request):
     """Home page view"""
     recent_courses = Course.objects.filter(is_active=True)[:3]
@@ -63,6 +130,7 @@ def home(request):
     }
     return render(request, 'core/home.html', context)
 
+@cache_anonymous_page(catalog_page_namespaces)
 def course_list(request):
     """Public course listing page"""
     courses = Course.objects.filter(is_active=True).select_related('instructor', 'category')
@@ -74,14 +142,6 @@ def course_list(request):
             is_read=False
         ).count()
     
-    query = request.GET.get('q')
-    if query:
-        courses = courses.filter(
-            Q(title__icontains=query) | 
-            Q(description__icontains=query) |
-            Q(instructor__username__icontains=query)
-        )
-    
     # Handle both ID (number) and Name (text) for category
     category_input = request.GET.get('category')
     selected_category = None
@@ -89,20 +149,85 @@ def course_list(request):
     if category_input:
         if category_input.isdigit():
             # If input is a number (e.g. ?category=1), filter by ID
-            courses = courses.filter(category_id=category_input)
             selected_category = int(category_input)
         else:
-            # If input is text (e.g. ?category=forex), filter by Name
-            courses = courses.filter(category__name__icontains=category_input)
-            # Find the ID for the dropdown UI to show selected
-            cat_obj = Category.objects.filter(name__icontains=category_input).first()
-            if cat_obj:
-                selected_category = cat_obj.id
+            # If input is a slug (e.g. ?category=forex), resolve it through the
+            # unique slug index; older links may still carry part of a name
+            selected_category = (
+                Category.objects.filter(slug=category_input).values_list('id', flat=True).first() or
+                Category.objects.filter(name__icontains=category_input).values_list('id', flat=True).first() or 0
+            )
+    
+    query = request.GET.get('q', '').strip()
+    
+    per_page = COURSES_PER_PAGE
+    if request.GET.get('per_page', '').isdigit():
+        per_page = min(max(int(request.GET['per_page']), 1), COURSES_PER_PAGE_MAX)
+    
+    filter_params = []
+    if query:
+        filter_params.append(('q', query))
+    if selected_category is not None:
+        filter_params.append(('category', selected_category))
+    if per_page != COURSES_PER_PAGE:
+        filter_params.append(('per_page', per_page))
+    
+    after = request.GET.get('after')
+    page_obj = None
+    next_cursor = None
+    if query:
+        # Ranked full-text search; the category filter runs inside the index query.
+        # Only the current page of ids is loaded from the courses table.
+        ranked_ids = get_catalog_backend().search(query, category_id=selected_category)
+        page_obj = Paginator(ranked_ids, per_page).get_page(request.GET.get('page'))
+        found = courses.in_bulk(page_obj.object_list)
+        page_obj.object_list = [found[pk] for pk in page_obj.object_list if pk in found]
+    else:
+        if selected_category is not None:
+            courses = courses.filter(category_id=selected_category)
+        courses = courses.order_by('-created_at', '-id')
+        if after:
+            # Deep pages continue from a cursor instead of an ever-growing OFFSET
+            page_courses = list(courses.filter(course_keyset_filter(after))[:per_page + 1])
+            if len(page_courses) > per_page:
+                page_courses = page_courses[:per_page]
+                next_cursor = course_keyset_cursor(page_courses[-1])
+        else:
+            paginator = CachedCountPaginator(
+                courses, per_page,
+                cache_key=versioned_key(catalog_namespaces(selected_category), 'count')
+            )
+            try:
+                page_number = min(int(request.GET.get('page', 1)), COURSE_OFFSET_PAGES)
+            except ValueError:
+                page_number = 1
+            page_obj = paginator.get_page(page_number)
+            if page_obj.number == COURSE_OFFSET_PAGES and page_obj.has_next():
+                next_cursor = course_keyset_cursor(page_obj.object_list[len(page_obj.object_list) - 1])
+    
+    if page_obj is not None:
+        page_courses = list(page_obj.object_list)
+        page_range = page_obj.paginator.get_elided_page_range(page_obj.number, on_each_side=2, on_ends=1)
+    else:
+        page_range = []
+    
+    # Enrollment counts for just this page, in one grouped query
+    enrollment_counts = dict(
+        Enrollment.objects.filter(course__in=page_courses)
+        .values_list('course').annotate(total=Count('id'))
+    )
+    for course in page_courses:
+        course.enrollment_count = enrollment_counts.get(course.pk, 0)
     
     categories = Category.objects.all()
     
     context = {
-        'courses': courses,
+        'courses': page_courses,
+        'page_obj': page_obj,
+        'page_range': page_range,
+        'next_cursor': next_cursor,
+        'is_keyset_page': bool(after) and not query,
+        'filter_query': urlencode(filter_params),
         'categories': categories,
         'query': query,
         'selected_category': selected_category,
@@ -110,6 +235,27 @@ def course_list(request):
     }
     return render(request, 'core/course_list.html', context)
 
+def course_typeahead(request):
+    """Search-as-you-type suggestions for the catalog, served from memory"""
+    query = request.GET.get('q', '')[:100]
+    try:
+        limit = min(max(int(request.GET.get('limit', TYPEAHEAD_RESULTS)), 1), TYPEAHEAD_RESULTS)
+    except ValueError:
+        limit = TYPEAHEAD_RESULTS
+    
+    results = [
+        {
+            'id': course['id'],
+            'title': course['title'],
+            'instructor': course['instructor'],
+            'category': course['category'],
+            'url': reverse('course_detail', kwargs={'pk': course['id']}),
+        }
+        for course in get_catalog_index().search(query, limit=limit)
+    ]
+    return JsonResponse({'query': query, 'results': results})
+
+@cache_anonymous_page(lambda request, pk: (f'course:{pk}', 'categories'))
 def course_detail(request, pk):
     """Course detail page with modules and lessons"""
     course = get_object_or_404(Course, pk=pk, is_active=True)
@@ -134,9 +280,17 @@ def course_detail(request, pk):
     
     modules = course.modules.all().prefetch_related('lessons')
     
+    # Precomputed by the build_recommendations command
+    also_taken = [
+        recommendation.recommended for recommendation in
+        course.recommendations.filter(recommended__is_active=True)
+        .select_related('recommended__instructor')[:COURSE_RECOMMENDATIONS_SHOWN]
+    ]
+    
     context = {
         'course': course,
         'modules': modules,
+        'also_taken': also_taken,
         'is_enrolled': is_enrolled,
         'enrollment': enrollment,
         'completed_lessons': completed_lessons,
@@ -216,9 +370,22 @@ def student_dashboard(request):
     
     enrollments = Enrollment.objects.filter(student=request.user).select_related('course__instructor', 'course__category')
     
+    # Sum the stored neighbour scores of everything the student takes
+    enrolled_ids = [enrollment.course_id for enrollment in enrollments]
+    suggested = (
+        CourseRecommendation.objects.filter(course__in=enrolled_ids, recommended__is_active=True)
+        .exclude(recommended__in=enrolled_ids)
+        .values('recommended').annotate(total=Sum('score'))
+        .order_by('-total')[:COURSE_RECOMMENDATIONS_SHOWN]
+    )
+    suggested_ids = [row['recommended'] for row in suggested]
+    found = Course.objects.select_related('instructor').in_bulk(suggested_ids)
+    recommended_courses = [found[pk] for pk in suggested_ids if pk in found]
+    
     context = {
         'user_role': request.user.role,
         'enrollments': enrollments,
+        'recommended_courses': recommended_courses,
         'unread_notifications': unread_notifications
     }
     return render(request, 'core/student_dashboard.html', context)
@@ -281,13 +448,6 @@ def create_course(request):
                 notification_type='course_update',
                 related_course=course
             )
-            log_analytics_event(
-                'course_enrollment',
-                course=course,
-                user=course.instructor,
-                value=1.0,
-                metadata={'action': 'create_course'}
-            )
             return redirect('course_detail', pk=course.pk)
     else:
         form = CourseForm(user=request.user)
@@ -384,12 +544,14 @@ def enroll_course(request, pk):
         is_read=False
     ).count()
     
-    enrollment, created = Enrollment.objects.get_or_create(
-        student=request.user,
-        course=course
+    created = upsert(
+        Enrollment(student=request.user, course=course),
+        unique_fields=['student', 'course']
     )
     
     if created:
+        # The upsert skips post_save, where other enrollments are logged
+        log_event_on_commit('course_enrollment', course_id=course.pk, user_id=request.user.pk)
         messages.success(request, f'You have successfully enrolled in {course.title}!')
         create_notification(
             recipient=request.user,
@@ -505,6 +667,7 @@ def complete_lesson(request, pk):
     
     # Mark as completed
     enrollment.completed_lessons.add(lesson)
+    certificate_issued = issue_certificate_on_completion(enrollment)
     
     # Create notification (optional)
     create_notification(
@@ -538,6 +701,8 @@ def complete_lesson(request, pk):
         return redirect('lesson_detail', pk=next_lesson.pk)
     else:
         messages.success(request, f'Congratulations! You have completed the course "{course.title}"!')
+        if certificate_issued:
+            messages.info(request, "Your certificate has been issued. Find it under My Certificates.")
         return redirect('course_detail', pk=course.pk)
 
 @login_required
@@ -757,74 +922,76 @@ def submit_quiz(request, quiz_pk):
         return redirect('lesson_detail', pk=lesson.pk)
     
     if request.method == 'POST':
-        attempt_number = attempt_count + 1
-        quiz_attempt = QuizAttempt.objects.create(
-            quiz=quiz,
-            student=request.user,
-            attempt_number=attempt_number,
-            score=0
-        )
+        # Grade in one transaction: the attempt is only logged (see core.signals) once it has its score
+        with transaction.atomic():
+            attempt_number = attempt_count + 1
+            quiz_attempt = QuizAttempt.objects.create(
+                quiz=quiz,
+                student=request.user,
+                attempt_number=attempt_number,
+                score=0
+            )
         
-        score = 0
-        total_points = 0
+            score = 0
+            total_points = 0
         
-        for question in quiz.questions.all():
-            total_points += question.points
+            for question in quiz.questions.all():
+                total_points += question.points
             
-            if question.question_type == 'multiple_choice':
-                answer_id = request.POST.get(f'question_{question.id}')
-                if answer_id:
-                    try:
-                        answer_option = AnswerOption.objects.get(
-                            id=answer_id, 
-                            question=question
-                        )
-                        is_correct = answer_option.is_correct
-                        QuizAnswer.objects.create(
-                            quiz_attempt=quiz_attempt,
-                            question=question,
-                            selected_option=answer_option,
-                            is_correct=is_correct
-                        )
-                        if is_correct:
-                            score += question.points
-                    except AnswerOption.DoesNotExist:
-                        pass
-            elif question.question_type == 'true_false':
-                answer_id = request.POST.get(f'question_{question.id}')
-                if answer_id:
-                    try:
-                        answer_option = AnswerOption.objects.get(
-                            id=answer_id, 
-                            question=question
-                        )
-                        is_correct = answer_option.is_correct
+                if question.question_type == 'multiple_choice':
+                    answer_id = request.POST.get(f'question_{question.id}')
+                    if answer_id:
+                        try:
+                            answer_option = AnswerOption.objects.get(
+                                id=answer_id, 
+                                question=question
+                            )
+                            is_correct = answer_option.is_correct
+                            QuizAnswer.objects.create(
+                                quiz_attempt=quiz_attempt,
+                                question=question,
+                                selected_option=answer_option,
+                                is_correct=is_correct
+                            )
+                            if is_correct:
+                                score += question.points
+                        except AnswerOption.DoesNotExist:
+                            pass
+                elif question.question_type == 'true_false':
+                    answer_id = request.POST.get(f'question_{question.id}')
+                    if answer_id:
+                        try:
+                            answer_option = AnswerOption.objects.get(
+                                id=answer_id, 
+                                question=question
+                            )
+                            is_correct = answer_option.is_correct
+                            QuizAnswer.objects.create(
+                                quiz_attempt=quiz_attempt,
+                                question=question,
+                                selected_option=answer_option,
+                                is_correct=is_correct
+                            )
+                            if is_correct:
+                                score += question.points
+                        except AnswerOption.DoesNotExist:
+                            pass
+                elif question.question_type == 'short_answer':
+                    text_answer = request.POST.get(f'question_{question.id}')
+                    if text_answer:
+                        is_correct = False
                         QuizAnswer.objects.create(
                             quiz_attempt=quiz_attempt,
                             question=question,
-                            selected_option=answer_option,
+                            text_answer=text_answer,
                             is_correct=is_correct
                         )
-                        if is_correct:
-                            score += question.points
-                    except AnswerOption.DoesNotExist:
-                        pass
-            elif question.question_type == 'short_answer':
-                text_answer = request.POST.get(f'question_{question.id}')
-                if text_answer:
-                    is_correct = False
-                    QuizAnswer.objects.create(
-                        quiz_attempt=quiz_attempt,
-                        question=question,
-                        text_answer=text_answer,
-                        is_correct=is_correct
-                    )
         
-        if total_points > 0:
-            quiz_attempt.score = (score / total_points) * 100
-        else:
-            quiz_attempt.score = 0
-        quiz_attempt.save()
+            if total_points > 0:
+                quiz_attempt.score = (score / total_points) * 100
+            else:
+                quiz_attempt.score = 0
+            quiz_attempt.save()
         
         if quiz_attempt.score >= quiz.passing_score:
             messages.success(
@@ -832,6 +999,7 @@ def submit_quiz(request, quiz_pk):
                 f"Quiz completed! Score: {quiz_attempt.score:.1f}% (Passed!)"
             )
             enrollment.completed_lessons.add(lesson)
+            issue_certificate_on_completion(enrollment)
             create_notification(
                 recipient=request.user,
                 title=f"Quiz passed: {quiz.title}",
@@ -940,13 +1108,27 @@ def instructor_gradebook(request, course_pk):
         is_read=False
     ).count()
     
-    enrollments = Enrollment.objects.filter(course=course).select_related('student')
-    assignments = Assignment.objects.filter(lesson__module__course=course).prefetch_related('submissions')
+    enrollments = Enrollment.objects.filter(course=course).select_related('student', 'course_grade')
+    assignments = Assignment.objects.filter(lesson__module__course=course)
     quizzes = Quiz.objects.filter(lesson__module__course=course)
     
+    # Load every submission and grade for the course once and index them, so each
+    # cell of the matrix is a dictionary lookup instead of a query.
+    submissions = {
+        (s.assignment_id, s.student_id): s
+        for s in Submission.objects.filter(assignment__in=assignments)
+    }
+    grades = {}
+    for grade in Grade.objects.filter(enrollment__course=course).order_by('date_recorded'):
+        if grade.assignment_id:
+            grades[(grade.enrollment_id, 'assignment', grade.assignment_id)] = grade
+        elif grade.quiz_id:
+            grades[(grade.enrollment_id, 'quiz', grade.quiz_id)] = grade
+    
     gradebook_data = []
     for enrollment in enrollments:
         student_grades = {
+            'enrollment': enrollment,
             'student': enrollment.student,
             'assignments': [],
             'quizzes': [],
@@ -954,26 +1136,25 @@ def instructor_gradebook(request, course_pk):
         }
         
         for assignment in assignments:
-            try:
-                submission = assignment.submissions.get(student=enrollment.student)
-                student_grades['assignments'].append({
-                    'assignment': assignment,
-                    'submission': submission,
-                    'grade': submission.grade
-                })
-            except Submission.DoesNotExist:
-                student_grades['assignments'].append({
-                    'assignment': assignment,
-                    'submission': None,
-                    'grade': None
-                })
+            submission = submissions.get((assignment.pk, enrollment.student_id))
+            grade = grades.get((enrollment.pk, 'assignment', assignment.pk))
+            if grade is not None:
+                score = grade.score
+            elif submission is not None:
+                score = submission.grade
+            else:
+                score = None
+            student_grades['assignments'].append({
+                'assignment': assignment,
+                'submission': submission,
+                'grade': score
+            })
         
         for quiz in quizzes:
-            quiz_grades = enrollment.grades.filter(quiz=quiz).order_by('-date_recorded')
-            student_grades['quizzes'].extend([{
+            student_grades['quizzes'].append({
                 'quiz': quiz,
-                'grade': grade
-            } for grade in quiz_grades])
+                'grade': grades.get((enrollment.pk, 'quiz', quiz.pk))
+            })
         
         gradebook_data.append(student_grades)
     
@@ -1005,37 +1186,22 @@ def record_grade(request, enrollment_pk, grade_type, item_pk):
         
         if grade_type == 'assignment':
             assignment = get_object_or_404(Assignment, pk=item_pk)
-            grade, created = Grade.objects.get_or_create(
-                enrollment=enrollment,
-                assignment=assignment,
-                defaults={
-                    'score': score,
-                    'max_points': max_points,
-                    'grade_type': 'assignment'
-                }
+            upsert(
+                Grade(enrollment=enrollment, assignment=assignment, score=score,
+                      max_points=max_points, grade_type='assignment'),
+                unique_fields=['enrollment', 'assignment'],
+                update_fields=['score', 'max_points']
             )
-            if not created:
-                grade.score = score
-                grade.max_points = max_points
-                grade.save()
         elif grade_type == 'quiz':
             quiz = get_object_or_404(Quiz, pk=item_pk)
-            grade, created = Grade.objects.get_or_create(
-                enrollment=enrollment,
-                quiz=quiz,
-                defaults={
-                    'score': score,
-                    'max_points': max_points,
-                    'grade_type': 'quiz'
-                }
+            upsert(
+                Grade(enrollment=enrollment, quiz=quiz, score=score,
+                      max_points=max_points, grade_type='quiz'),
+                unique_fields=['enrollment', 'quiz'],
+                update_fields=['score', 'max_points']
             )
-            if not created:
-                grade.score = score
-                grade.max_points = max_points
-                grade.save()
         
-        course_grade, created = CourseGrade.objects.get_or_create(enrollment=enrollment)
-        course_grade.save() 
+        recalculate_course_grade(enrollment)
         
         if grade_type == 'assignment':
             create_notification(
@@ -1059,6 +1225,117 @@ def record_grade(request, enrollment_pk, grade_type, item_pk):
     redirect_url = request.POST.get('redirect_url', 'dashboard')
     return redirect(redirect_url)
 
+@login_required
+def save_gradebook_cells(request, course_pk):
+    """Apply a batch of edited gradebook cells in one transaction (JSON API); an empty score deletes the grade"""
+    course = get_object_or_404(Course, pk=course_pk)
+    
+    if request.user.role != 'instructor' or course.instructor != request.user:
+        return JsonResponse({'success': False, 'error': 'Access denied.'}, status=403)
+    
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'POST required.'}, status=405)
+    
+    try:
+        payload = json.loads(request.body or b'{}')
+        cells = payload.get('cells', [])
+    except (ValueError, AttributeError):
+        return JsonResponse({'success': False, 'error': 'Invalid JSON body.'}, status=400)
+    
+    if not isinstance(cells, list) or not cells:
+        return JsonResponse({'success': False, 'error': 'No cells to save.'}, status=400)
+    if len(cells) > GRADEBOOK_BATCH_LIMIT:
+        return JsonResponse({
+            'success': False,
+            'error': f'At most {GRADEBOOK_BATCH_LIMIT} cells can be saved per request.'
+        }, status=400)
+    
+    # Validate the whole batch before writing anything
+    parsed = []
+    try:
+        for cell in cells:
+            grade_type = cell['type']
+            if grade_type not in ('assignment', 'quiz'):
+                raise ValueError(grade_type)
+            score = cell['score']
+            parsed.append({
+                'enrollment': int(cell['enrollment']),
+                'type': grade_type,
+                'item': int(cell['item']),
+                'score': None if score in (None, '') else float(score),
+                'max_points': float(cell.get('max_points', 100)),
+            })
+    except (KeyError, TypeError, ValueError):
+        return JsonResponse({'success': False, 'error': 'Malformed cell in batch.'}, status=400)
+    
+    # float() also accepts "nan", "inf" and negative numbers
+    for cell in parsed:
+        if cell['score'] is None:
+            continue
+        if not (math.isfinite(cell['score']) and math.isfinite(cell['max_points'])
+                and cell['max_points'] > 0 and 0 <= cell['score'] <= cell['max_points']):
+            return JsonResponse({
+                'success': False,
+                'error': 'Scores must be between 0 and the maximum points.'
+            }, status=400)
+    
+    enrollments = Enrollment.objects.filter(
+        course=course,
+        pk__in={c['enrollment'] for c in parsed}
+    ).select_related('student').in_bulk()
+    assignments = Assignment.objects.filter(
+        lesson__module__course=course,
+        pk__in={c['item'] for c in parsed if c['type'] == 'assignment'}
+    ).in_bulk()
+    quizzes = Quiz.objects.filter(
+        lesson__module__course=course,
+        pk__in={c['item'] for c in parsed if c['type'] == 'quiz'}
+    ).in_bulk()
+    items = {'assignment': assignments, 'quiz': quizzes}
+    
+    for cell in parsed:
+        if cell['enrollment'] not in enrollments or cell['item'] not in items[cell['type']]:
+            return JsonResponse({'success': False, 'error': 'Cell does not belong to this course.'}, status=400)
+    
+    updated_cells = []
+    totals = []
+    with transaction.atomic():
+        for cell in parsed:
+            enrollment = enrollments[cell['enrollment']]
+            item = items[cell['type']][cell['item']]
+            if cell['score'] is None:
+                Grade.objects.filter(enrollment=enrollment, **{cell['type']: item}).delete()
+                updated_cells.append(cell)
+                continue
+            upsert(
+                Grade(enrollment=enrollment, score=cell['score'], max_points=cell['max_points'],
+                      grade_type=cell['type'], **{cell['type']: item}),
+                unique_fields=['enrollment', cell['type']],
+                update_fields=['score', 'max_points']
+            )
+            updated_cells.append(cell)
+        
+        for enrollment in {enrollments[c['enrollment']] for c in parsed}:
+            course_grade = recalculate_course_grade(enrollment)
+            totals.append({
+                'enrollment': enrollment.pk,
+                'final_grade': course_grade.final_grade,
+                'letter_grade': course_grade.letter_grade
+            })
+    
+    for enrollment in {enrollments[c['enrollment']] for c in parsed}:
+        # cache.add() only succeeds for the first batch of the interval
+        if cache.add(f'gradebook-notified:{enrollment.pk}', True, GRADEBOOK_NOTIFY_INTERVAL):
+            create_notification(
+                recipient=enrollment.student,
+                title=f"Grades updated for {course.title}",
+                message=f"Your instructor has updated your grades in '{course.title}'.",
+                notification_type='grade_update',
+                related_course=course
+            )
+    
+    return JsonResponse({'success': True, 'cells': updated_cells, 'totals': totals})
+
 @login_required
 def course_forum(request, course_pk):
     """Show course forum with topics"""
@@ -1081,16 +1358,90 @@ def course_forum(request, course_pk):
     
     forum, created = Forum.objects.get_or_create(course=course)
     
-    topics = forum.topics.all().prefetch_related('author', 'posts')
+    # Keyset pagination: each page continues after the last topic of the previous
+    # one, walking topic_forum_activity_idx instead of counting/offsetting rows.
+    topics = forum.topics.select_related('author', 'last_post_author').prefetch_related('tags__tag')
+    
+    # Tag filters: ?tag=<id> (repeatable) matches any of the tags, ?match=all every one
+    tag_ids = sorted({int(t) for t in request.GET.getlist('tag') if t.isdigit()})[:FORUM_TAG_FILTER_LIMIT]
+    match_all = request.GET.get('match') == 'all'
+    if tag_ids:
+        topics = topics.filter(pk__in=tagged_topic_ids(tag_ids, match_all))
+    
+    after = request.GET.get('after')
+    if after:
+        topics = topics.filter(topic_keyset_filter(after))
+    topics = list(topics[:FORUM_TOPICS_PER_PAGE + 1])
+    
+    next_cursor = None
+    if len(topics) > FORUM_TOPICS_PER_PAGE:
+        topics = topics[:FORUM_TOPICS_PER_PAGE]
+        next_cursor = topic_keyset_cursor(topics[-1])
+    annotate_unread(request.user, forum, topics)
+    
+    tag_counts = list(forum.tag_counts.filter(topic_count__gt=0).select_related('tag'))
+    for tag_count in tag_counts:
+        toggled = sorted(set(tag_ids) ^ {tag_count.tag_id})
+        tag_count.is_active = tag_count.tag_id in tag_ids
+        tag_count.toggle_query = tag_filter_query(toggled, match_all)
     
     context = {
         'course': course,
         'forum': forum,
         'topics': topics,
+        'tag_counts': tag_counts,
+        'tag_ids': tag_ids,
+        'match_all': match_all,
+        'filter_query': tag_filter_query(tag_ids, match_all),
+        'match_toggle_query': tag_filter_query(tag_ids, not match_all),
+        'next_cursor': next_cursor,
+        'is_first_page': not after,
         'unread_notifications': unread_notifications
     }
     return render(request, 'core/course_forum.html', context)
 
+@login_required
+def forum_search(request, course_pk):
+    """Full-text search over a course forum's topics and replies"""
+    course = get_object_or_404(Course, pk=course_pk)
+    
+    unread_notifications = Notification.objects.filter(
+        recipient=request.user, 
+        is_read=False
+    ).count()
+    
+    is_enrolled = False
+    if request.user.role == 'student':
+        is_enrolled = Enrollment.objects.filter(student=request.user, course=course).exists()
+    
+    is_instructor = (request.user.role == 'instructor' and course.instructor == request.user)
+    
+    if not (is_enrolled or is_instructor):
+        messages.error(request, "You must be enrolled in the course to access the forum.")
+        return redirect('course_detail', pk=course.pk)
+    
+    forum = get_object_or_404(Forum, course=course)
+    query = request.GET.get('q', '').strip()
+    results = search_forum(forum, query, limit=FORUM_SEARCH_RESULTS) if query else []
+    
+    context = {
+        'course': course,
+        'forum': forum,
+        'query': query,
+        'results': results,
+        'unread_notifications': unread_notifications
+    }
+    return render(request, 'core/forum_search.html', context)
+
+@login_required
+def mark_forum_topics_read(request, course_pk):
+    """Mark every topic in the course forum as read for the current user"""
+    forum = get_object_or_404(Forum, course__pk=course_pk)
+    if request.method == 'POST':
+        mark_forum_read(request.user, forum)
+        messages.success(request, "All topics marked as read!")
+    return redirect('course_forum', course_pk=course_pk)
+
 @login_required
 def create_topic(request, forum_pk):
     """Create a new topic in a forum"""
@@ -1123,6 +1474,9 @@ def create_topic(request, forum_pk):
                 content=content,
                 author=request.user
             )
+            for tag in TopicTag.objects.filter(pk__in=[t for t in request.POST.getlist('tags') if t.isdigit()]):
+                TopicTagging.objects.create(topic=topic, tag=tag)
+            mark_topic_read(request.user, topic, 0)
             messages.success(request, f'Topic "{topic.title}" created successfully!')
             create_notification(
                 recipient=course.instructor,
@@ -1138,6 +1492,7 @@ def create_topic(request, forum_pk):
     context = {
         'forum': forum,
         'course': course,
+        'tags': TopicTag.objects.order_by('name'),
         'unread_notifications': unread_notifications
     }
     return render(request, 'core/create_topic.html', context)
@@ -1164,17 +1519,68 @@ def topic_detail(request, topic_pk):
         messages.error(request, "You must be enrolled in the course to access this topic.")
         return redirect('course_forum', course_pk=course.pk)
     
-    posts = topic.posts.all().prefetch_related('author')
+    # Pages are fixed ranges of Post.position, read with an index range scan on
+    # (topic, position) rather than OFFSET. The queryset stays lazy so a cached
+    # page fragment never touches the posts table.
+    last_position = topic.posts.order_by('-position').values_list('position', flat=True).first() or 0
+    num_pages = Topic.page_for_position(last_position)
+    try:
+        page = min(max(int(request.GET.get('page', 1)), 1), num_pages)
+    except ValueError:
+        page = 1
+    first_position = (page - 1) * Topic.POSTS_PER_PAGE
+    posts = topic.posts.filter(
+        position__gt=first_position,
+        position__lte=first_position + Topic.POSTS_PER_PAGE
+    ).select_related('author')
+    
+    # The last page counts as read up to the topic's reply counter, so replies
+    # that were deleted afterwards cannot leave a phantom "1 new" behind
+    if page == num_pages:
+        mark_topic_read(request.user, topic, max(topic.last_post_position, last_position))
+    else:
+        mark_topic_read(request.user, topic, first_position + Topic.POSTS_PER_PAGE)
     
     context = {
         'topic': topic,
         'forum': forum,
         'course': course,
         'posts': posts,
+        'page': page,
+        'num_pages': num_pages,
         'unread_notifications': unread_notifications
     }
     return render(request, 'core/topic_detail.html', context)
 
+@login_required
+def jump_to_post(request, topic_pk):
+    """Redirect to the page holding reply ?post=N, or the latest reply"""
+    topic = get_object_or_404(Topic, pk=topic_pk)
+    course = topic.forum.course
+
+    is_enrolled = False
+    if request.user.role == 'student':
+        is_enrolled = Enrollment.objects.filter(student=request.user, course=course).exists()
+
+    is_instructor = (request.user.role == 'instructor' and course.instructor == request.user)
+
+    if not (is_enrolled or is_instructor):
+        messages.error(request, "You must be enrolled in the course to access this topic.")
+        return redirect('course_forum', course_pk=course.pk)
+
+    posts = topic.posts.order_by('-position')
+
+    target = request.GET.get('post', '')
+    if target.isdigit():
+        # First surviving post at or after N, seeking through (topic, position)
+        posts = topic.posts.filter(position__gte=int(target)).order_by('position')
+    position = posts.values_list('position', flat=True).first()
+    
+    url = reverse('topic_detail', kwargs={'topic_pk': topic.pk})
+    if position is None:
+        return redirect(url)
+    return redirect(f"{url}?page={Topic.page_for_position(position)}#post-{position}")
+
 @login_required
 def create_post(request, topic_pk):
     """Create a new post in a topic"""
@@ -1201,11 +1607,23 @@ def create_post(request, topic_pk):
         content = request.POST.get('content', '').strip()
         
         if content:
-            post = Post.objects.create(
-                topic=topic,
-                content=content,
-                author=request.user
-            )
+            with transaction.atomic():
+                # Bumping the topic's reply counter first locks its row, so
+                # concurrent replies get consecutive positions
+                Topic.objects.filter(pk=topic.pk).update(
+                    reply_count=F('reply_count') + 1,
+                    last_post_position=F('last_post_position') + 1,
+                    last_post_at=timezone.now(),
+                    last_post_author=request.user
+                )
+                topic.refresh_from_db(fields=['last_post_position'])
+                post = Post.objects.create(
+                    topic=topic,
+                    content=content,
+                    author=request.user,
+                    position=topic.last_post_position
+                )
+                transaction.on_commit(lambda: broadcast_new_post(post))
             messages.success(request, "Post created successfully!")
             if post.topic.author != request.user:
                 create_notification(
@@ -1222,7 +1640,8 @@ def create_post(request, topic_pk):
                 notification_type='forum_post',
                 related_course=course
             )
-            return redirect('topic_detail', topic_pk=topic.pk)
+            url = reverse('topic_detail', kwargs={'topic_pk': topic.pk})
+            return redirect(f"{url}?page={post.page_number}#post-{post.position}")
         else:
             messages.error(request, "Please enter content for your post.")
     
@@ -1251,10 +1670,22 @@ def claim_certificate(request, course_pk):
     if request.method == 'POST':
         form = CertificateClaimForm(request.POST)
         if form.is_valid():
-            # Create or Update Certificate
-            certificate, created = Certificate.objects.get_or_create(enrollment=enrollment)
-            certificate.full_name = form.cleaned_data['full_name']
-            certificate.save()
+            # Create or Update Certificate in one statement. A fresh row keeps the
+            # ID we generated here, so a different ID back means it already existed.
+            certificate = Certificate(
+                enrollment=enrollment,
+                certificate_id=Certificate.generate_certificate_id(),
+                full_name=form.cleaned_data['full_name']
+            )
+            (certificate_id,) = upsert(
+                certificate,
+                unique_fields=['enrollment'],
+                update_fields=['full_name'],
+                returning=['certificate_id']
+            )
+            created = certificate_id == certificate.certificate_id
+            # The upsert skips post_save, which would clear the cached verification page
+            invalidate_certificate_verification(certificate_id)
             
             if created:
                 messages.success(request, "Certificate generated successfully!")
@@ -1297,137 +1728,60 @@ def generate_certificate(request, enrollment_pk):
     except Certificate.DoesNotExist:
         return redirect('claim_certificate', course_pk=enrollment.course.pk)
 
-    # --- PDF GENERATION SETUP ---
-    buffer = BytesIO()
-    # Use Landscape
-    p = canvas.Canvas(buffer, pagesize=landscape(letter))
-    width, height = landscape(letter)
+    # Serve the stored rendering; it is only redrawn when its inputs change
+    template = get_certificate_template(enrollment.course)
+    get_certificate_pdf(certificate, template)
+    
+    etag = f'"{certificate.pdf_hash}"'
+    last_modified = int(certificate.pdf_rendered_at.timestamp())
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = FileResponse(certificate.pdf_file.open('rb'), content_type='application/pdf')
+        response['Content-Disposition'] = f'filename="certificate_{certificate.certificate_id}.pdf"'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    # Private (it carries a student's name), but revalidation is a cheap 304
+    response['Cache-Control'] = 'private, no-cache'
     
-    # 1. Load Template
-    try:
-        template = enrollment.course.certificate_template
-    except CertificateTemplate.DoesNotExist:
-        template = CertificateTemplate.objects.create(course=enrollment.course)
+    return response
 
-    # 2. Draw Background (If uploaded)
-    if template.background_image:
-        try:
-            # Draws the full template background (Logos, borders, fixed text)
-            p.drawImage(template.background_image.path, 0, 0, width=width, height=height)
-        except:
-            pass
-    
-    # --- IF NO BACKGROUND, DRAW FALLBACK BORDER ---
-    if not template.background_image:
-        # Outer Border (Blue)
-        p.setStrokeColor(HexColor('#0d6efd'))
-        p.setLineWidth(12)
-        p.rect(20, 20, width-40, height-40)
-        # Inner Border (Black)
-        p.setStrokeColor(HexColor('#000000'))
-        p.setLineWidth(2)
-        p.rect(35, 35, width-70, height-70)
-        # Fallback Title
-        p.setFillColor(HexColor('#000000'))
-        p.setFont("Helvetica-Bold", 24)
-        p.drawCentredString(width/2.0, height - 1.5*inch, "AUA TECHNOLOGIES LIMITED")
-
-    # --- 3. DRAW LOGO (Dynamic) ---
-    if template.logo:
-        try:
-            # Position: Top Left Area
-            p.drawImage(template.logo.path, 50, height - 120, width=120, height=80, mask='auto', preserveAspectRatio=True)
-        except:
-            pass
 
-    # --- 4. DRAW SIGNATURE (Dynamic) ---
-    if template.signature:
+def verify_certificate(request, certificate_id):
+    """Public verification page for a certificate ID, linked from its QR code"""
+    fmt = 'json' if (request.GET.get('format') == 'json'
+                     or 'application/json' in request.headers.get('Accept', '')) else 'html'
+    key = verification_cache_key(certificate_id, fmt)
+    cached = cache.get(key)
+    if cached is None:
         try:
-            # Position: Bottom Leftish/Center (Above CEO Name)
-            # Adjust coordinates (x=100, y=115) to fit nicely above the line
-            p.drawImage(template.signature.path, 100, 115, width=150, height=60, mask='auto', preserveAspectRatio=True)
-        except:
-            pass
-
-    # --- TEXT OVERLAYS ---
-    
-    # Certificate Title
-    p.setFillColor(HexColor('#0d6efd')) # Blue
-    p.setFont("Helvetica-Bold", 36)
-    p.drawCentredString(width/2.0, height - 2.5*inch, template.title)
-    
-    # Intro
-    p.setFillColor(HexColor('#555555')) # Dark Gray
-    p.setFont("Helvetica", 16)
-    p.drawCentredString(width/2.0, height - 3.2*inch, template.description)
-    
-    # STUDENT NAME (Centered & Bold)
-    p.setFillColor(HexColor('#000000')) # Black
-    p.setFont("Helvetica-Bold", 32)
-    p.drawCentredString(width/2.0, height - 4.2*inch, certificate.full_name) 
-    
-    # Underline Name
-    p.setLineWidth(1)
-    p.setStrokeColor(HexColor('#000000'))
-    p.line(width/2.0 - 200, height - 4.3*inch, width/2.0 + 200, height - 4.3*inch)
-
-    # Body Text
-    p.setFillColor(HexColor('#555555')) # Dark Gray
-    p.setFont("Helvetica", 14)
-    
-    date_str = certificate.issued_at.strftime('%d/%m/%Y')
-    
-    line1 = "\"In recognition of successfully completing the prescribed"
-    line2 = f"training module in {enrollment.course.title} and having met all"
-    line3 = f"requirements for the award, issued on {date_str}.\""
-    
-    text_start_y = height - 5.0*inch
-    p.drawCentredString(width/2.0, text_start_y, line1)
-    p.drawCentredString(width/2.0, text_start_y - 25, line2)
-    p.drawCentredString(width/2.0, text_start_y - 50, line3)
-    
-    # CEO Name and Title
-    p.setFillColor(HexColor('#000000'))
-    p.setFont("Helvetica-Bold", 14)
-    
-    # Signature Line
-    p.setLineWidth(1)
-    p.line(100, 115, 250, 115) 
-    
-    # Name & Title
-    p.drawString(100, 100, "MUSAB ABBAS SANI")
-    p.setFont("Helvetica", 12)
-    p.drawString(100, 85, "CEO")
-
-    # QR Code (Bottom Right)
-    qr_data = f"VERIFIED AUA CERTIFICATE\nName: {certificate.full_name}\nCourse: {enrollment.course.title}\nID: {certificate.certificate_id}\nDate: {date_str}\nSigned: MUSAB ABBAS SANI"
-    qr = qrcode.make(qr_data)
-    
-    qr_buffer = BytesIO()
-    qr.save(qr_buffer, format="PNG")
-    qr_buffer.seek(0)
-    
-    qr_image = ImageReader(qr_buffer)
-    p.drawImage(qr_image, width - 180, 50, width=100, height=100)
-    
-    p.setFont("Helvetica", 8)
-    p.drawRightString(width - 80, 40, f"ID: {certificate.certificate_id}")
-
-    p.showPage()
-    p.save()
-    
-    pdf = buffer.getvalue()
-    buffer.close()
-    
-    response = HttpResponse(pdf, content_type='application/pdf')
-    response['Content-Disposition'] = f'filename="certificate_{certificate.certificate_id}.pdf"'
-    
+            certificate = Certificate.objects.select_related('enrollment__course').get(certificate_id=certificate_id)
+        except Certificate.DoesNotExist:
+            certificate = None
+        data = certificate_verification_data(certificate_id, certificate)
+        if fmt == 'json':
+            content = json.dumps(data).encode()
+        else:
+            content = render_to_string('core/verify_certificate.html', {'result': data}).encode()
+        status = 200 if certificate else 404
+        cached = (content, status)
+        cache.set(key, cached, CERTIFICATE_VERIFY_TIMEOUT if certificate else CERTIFICATE_VERIFY_MISS_TIMEOUT)
+    
+    content, status = cached
+    # Clients revalidate on every visit, so a revocation shows at once; the
+    # server-side cache (cleared on every certificate change) keeps that cheap
+    etag = f'"{hashlib.sha1(content).hexdigest()}"'
+    response = get_conditional_response(request, etag=etag) if status == 200 else None
+    if response is None:
+        response = HttpResponse(
+            content,
+            status=status,
+            content_type='application/json' if fmt == 'json' else 'text/html; charset=utf-8'
+        )
+    response['ETag'] = etag
+    response['Cache-Control'] = 'no-cache'
+    response['Vary'] = 'Accept'
     return response
 
-# ... (Keep remaining views: student_certificates, instructor_certificates, etc.) ...
-# Note: The rest of the file remains as you provided, ensure you keep the other views below generate_certificate.
-# For brevity in this response, I'm confirming the generate_certificate logic is the key change.
-# Please ensure you copy the entire file content if you are replacing the whole file.
 
 @login_required
 def student_certificates(request):
@@ -1492,6 +1846,28 @@ def instructor_certificates(request, course_pk=None):
     }
     return render(request, 'core/instructor_certificates.html', context)
 
+@login_required
+def download_course_certificates(request, course_pk):
+    """Download every active certificate of a course as one ZIP archive"""
+    course = get_object_or_404(Course, pk=course_pk)
+    
+    if request.user.role != 'instructor' or course.instructor != request.user:
+        return redirect('dashboard')
+    
+    certificates = Certificate.objects.filter(
+        enrollment__course=course,
+        is_active=True
+    ).select_related('enrollment__course', 'enrollment__student').order_by('pk')
+    template = get_certificate_template(course)
+    
+    # Stale PDFs are rendered in a process pool while the archive streams
+    response = StreamingHttpResponse(
+        stream_certificates_zip(list(certificates), template),
+        content_type='application/zip'
+    )
+    response['Content-Disposition'] = f'attachment; filename="certificates_{slugify(course.title) or course.pk}.zip"'
+    return response
+
 @login_required
 def manage_certificate_template(request, course_pk):
     """Manage certificate template for a course"""
@@ -1581,15 +1957,20 @@ def notification_preference(request):
         is_read=False
     ).count()
     
-    preferences, created = NotificationPreference.objects.get_or_create(user=request.user)
+    # Reads never write: users without a stored row see the defaults
+    preferences = NotificationPreference.objects.filter(user=request.user).first() or NotificationPreference(user=request.user)
     
     if request.method == 'POST':
         from .forms import NotificationPreferenceForm
         form = NotificationPreferenceForm(request.POST, instance=preferences)
         if form.is_valid():
-            form.save()
+            upsert(
+                form.save(commit=False),
+                unique_fields=['user'],
+                update_fields=list(form.cleaned_data)
+            )
             messages.success(request, "Notification preferences updated successfully!")
-            return redirect('notification_preference')
+            return redirect('notification_preferences')
     else:
         from .forms import NotificationPreferenceForm
         form = NotificationPreferenceForm(instance=preferences)
@@ -1630,30 +2011,26 @@ def analytics_dashboard(request):
         is_read=False
     ).count()
     
+    # Read from the daily rollups: one grouped aggregate over the last week
+    # plus cached totals for the days before it
     if request.user.role == 'instructor':
-        courses = Course.objects.filter(instructor=request.user)
-        analytics_data = Analytics.objects.filter(course__in=courses)
+        course_ids = list(Course.objects.filter(instructor=request.user).values_list('pk', flat=True))
     else:
-        analytics_data = Analytics.objects.all()
+        course_ids = None
+    totals, daily = analytics_summary(course_ids, days=7)
     
-    total_enrollments = analytics_data.filter(analytics_type='course_enrollment').count()
-    total_completions = analytics_data.filter(analytics_type='course_completion').count()
-    total_lessons_completed = analytics_data.filter(analytics_type='lesson_completion').count()
-    total_quiz_attempts = analytics_data.filter(analytics_type='quiz_attempt').count()
-    
-    thirty_days_ago = datetime.now() - timedelta(days=30)
-    recent_analytics = analytics_data.filter(date_recorded__gte=thirty_days_ago)
+    total_enrollments = totals['course_enrollment']
+    total_completions = totals['course_completion']
+    total_lessons_completed = totals['lesson_completion']
+    total_quiz_attempts = totals['quiz_attempt']
     
+    today = timezone.localdate()
     enrollment_trend = []
     for i in range(7):
-        date = datetime.now() - timedelta(days=i)
-        count = recent_analytics.filter(
-            analytics_type='course_enrollment',
-            date_recorded__date=date.date()
-        ).count()
+        date = today - timedelta(days=i)
         enrollment_trend.append({
             'date': date.strftime('%Y-%m-%d'),
-            'count': count
+            'count': daily['course_enrollment'].get(date, 0)
         })
     
     context = {
@@ -1734,10 +2111,9 @@ def course_analytics(request, course_pk):
     elif request.user.role not in ['instructor', 'admin']:
         return redirect('dashboard')
     
-    analytics_data = Analytics.objects.filter(course=course)
-    
-    total_enrollments = analytics_data.filter(analytics_type='course_enrollment').count()
-    total_completions = analytics_data.filter(analytics_type='course_completion').count()
+    totals, _ = analytics_summary([course.pk], days=1)
+    total_enrollments = totals['course_enrollment']
+    total_completions = totals['course_completion']
     completion_rate = 0
     if total_enrollments > 0:
         completion_rate = (total_completions / total_enrollments) * 100
@@ -1846,13 +2222,18 @@ def accessibility_settings(request):
         is_read=False
     ).count()
     
-    settings, created = AccessibilitySettings.objects.get_or_create(user=request.user)
+    # Reads never write: users without a stored row see the defaults
+    settings = AccessibilitySettings.objects.filter(user=request.user).first() or AccessibilitySettings(user=request.user)
     
     if request.method == 'POST':
         from .forms import AccessibilitySettingsForm
         form = AccessibilitySettingsForm(request.POST, instance=settings)
         if form.is_valid():
-            form.save()
+            upsert(
+                form.save(commit=False),
+                unique_fields=['user'],
+                update_fields=list(form.cleaned_data)
+            )
             messages.success(request, "Accessibility settings updated successfully!")
             return redirect('accessibility_settings')
     else:
@@ -1869,23 +2250,25 @@ def accessibility_settings(request):
 @login_required
 def toggle_accessibility_mode(request, mode):
     """Toggle specific accessibility modes"""
-    settings, created = AccessibilitySettings.objects.get_or_create(user=request.user)
-    
-    if mode == 'high_contrast':
-        settings.high_contrast_mode = not settings.high_contrast_mode
-    elif mode == 'large_text':
-        settings.large_text_mode = not settings.large_text_mode
-    elif mode == 'reduced_motion':
-        settings.reduced_motion_mode = not settings.reduced_motion_mode
-    elif mode == 'screen_reader':
-        settings.screen_reader_optimized = not settings.screen_reader_optimized
-    elif mode == 'keyboard_nav':
-        settings.keyboard_navigation_enabled = not settings.keyboard_navigation_enabled
-    
-    settings.save()
+    field_name = ACCESSIBILITY_TOGGLES.get(mode)
+    if field_name is None:
+        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+            return JsonResponse({'success': False, 'error': 'Unknown mode.'}, status=400)
+        return redirect('accessibility_settings')
+    
+    # A new row starts with the flag already flipped; an existing row is
+    # flipped in place, so the toggle is a single atomic statement.
+    settings = AccessibilitySettings(user=request.user)
+    setattr(settings, field_name, not getattr(settings, field_name))
+    (enabled,) = upsert(
+        settings,
+        unique_fields=['user'],
+        toggle_fields=[field_name],
+        returning=[field_name]
+    )
     
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-        return JsonResponse({'success': True, 'enabled': getattr(settings, f'{mode.replace("-", "_")}_mode')})
+        return JsonResponse({'success': True, 'enabled': bool(enabled)})
     
     return redirect('accessibility_settings')
 
@@ -2037,18 +2420,108 @@ def create_notification(recipient, title, message, notification_type='general',
     )
     return notification
 
-def log_analytics_event(analytics_type, course=None, user=None, value=1.0, metadata=None):
-    """Helper function to log analytics events"""
-    if metadata is None:
-        metadata = {}
-    
-    Analytics.objects.create(
-        analytics_type=analytics_type,
-        course=course,
-        user=user,
-        value=value,
-        metadata=metadata
+def recalculate_course_grade(enrollment):
+    """Helper function to refresh an enrollment's final and letter grade"""
+    course_grade = CourseGrade(enrollment=enrollment)
+    course_grade.final_grade = course_grade.calculate_final_grade()
+    course_grade.letter_grade = course_grade.get_letter_grade(course_grade.final_grade)
+    upsert(course_grade, unique_fields=['enrollment'], update_fields=['final_grade', 'letter_grade'])
+    return course_grade
+
+def broadcast_new_post(post):
+    """Helper function to push a new reply to everyone viewing its topic"""
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    reply_count = Topic.objects.filter(pk=post.topic_id).values_list('reply_count', flat=True).first()
+    async_to_sync(channel_layer.group_send)(topic_group_name(post.topic_id), {
+        'type': 'post.created',
+        'position': post.position,
+        'page': post.page_number,
+        'reply_count': reply_count,
+        'html': render_to_string('core/post_card.html', {'post': post}),
+    })
+
+def topic_keyset_cursor(topic):
+    """Helper function to encode a topic's position in the forum ordering"""
+    micros = (topic.last_post_at - KEYSET_EPOCH) // timedelta(microseconds=1)
+    return f"{int(topic.is_pinned)}-{micros}-{topic.pk}"
+
+def course_keyset_cursor(course):
+    """Helper function to encode a course's position in the catalog order"""
+    micros = (course.created_at - KEYSET_EPOCH) // timedelta(microseconds=1)
+    return f"{micros}-{course.pk}"
+
+def course_keyset_filter(cursor):
+    """Helper function to select the courses that sort after a cursor"""
+    try:
+        micros, pk = (int(part) for part in cursor.split('-'))
+    except ValueError:
+        return Q()
+    created_at = KEYSET_EPOCH + timedelta(microseconds=micros)
+    return Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk)
+
+def topic_keyset_filter(cursor):
+    """Helper function to select the topics that sort after a cursor"""
+    try:
+        pinned, micros, pk = (int(part) for part in cursor.split('-'))
+    except ValueError:
+        return Q()
+    pinned = bool(pinned)
+    last_post_at = KEYSET_EPOCH + timedelta(microseconds=micros)
+    return (
+        Q(is_pinned__lt=pinned) |
+        Q(is_pinned=pinned, last_post_at__lt=last_post_at) |
+        Q(is_pinned=pinned, last_post_at=last_post_at, pk__lt=pk)
+    )
+
+def tagged_topic_ids(tag_ids, match_all=False):
+    """Helper function returning a subquery of topics carrying any (or all) of the tags"""
+    taggings = TopicTagging.objects.filter(tag__in=tag_ids)
+    if match_all and len(tag_ids) > 1:
+        taggings = taggings.values('topic').annotate(matched=Count('tag')).filter(matched=len(tag_ids))
+    return taggings.values('topic')
+
+def tag_filter_query(tag_ids, match_all=False):
+    """Helper function to build the course_forum query string for a tag filter"""
+    params = [('tag', tag_id) for tag_id in tag_ids]
+    if match_all and tag_ids:
+        params.append(('match', 'all'))
+    return urlencode(params)
+
+def issue_certificate_on_completion(enrollment):
+    """Helper function to issue a certificate once an enrollment reaches 100% progress"""
+    if enrollment.progress_percentage() < 100:
+        return False
+    certificate_pk = issue_certificate(enrollment)
+    if certificate_pk is None:
+        return False
+    # The first certificate marks the completion; the upsert skips post_save
+    log_event_on_commit(
+        'course_completion', course_id=enrollment.course_id, user_id=enrollment.student_id,
+        metadata={'certificate': certificate_pk}
     )
+    create_notification(
+        recipient=enrollment.student,
+        title=f"Certificate Earned: {enrollment.course.title}",
+        message=f"Congratulations! Your certificate for '{enrollment.course.title}' is ready to download.",
+        notification_type='certificate_earned',
+        related_course=enrollment.course
+    )
+    return True
+
+def certificate_verification_data(certificate_id, certificate):
+    """Helper function to describe a certificate (or its absence) for verify_certificate"""
+    if certificate is None:
+        return {'certificate_id': certificate_id, 'status': 'not_found', 'valid': False}
+    return {
+        'certificate_id': certificate.certificate_id,
+        'status': 'valid' if certificate.is_active else 'revoked',
+        'valid': certificate.is_active,
+        'name': certificate.full_name,
+        'course': certificate.enrollment.course.title,
+        'issued': certificate.issued_at.date().isoformat(),
+    }
 
 def generate_report_data(report_type, start_date, end_date):
     """Generate data for different report types"""
@@ -2109,16 +2582,18 @@ def generate_report_data(report_type, start_date, end_date):
         data['active_students'] = CustomUser.objects.filter(role='student').count()
         data['instructors'] = CustomUser.objects.filter(role='instructor').count()
         
-        analytics_in_range = Analytics.objects.filter(
-            date_recorded__date__gte=start_date,
-            date_recorded__date__lte=end_date
+        activity = dict(
+            AnalyticsDailyRollup.objects.filter(day__gte=start_date, day__lte=end_date)
+            .values('analytics_type')
+            .annotate(total=Sum('count'))
+            .values_list('analytics_type', 'total')
         )
         
         data['activity_summary'] = {
-            'enrollments': analytics_in_range.filter(analytics_type='course_enrollment').count(),
-            'completions': analytics_in_range.filter(analytics_type='course_completion').count(),
-            'lesson_completions': analytics_in_range.filter(analytics_type='lesson_completion').count(),
-            'quiz_attempts': analytics_in_range.filter(analytics_type='quiz_attempt').count(),
+            'enrollments': activity.get('course_enrollment', 0),
+            'completions': activity.get('course_completion', 0),
+            'lesson_completions': activity.get('lesson_completion', 0),
+            'quiz_attempts': activity.get('quiz_attempt', 0),
         }
     
     elif report_type == 'grade_distribution':
@@ -2164,4 +2639,5 @@ def logout_view(request):
     """Custom logout view"""
     from django.contrib.auth import logout
     logout(request)
-    return redirect('home')
\ No newline at end of file
+    return redirect('home')
+
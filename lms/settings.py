@@ -109,4 +109,29 @@ AUTH_USER_MODEL = 'core.CustomUser'
 # Login/Logout redirects
 LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'home'
-LOGOUT_REDIRECT_URL = 'home'
\ No newline at end of file
+LOGOUT_REDIRECT_URL = 'home'
+
+# --- SEARCH ---
+# Dotted path to a core.catalog_search.CatalogSearchBackend subclass. When
+# unset, SQLite uses the FTS5 backend and other databases plain icontains.
+CATALOG_SEARCH_BACKEND = None
+
+# --- CERTIFICATES ---
+# Public origin of the site; certificate QR codes link to SITE_URL/verify/<id>/
+SITE_URL = os.environ.get('SITE_URL', 'http://localhost:8000')
+# Dotted path to the callable given each newly issued certificate's pk after
+# commit, to render its PDF ahead of the first download:
+# core.certificates.prerender_in_background (a worker thread) or
+# core.certificates.prerender_certificate (in the request). When unset, SQLite
+# skips pre-rendering and other databases use the worker thread.
+CERTIFICATE_PRERENDER = None
+
+# --- ANALYTICS ---
+# Logged events are buffered per process and written in one batch when the
+# request finishes, or sooner once this many are waiting / the oldest is this old
+ANALYTICS_BUFFER_SIZE = 100
+ANALYTICS_BUFFER_MAX_DELAY_MS = 1000
+# Directory where buffered events are also appended until they are written,
+# so `manage.py replay_analytics_events` can recover them after a crash.
+# None keeps them in memory only.
+ANALYTICS_SPILL_DIR = os.environ.get('ANALYTICS_SPILL_DIR') or None